@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.1/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -37,6 +38,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'rest_framework.authtoken',
     'core',
@@ -45,11 +47,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.MetricsMiddleware',
+    'core.middleware.RequestTimingMiddleware',
+    'core.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.ProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -84,10 +90,159 @@ DATABASES = {
         'HOST':os.environ.get('DB_HOST'),
         'NAME': os.environ.get('DB_NAME'),
         'USER': os.environ.get('DB_USER'),
-        "PASSWORD": os.environ.get('DB_PASS')
+        "PASSWORD": os.environ.get('DB_PASS'),
+        # seconds each thread keeps its connection open, 0 closes it
+        # after every request
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
     }
 }
 
+# DB_POOL_SIZE > 0 shares up to that many connections between the threads
+# of each process instead; django then hands them back after each request
+if int(os.environ.get('DB_POOL_SIZE', 0)):
+    DATABASES['default'].update({
+        'ENGINE': 'core.db.backends.postgresql_pool',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MAX_SIZE': int(os.environ['DB_POOL_SIZE']),
+            # seconds before a connection is recycled
+            'MAX_AGE': int(os.environ.get('DB_POOL_MAX_AGE', 1800)),
+            # seconds idle before a connection is pinged on checkout
+            'PING_AFTER': int(os.environ.get('DB_POOL_PING_AFTER', 30)),
+            # seconds to wait for a free connection
+            'TIMEOUT': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+        },
+    })
+
+# read replicas as host=weight pairs, e.g. 'replica-a=2,replica-b';
+# safe requests read from them, see core.middleware.ReplicaMiddleware
+DATABASE_REPLICAS = {}
+for index, replica in enumerate(
+        filter(None, os.environ.get('DB_REPLICAS', '').split(',')), 1):
+    host, _, weight = replica.partition('=')
+    alias = f'replica{index}'
+    DATABASES[alias] = dict(
+        DATABASES['default'],
+        HOST=host,
+        # give up on an unreachable replica quickly and use the primary
+        OPTIONS={'connect_timeout': 2},
+        TEST={'NAME': f'test_{DATABASES["default"]["NAME"]}_{alias}'},
+    )
+    DATABASE_REPLICAS[alias] = int(weight or 1)
+
+DATABASE_ROUTERS = ['core.db.router.ReplicaRouter']
+# seconds a client reads from the primary after writing
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 10))
+# seconds before an unreachable replica is tried again
+REPLICA_RETRY_AFTER = int(os.environ.get('REPLICA_RETRY_AFTER', 30))
+
+# Cache
+# https://docs.djangoproject.com/en/2.1/topics/cache/
+
+# must be shared by every process serving the api, gunicorn turns the
+# list cache and replica reads off when its workers each have their own
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# seconds a list response stays cached, 0 to turn the cache off; writes
+# invalidate it sooner
+RECIPE_LIST_CACHE_TIMEOUT = int(
+    os.environ.get('RECIPE_LIST_CACHE_TIMEOUT', 300)
+)
+
+# largest batch accepted by the bulk recipe endpoint
+RECIPE_BULK_MAX_ITEMS = int(os.environ.get('RECIPE_BULK_MAX_ITEMS', 5000))
+
+# size and lifetime in seconds of the in-process token lookup cache
+TOKEN_AUTH_CACHE_SIZE = int(os.environ.get('TOKEN_AUTH_CACHE_SIZE', 10000))
+TOKEN_AUTH_CACHE_TTL = int(os.environ.get('TOKEN_AUTH_CACHE_TTL', 60))
+
+# lifetimes in seconds of signed access and refresh tokens
+SIGNED_TOKEN_ACCESS_TTL = int(os.environ.get('SIGNED_TOKEN_ACCESS_TTL', 300))
+SIGNED_TOKEN_REFRESH_TTL = int(
+    os.environ.get('SIGNED_TOKEN_REFRESH_TTL', 14 * 24 * 60 * 60)
+)
+
+# uploads larger than this are streamed to a temporary file in 64kB
+# chunks by django's upload handlers instead of being held in memory
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(
+    os.environ.get('FILE_UPLOAD_MAX_MEMORY_SIZE', 1024 * 1024)
+)
+FILE_UPLOAD_TEMP_DIR = os.environ.get('FILE_UPLOAD_TEMP_DIR')
+
+# limits checked against the header of an uploaded recipe image
+RECIPE_IMAGE_MAX_BYTES = int(
+    os.environ.get('RECIPE_IMAGE_MAX_BYTES', 20 * 1024 * 1024)
+)
+RECIPE_IMAGE_MAX_PIXELS = int(
+    os.environ.get('RECIPE_IMAGE_MAX_PIXELS', 40000000)
+)
+RECIPE_IMAGE_FORMATS = os.environ.get(
+    'RECIPE_IMAGE_FORMATS', 'JPEG,PNG,WEBP'
+).split(',')
+
+# hand media transfers to the front proxy: 'x-accel-redirect' for nginx,
+# 'x-sendfile' for apache or lighttpd, empty to stream from django
+MEDIA_ACCEL = os.environ.get('MEDIA_ACCEL', '')
+# internal nginx location aliased to MEDIA_ROOT
+MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+# browser cache lifetime of media not named after its content
+MEDIA_CACHE_MAX_AGE = int(os.environ.get('MEDIA_CACHE_MAX_AGE', 3600))
+
+# resized variants rendered for every uploaded recipe image
+RECIPE_THUMBNAIL_WIDTHS = [
+    int(width) for width in
+    os.environ.get('RECIPE_THUMBNAIL_WIDTHS', '160,320,640').split(',')
+]
+RECIPE_THUMBNAIL_FORMATS = os.environ.get(
+    'RECIPE_THUMBNAIL_FORMATS', 'webp,jpeg'
+).split(',')
+RECIPE_THUMBNAIL_QUALITY = int(os.environ.get('RECIPE_THUMBNAIL_QUALITY', 80))
+# worker processes rendering variants outside the request thread
+RECIPE_THUMBNAIL_WORKERS = int(os.environ.get('RECIPE_THUMBNAIL_WORKERS', 2))
+
+# requests over either budget are logged with their normalized sql
+REQUEST_QUERY_BUDGET = int(os.environ.get('REQUEST_QUERY_BUDGET', 30))
+REQUEST_TIME_BUDGET = int(os.environ.get('REQUEST_TIME_BUDGET', 500))
+# report db, view, render and total time to clients in a Server-Timing header
+REQUEST_SERVER_TIMING = bool(int(os.environ.get('REQUEST_SERVER_TIMING', 1)))
+
+# staff requests sent with X-Profile or ?profile= are profiled, at most one
+# per interval in each process; profiles are saved to PROFILE_DIR when set
+PROFILE_MIN_INTERVAL = int(os.environ.get('PROFILE_MIN_INTERVAL', 30))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '')
+
+# request metrics of every worker process are kept in files in METRICS_DIR
+# and served at /internal/metrics/ to requests with the bearer METRICS_TOKEN
+# or from METRICS_ALLOWED_IPS. no address is allowed by default: behind a
+# reverse proxy every request comes from the proxy, often 127.0.0.1, so
+# only list addresses that reach the server directly
+METRICS_DIR = os.environ.get(
+    'METRICS_DIR', os.path.join(tempfile.gettempdir(), 'recipe-api-metrics')
+)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = list(
+    filter(None, os.environ.get('METRICS_ALLOWED_IPS', '').split(','))
+)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'core.middleware': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.1/ref/settings/#auth-password-validators
@@ -1,11 +1,21 @@
 from django.contrib import admin
 from django.urls import path, include
 from django.urls.conf import include
-from django.conf.urls.static import static
 from django.conf import settings
 
+from core.views import metrics
+from recipe.views import RecipeMediaView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/users/', include('user.urls')),
     path('api/recipe/', include('recipe.urls')),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    # scraped by prometheus from inside the network only
+    path('internal/metrics/', metrics, name='metrics'),
+    # media is only sent to the owner of the recipe it belongs to
+    path(
+        settings.MEDIA_URL.lstrip('/') + '<path:name>',
+        RecipeMediaView.as_view(),
+        name='media'
+    ),
+]
@@ -0,0 +1,150 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.utils.translation import gettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, \
+    TokenAuthentication, get_authorization_header
+
+ACCESS_TOKEN_SALT = 'core.authentication.access'
+REFRESH_TOKEN_SALT = 'core.authentication.refresh'
+
+
+class TokenCache:
+    '''thread safe LRU mapping token keys to (user, token) with a TTL
+
+    the cache lives in one process, so a revocation seen by another worker
+    only reaches this one when the entry expires; keep the TTL short.
+    '''
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        '''return the cached (user, token) pair or None'''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        '''cache a (user, token) pair, evicting the least recent entry'''
+        user_id = value[0].pk
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            self._keys_by_user.setdefault(user_id, set()).add(key)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def discard(self, key):
+        '''forget a token'''
+        with self._lock:
+            self._remove(key)
+
+    def discard_user(self, user_id):
+        '''forget every token of a user'''
+        with self._lock:
+            for key in list(self._keys_by_user.get(user_id, ())):
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_id = entry[1][0].pk
+        keys = self._keys_by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[user_id]
+
+
+token_cache = TokenCache(
+    settings.TOKEN_AUTH_CACHE_SIZE, settings.TOKEN_AUTH_CACHE_TTL
+)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    '''token authentication that skips the token/user join on cache hits'''
+
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is None:
+            cached = super().authenticate_credentials(key)
+            token_cache.set(key, cached)
+        user, token = cached
+        # views may modify request.user, so never hand out the shared copy
+        return copy.copy(user), token
+
+
+def make_signed_tokens(user):
+    '''return a new signed access and refresh token pair for a user'''
+    payload = {'uid': user.pk, 'ver': user.token_version}
+    return {
+        'access': signing.dumps(payload, salt=ACCESS_TOKEN_SALT),
+        'refresh': signing.dumps(payload, salt=REFRESH_TOKEN_SALT),
+        'expires_in': settings.SIGNED_TOKEN_ACCESS_TTL,
+    }
+
+
+def read_signed_token(value, salt, max_age):
+    '''return the payload of a signed token, raising if invalid or expired'''
+    try:
+        return signing.loads(value, salt=salt, max_age=max_age)
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed(_('Token has expired.'))
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    '''authenticate short lived signed tokens without touching the database
+
+    request.user is an unsaved user carrying only the id and token version,
+    which is all the ownership filters need. views that need the stored
+    user must load it, see `_state.adding`.
+    '''
+    keyword = 'Bearer'
+
+    def authenticate(self, request):
+        auth = get_authorization_header(request).split()
+        if not auth or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if len(auth) != 2:
+            raise exceptions.AuthenticationFailed(_('Invalid token header.'))
+        try:
+            value = auth[1].decode()
+        except UnicodeError:
+            raise exceptions.AuthenticationFailed(_('Invalid token.'))
+
+        payload = read_signed_token(
+            value, ACCESS_TOKEN_SALT, settings.SIGNED_TOKEN_ACCESS_TTL
+        )
+        user = get_user_model()(
+            pk=payload['uid'], token_version=payload['ver']
+        )
+        return user, payload
+
+    def authenticate_header(self, request):
+        return self.keyword
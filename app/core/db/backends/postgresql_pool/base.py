@@ -0,0 +1,92 @@
+import os
+import threading
+
+import psycopg2.extensions
+from django.db.backends.postgresql import base
+
+from core.db.pool import ConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+# pools inherited through a fork: their sockets belong to the parent, so
+# they are kept referenced and never closed from the child
+_inherited = []
+
+
+def _is_alive(conn):
+    '''ping a pooled connection'''
+    if conn.closed:
+        return False
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _is_clean(conn):
+    '''return whether a connection can be handed to the next user'''
+    if conn.closed:
+        return False
+    status = conn.get_transaction_status()
+    if status == psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+        return True
+    if status == psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+        # left in a transaction without an error, drop its changes
+        try:
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+    return False
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    '''postgresql backend borrowing connections from a per process pool
+
+    django still opens and closes a connection around every request, but
+    opening takes an idle pooled connection and closing returns it, so
+    the tcp and authentication handshake is only paid when the pool
+    grows. configure it with the POOL key of the database settings.
+    '''
+
+    def get_new_connection(self, conn_params):
+        pool = self._get_pool(conn_params)
+        self._pooled = pool
+        conn = pool.checkout()
+        # same isolation handling as the parent, on a borrowed connection
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', conn.isolation_level
+        )
+        if self.isolation_level != conn.isolation_level:
+            conn.set_session(isolation_level=self.isolation_level)
+        return conn
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                self._pooled.checkin(self.connection)
+
+    def _get_pool(self, conn_params):
+        key = (self.alias, os.getpid())
+        pool = _pools.get(key)
+        if pool is not None:
+            return pool
+        with _pools_lock:
+            for other in list(_pools):
+                if other[0] == self.alias and other[1] != os.getpid():
+                    _inherited.append(_pools.pop(other))
+            if key not in _pools:
+                options = self.settings_dict.get('POOL', {})
+                _pools[key] = ConnectionPool(
+                    lambda: base.Database.connect(**conn_params),
+                    max_size=options.get('MAX_SIZE', 10),
+                    max_age=options.get('MAX_AGE', 1800),
+                    ping_after=options.get('PING_AFTER', 30),
+                    timeout=options.get('TIMEOUT', 10),
+                    is_alive=_is_alive,
+                    is_clean=_is_clean,
+                )
+            return _pools[key]
@@ -0,0 +1,112 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    '''no connection became free within the checkout timeout'''
+
+
+class ConnectionPool:
+    '''a bounded set of open connections shared by the threads of a process
+
+    idle connections are reused newest first, so a quiet pool keeps a few
+    warm connections rather than cycling through all of them. connections
+    older than `max_age` are closed instead of reused, and one left idle
+    longer than `ping_after` is pinged before it is handed out.
+    '''
+
+    def __init__(self, connect, max_size=10, max_age=1800, ping_after=30,
+                 timeout=10, is_alive=None, is_clean=None):
+        self.connect = connect
+        self.max_size = max_size
+        self.max_age = max_age
+        self.ping_after = ping_after
+        self.timeout = timeout
+        self.is_alive = is_alive or (lambda conn: True)
+        self.is_clean = is_clean or (lambda conn: True)
+        # (connection, opened at, returned at) of each idle connection
+        self._idle = deque()
+        self._opened = {}
+        self._size = 0
+        self._lock = threading.Condition()
+
+    def checkout(self):
+        '''return a live connection, opening one when none is idle'''
+        deadline = time.monotonic() + self.timeout
+        while True:
+            idle = self._reserve(deadline)
+            if idle is None:
+                break
+            # checks and pings run outside the lock
+            conn, opened, returned = idle
+            if self._usable(conn, opened, returned):
+                return conn
+            self._discard(conn)
+
+        try:
+            conn = self.connect()
+        except Exception:
+            self._release_slot()
+            raise
+        self._opened[id(conn)] = time.monotonic()
+        return conn
+
+    def checkin(self, conn):
+        '''give a connection back, closing it if it cannot be reused'''
+        opened = self._opened.get(id(conn), 0)
+        if time.monotonic() - opened >= self.max_age or \
+                not self.is_clean(conn):
+            self._discard(conn)
+            return
+        with self._lock:
+            self._idle.append((conn, opened, time.monotonic()))
+            self._lock.notify()
+
+    def _reserve(self, deadline):
+        '''take an idle connection, or a free slot when None is returned'''
+        with self._lock:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._lock.wait(remaining):
+                    raise PoolTimeout(
+                        f'no connection free after {self.timeout}s'
+                    )
+
+    def _release_slot(self):
+        with self._lock:
+            self._size -= 1
+            self._lock.notify()
+
+    def close_all(self):
+        '''close every idle connection'''
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn, opened, returned in idle:
+            self._discard(conn)
+
+    @property
+    def size(self):
+        '''number of open connections, idle or checked out'''
+        return self._size
+
+    def _usable(self, conn, opened, returned):
+        now = time.monotonic()
+        if now - opened >= self.max_age:
+            return False
+        if now - returned >= self.ping_after:
+            return self.is_alive(conn)
+        return True
+
+    def _discard(self, conn):
+        self._opened.pop(id(conn), None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._release_slot()
@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+logger = logging.getLogger(__name__)
+
+# always read from the primary: a token or session created by one request
+# must be found by the next one, which carries a different credential
+PRIMARY_MODELS = {'authtoken.Token', 'sessions.Session'}
+
+_state = threading.local()
+
+
+class WeightedRoundRobin:
+    '''pick aliases in proportion to their weights, spread out evenly
+
+    the smooth weighted round robin of nginx upstreams: weights 2 and 1
+    give a, b, a rather than a, a, b.
+    '''
+
+    def __init__(self, weights):
+        self.weights = dict(weights)
+        self._current = dict.fromkeys(self.weights, 0)
+        self._lock = threading.Lock()
+
+    def pick(self, exclude=()):
+        '''return the next alias not in `exclude`, or None'''
+        with self._lock:
+            candidates = [
+                alias for alias in self.weights if alias not in exclude
+            ]
+            if not candidates:
+                return None
+            for alias in candidates:
+                self._current[alias] += self.weights[alias]
+            chosen = max(candidates, key=self._current.__getitem__)
+            self._current[chosen] -= sum(
+                self.weights[alias] for alias in candidates
+            )
+            return chosen
+
+
+class ReplicaHealth:
+    '''remember replicas that failed to connect, per process'''
+
+    def __init__(self):
+        self._down_until = {}
+
+    def down(self):
+        '''return the aliases not to be tried yet'''
+        now = time.monotonic()
+        return {
+            alias for alias, until in list(self._down_until.items())
+            if until > now
+        }
+
+    def mark_down(self, alias, seconds):
+        self._down_until[alias] = time.monotonic() + seconds
+
+    def reset(self):
+        self._down_until.clear()
+
+
+replica_health = ReplicaHealth()
+_balancer = None
+
+
+def _get_balancer():
+    '''return the balancer of the configured replicas'''
+    global _balancer
+    if _balancer is None or _balancer.weights != settings.DATABASE_REPLICAS:
+        _balancer = WeightedRoundRobin(settings.DATABASE_REPLICAS)
+    return _balancer
+
+
+def _pick_replica():
+    '''return a reachable replica, or the primary when none is'''
+    balancer = _get_balancer()
+    tried = set()
+    while True:
+        alias = balancer.pick(exclude=tried | replica_health.down())
+        if alias is None:
+            return DEFAULT_DB_ALIAS
+        tried.add(alias)
+        try:
+            connections[alias].ensure_connection()
+        except OperationalError:
+            logger.warning(
+                'replica %s is unreachable, not trying it for %ss',
+                alias, settings.REPLICA_RETRY_AFTER, exc_info=True
+            )
+            replica_health.mark_down(alias, settings.REPLICA_RETRY_AFTER)
+            continue
+        return alias
+
+
+@contextmanager
+def read_from_replicas():
+    '''send the reads made inside the block to a replica
+
+    one replica is chosen on the first read and kept for the rest of the
+    block, so a request never mixes data from two of them.
+    '''
+    previous = getattr(_state, 'reads', None)
+    _state.reads = {'alias': None}
+    try:
+        yield
+    finally:
+        _state.reads = previous
+
+
+def reading_from_replica():
+    '''return whether the reads of the current block went to a replica'''
+    reads = getattr(_state, 'reads', None)
+    return reads is not None and \
+        reads['alias'] not in (None, DEFAULT_DB_ALIAS)
+
+
+class ReplicaRouter:
+    '''route reads inside `read_from_replicas` to the replicas
+
+    every write, every read inside a transaction and every read outside
+    such a block, as in management commands, goes to the primary.
+    '''
+
+    def db_for_read(self, model, **hints):
+        reads = getattr(_state, 'reads', None)
+        if reads is None or not settings.DATABASE_REPLICAS or \
+                model._meta.label in PRIMARY_MODELS or \
+                connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        if reads['alias'] is None:
+            reads['alias'] = _pick_replica()
+        return reads['alias']
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replicas hold copies of the same rows
+        return True
@@ -0,0 +1,324 @@
+import json
+import math
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from io import BytesIO
+
+from PIL import Image
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import RequestFactory
+from django.urls import URLResolver, get_resolver, reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from core.authentication import make_signed_tokens
+from core.management.commands.seed_data import SEED_DOMAIN, SEED_PASSWORD
+from core.models import Ingredient, Recipe, Tag
+
+# url namespaces whose every route must be benchmarked
+NAMESPACES = ('recipe', 'user')
+
+
+def _jpeg():
+    '''return a small jpeg upload for the image route'''
+    buffer = BytesIO()
+    Image.new('RGB', (320, 240), 'orange').save(buffer, format='JPEG')
+    return SimpleUploadedFile(
+        'bench.jpg', buffer.getvalue(), content_type='image/jpeg'
+    )
+
+
+def _unique(label):
+    return f'{label} {uuid.uuid4().hex[:12]}'
+
+
+# label, route name, method, encoding, builder(fixture) -> (args, data)
+SCENARIOS = (
+    ('api root', 'recipe:api-root', 'get', 'query',
+     lambda f: ((), {})),
+    ('tag list', 'recipe:tag-list', 'get', 'query',
+     lambda f: ((), {})),
+    ('tag list with counts', 'recipe:tag-list', 'get', 'query',
+     lambda f: ((), {'with_counts': 1, 'min_count': 1})),
+    ('tag create', 'recipe:tag-list', 'post', 'json',
+     lambda f: ((), {'name': _unique('Bench tag')})),
+    ('tag bulk', 'recipe:tag-bulk', 'post', 'json',
+     lambda f: ((), {'names': ['Vegan', 'Quick', _unique('Bench tag')]})),
+    ('ingredient list', 'recipe:ingredient-list', 'get', 'query',
+     lambda f: ((), {})),
+    ('ingredient create', 'recipe:ingredient-list', 'post', 'json',
+     lambda f: ((), {'name': _unique('Bench ingredient')})),
+    ('ingredient bulk', 'recipe:ingredient-bulk', 'post', 'json',
+     lambda f: ((), {'names': ['Salt', _unique('Bench ingredient')]})),
+    ('recipe list', 'recipe:recipe-list', 'get', 'query',
+     lambda f: ((), {})),
+    ('recipe list filtered', 'recipe:recipe-list', 'get', 'query',
+     lambda f: ((), {'tags': ','.join(map(str, f['tags'][:2]))})),
+    ('recipe search', 'recipe:recipe-list', 'get', 'query',
+     lambda f: ((), {'search': 'garlic curry'})),
+    ('recipe detail', 'recipe:recipe-detail', 'get', 'query',
+     lambda f: ((f['recipes'][0],), {})),
+    ('recipe create', 'recipe:recipe-list', 'post', 'json',
+     lambda f: ((), {
+         'title': _unique('Bench recipe'), 'time_minutes': 10,
+         'price': '5.00', 'tags': f['tags'][:2],
+         'ingredients': f['ingredients'][:5],
+     })),
+    ('recipe update', 'recipe:recipe-detail', 'patch', 'json',
+     lambda f: ((f['recipes'][1],), {'title': _unique('Bench recipe')})),
+    ('recipe image', 'recipe:recipe-upload-image', 'post', 'multipart',
+     lambda f: ((f['recipes'][2],), {'image': _jpeg()})),
+    ('recipe bulk', 'recipe:recipe-bulk', 'post', 'json',
+     lambda f: ((), [
+         {'title': _unique('Bench recipe'), 'time_minutes': 10,
+          'price': '5.00', 'tags': f['tags'][:1]},
+         {'id': f['recipes'][3], 'title': _unique('Bench recipe'),
+          'time_minutes': 20, 'price': '6.00'},
+     ])),
+    ('user create', 'user:create', 'post', 'json',
+     lambda f: ((), {
+         'email': f'{uuid.uuid4().hex}@bench.{SEED_DOMAIN}',
+         'password': SEED_PASSWORD, 'name': 'Bench user',
+     })),
+    ('token', 'user:token', 'post', 'json',
+     lambda f: ((), {'email': f['email'], 'password': SEED_PASSWORD})),
+    ('signed token', 'user:signed-token', 'post', 'json',
+     lambda f: ((), {'email': f['email'], 'password': SEED_PASSWORD})),
+    ('refresh token', 'user:refresh-token', 'post', 'json',
+     lambda f: ((), {'refresh': f['refresh']})),
+    ('me', 'user:me', 'get', 'query',
+     lambda f: ((), {})),
+    ('me update', 'user:me', 'patch', 'json',
+     lambda f: ((), {'name': _unique('Seed user')})),
+)
+
+
+def route_names(namespaces=NAMESPACES):
+    '''return the names of every route in the given url namespaces'''
+    names = set()
+    for pattern in get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver) and \
+                pattern.namespace in namespaces:
+            names.update(
+                f'{pattern.namespace}:{name}'
+                for name in pattern.reverse_dict
+                if isinstance(name, str)
+            )
+    return names
+
+
+def bench_host():
+    '''return a host name the api accepts'''
+    for host in settings.ALLOWED_HOSTS:
+        if host != '*' and not host.startswith('.'):
+            return host
+    # what django allows when DEBUG is on and ALLOWED_HOSTS is empty
+    return 'localhost'
+
+
+def percentile(ordered, percent):
+    '''return the nearest rank percentile of sorted values'''
+    return ordered[max(0, math.ceil(len(ordered) * percent / 100) - 1)]
+
+
+class Command(BaseCommand):
+    '''django command to load test every api route through wsgi'''
+    help = 'Benchmark latency, throughput and queries of every api route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200,
+                            help='requests per scenario')
+        parser.add_argument('--concurrency', type=int, default=8)
+        parser.add_argument(
+            '--only', action='append', default=[],
+            help='run only scenarios whose label contains this text'
+        )
+        parser.add_argument(
+            '--output', help='json results file, bench-api-<time>.json by '
+                             'default'
+        )
+        parser.add_argument(
+            '--compare', help='earlier json results to print changes against'
+        )
+
+    def handle(self, *args, **options):
+        missing = route_names() - {scenario[1] for scenario in SCENARIOS}
+        if missing:
+            raise CommandError(
+                f'no benchmark scenario for {", ".join(sorted(missing))}'
+            )
+        fixtures = self._fixtures(options['concurrency'])
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as previous:
+                baseline = {
+                    result['label']: result
+                    for result in json.load(previous)['results']
+                }
+
+        handler = WSGIHandler()
+        results = []
+        for scenario in SCENARIOS:
+            if options['only'] and not any(
+                    text in scenario[0] for text in options['only']):
+                continue
+            result = self._run(handler, scenario, fixtures, options)
+            results.append(result)
+            self._report(result, baseline.get(result['label']))
+
+        output = options['output'] or \
+            f'bench-api-{timezone.now():%Y%m%d-%H%M%S}.json'
+        with open(output, 'w') as results_file:
+            json.dump({
+                'created': timezone.now().isoformat(),
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'rows': {
+                    model.__name__.lower(): model.objects.count()
+                    for model in (get_user_model(), Recipe, Tag, Ingredient)
+                },
+                'results': results,
+            }, results_file, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Saved results to {output}'))
+
+    def _fixtures(self, count):
+        '''return the seeded users the benchmark threads act as'''
+        users = list(
+            get_user_model().objects.filter(
+                email__endswith=f'@{SEED_DOMAIN}',
+                recipe__isnull=False,
+            ).distinct().order_by('pk')[:count]
+        )
+        if not users:
+            raise CommandError('no seeded users, run seed_data first')
+
+        fixtures = []
+        for user in users:
+            fixture = {
+                'email': user.email,
+                'token': Token.objects.get_or_create(user=user)[0].key,
+                'refresh': make_signed_tokens(user)['refresh'],
+            }
+            for key, model in (
+                    ('recipes', Recipe), ('tags', Tag),
+                    ('ingredients', Ingredient)):
+                fixture[key] = list(
+                    model.objects.filter(user=user).order_by('pk')
+                    .values_list('pk', flat=True)[:10]
+                )
+            if len(fixture['recipes']) < 4:
+                raise CommandError(f'{user.email} needs at least 4 recipes')
+            fixtures.append(fixture)
+        return fixtures
+
+    def _environ(self, scenario, fixture):
+        '''return the wsgi environ of one request of a scenario'''
+        label, route, method, encoding, build = scenario
+        args, data = build(fixture)
+        factory = RequestFactory()
+        extra = {
+            'HTTP_AUTHORIZATION': f'Token {fixture["token"]}',
+            'HTTP_HOST': bench_host(),
+        }
+        path = reverse(route, args=args)
+        if encoding == 'query':
+            request = getattr(factory, method)(path, data, **extra)
+        elif encoding == 'json':
+            request = getattr(factory, method)(
+                path, json.dumps(data), content_type='application/json',
+                **extra
+            )
+        else:
+            request = getattr(factory, method)(path, data, **extra)
+        return request.environ
+
+    def _run(self, handler, scenario, fixtures, options):
+        '''send the requests of one scenario from every client thread'''
+        concurrency = options['concurrency']
+        per_client = max(1, options['requests'] // concurrency)
+        samples = []
+        lock = threading.Lock()
+
+        def client(fixture):
+            local = []
+            with ExitStack() as stack:
+                # counted per thread, so debug mode is not needed
+                queries = [0]
+
+                def count(execute, sql, params, many, context):
+                    queries[0] += 1
+                    return execute(sql, params, many, context)
+
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count))
+                for _ in range(per_client):
+                    environ = self._environ(scenario, fixture)
+                    queries[0] = 0
+                    start = time.perf_counter()
+                    # closing the response fires request_finished, which
+                    # is part of the cost of every request
+                    response = handler(environ, lambda *args: None)
+                    response.close()
+                    local.append((
+                        (time.perf_counter() - start) * 1000,
+                        queries[0],
+                        response.status_code,
+                    ))
+            with lock:
+                samples.extend(local)
+
+        clients = [
+            fixtures[index % len(fixtures)] for index in range(concurrency)
+        ]
+        start = time.perf_counter()
+        if concurrency == 1:
+            # a single client stays on this thread and its connection
+            client(clients[0])
+        else:
+            threads = [
+                threading.Thread(target=client, args=(fixture,))
+                for fixture in clients
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        elapsed = time.perf_counter() - start
+
+        timings = sorted(sample[0] for sample in samples)
+        return {
+            'label': scenario[0],
+            'route': scenario[1],
+            'method': scenario[2].upper(),
+            'requests': len(samples),
+            'errors': sum(1 for sample in samples if sample[2] >= 400),
+            'rps': len(samples) / elapsed,
+            'p50': percentile(timings, 50),
+            'p95': percentile(timings, 95),
+            'p99': percentile(timings, 99),
+            'queries': sum(sample[1] for sample in samples) / len(samples),
+        }
+
+    def _report(self, result, previous):
+        '''print one scenario, with its change against an earlier run'''
+        line = (
+            f'{result["label"]:>22}: {result["rps"]:8.1f} req/s, '
+            f'p50 {result["p50"]:7.2f}ms, p95 {result["p95"]:7.2f}ms, '
+            f'p99 {result["p99"]:7.2f}ms, '
+            f'{result["queries"]:5.1f} queries'
+        )
+        if result['errors']:
+            line += f', {result["errors"]} errors'
+        if previous:
+            line += (
+                f' (p95 {result["p95"] / previous["p95"] - 1:+.0%}, '
+                f'{result["queries"] - previous["queries"]:+.1f} queries)'
+            )
+        self.stdout.write(line)
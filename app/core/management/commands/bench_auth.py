@@ -0,0 +1,60 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+
+from core.authentication import CachedTokenAuthentication, \
+    SignedTokenAuthentication, make_signed_tokens, token_cache
+
+
+class Command(BaseCommand):
+    '''django command to compare the per request cost of each auth scheme'''
+    help = 'Benchmark token, cached token and signed token authentication'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=2000)
+
+    def handle(self, *args, **options):
+        iterations = options['iterations']
+        # the benchmark user and token never outlive the command
+        with transaction.atomic():
+            user = get_user_model().objects.create_user(
+                'bench-auth@example.com', 'benchpass'
+            )
+            token = Token.objects.create(user=user)
+            signed = make_signed_tokens(user)['access']
+            token_cache.clear()
+
+            schemes = (
+                ('db token', TokenAuthentication(), f'Token {token.key}'),
+                ('cached token', CachedTokenAuthentication(),
+                 f'Token {token.key}'),
+                ('signed token', SignedTokenAuthentication(),
+                 f'Bearer {signed}'),
+            )
+            for name, authenticator, header in schemes:
+                self._report(name, authenticator, header, iterations)
+
+            transaction.set_rollback(True)
+
+    def _report(self, name, authenticator, header, iterations):
+        '''time authenticator over iterations and print the averages'''
+        request = Request(
+            RequestFactory().get('/', HTTP_AUTHORIZATION=header)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            for _ in range(iterations):
+                authenticator.authenticate(request)
+            elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f'{name:>13}: {elapsed / iterations * 1e6:8.1f} us/request, '
+            f'{len(queries) / iterations:.2f} queries/request'
+        )
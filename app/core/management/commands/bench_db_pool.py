@@ -0,0 +1,124 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe
+
+# environment of each compared connection mode, read by app.settings
+MODES = (
+    ('new connection', {'DB_CONN_MAX_AGE': '0', 'DB_POOL_SIZE': '0'}),
+    ('persistent', {'DB_CONN_MAX_AGE': '600', 'DB_POOL_SIZE': '0'}),
+    ('pool', {'DB_CONN_MAX_AGE': '0', 'DB_POOL_SIZE': '{threads}'}),
+)
+
+
+class Command(BaseCommand):
+    '''django command to compare requests per second by connection mode'''
+    help = 'Benchmark recipe requests with and without connection pooling'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--child', help='run one mode and print its results as json'
+        )
+
+    def handle(self, *args, **options):
+        if options['child']:
+            self._run_child(options)
+            return
+
+        # settings are read once per process, so every mode gets its own
+        for name, env in MODES:
+            env = {
+                key: value.format(threads=options['threads'])
+                for key, value in env.items()
+            }
+            output = subprocess.run(
+                [
+                    sys.executable, 'manage.py', 'bench_db_pool',
+                    '--child', name,
+                    '--requests', str(options['requests']),
+                    '--threads', str(options['threads']),
+                ],
+                cwd=settings.BASE_DIR,
+                env=dict(os.environ, **env),
+                stdout=subprocess.PIPE,
+                check=True,
+            ).stdout
+            result = json.loads(output.decode().splitlines()[-1])
+            self.stdout.write(
+                f'{name:>15}: {result["rps"]:8.1f} req/s, '
+                f'p50 {result["p50"]:.2f}ms, p95 {result["p95"]:.2f}ms'
+            )
+
+    def _run_child(self, options):
+        '''serve the requests of one mode through the wsgi handler'''
+        user = get_user_model().objects.create_user(
+            f'bench-pool-{time.time_ns()}@example.com', 'benchpass'
+        )
+        try:
+            token = Token.objects.create(user=user)
+            recipe = Recipe.objects.create(
+                user=user, title='Bench', time_minutes=1, price=1
+            )
+            # the benchmark threads open their own connections
+            connection.close()
+            timings, elapsed = self._load(
+                f'/api/recipe/recipes/{recipe.pk}/', token.key,
+                options['requests'], options['threads']
+            )
+        finally:
+            user.delete()
+
+        timings.sort()
+        self.stdout.write(json.dumps({
+            'mode': options['child'],
+            'rps': len(timings) / elapsed,
+            'p50': statistics.median(timings),
+            'p95': timings[int(len(timings) * 0.95) - 1],
+        }))
+
+    def _load(self, path, key, requests, threads):
+        '''return the milliseconds of each request and the total seconds'''
+        handler = WSGIHandler()
+        environ = RequestFactory().get(
+            path, HTTP_AUTHORIZATION=f'Token {key}', HTTP_HOST='localhost'
+        ).environ
+        timings = []
+        lock = threading.Lock()
+
+        def worker(count):
+            local = []
+            for _ in range(count):
+                start = time.perf_counter()
+                # closing the response fires request_finished, which is
+                # where django closes or returns the connection
+                response = handler(dict(environ), lambda *args: None)
+                response.close()
+                local.append((time.perf_counter() - start) * 1000)
+            with lock:
+                timings.extend(local)
+
+        workers = [
+            threading.Thread(target=worker, args=(requests // threads,))
+            for _ in range(threads)
+        ]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return timings, time.perf_counter() - start
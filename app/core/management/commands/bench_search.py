@@ -0,0 +1,112 @@
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.models import Recipe
+from recipe.search import search_recipes, update_search_vectors
+
+WORDS = (
+    'chicken', 'beef', 'tofu', 'salmon', 'prawn', 'lentil', 'mushroom',
+    'curry', 'stew', 'salad', 'soup', 'pie', 'roast', 'noodles', 'risotto',
+    'spicy', 'creamy', 'smoky', 'lemon', 'garlic', 'ginger', 'herb',
+    'chocolate', 'vanilla', 'apple', 'banana', 'cake', 'brownies', 'tart',
+)
+
+SEED_SQL = '''
+INSERT INTO core_recipe (user_id, title, time_minutes, price, link,
+                         updated_at)
+SELECT %(user_id)s,
+       initcap(w[1 + floor(random() * n)::int] || ' ' ||
+               w[1 + floor(random() * n)::int] || ' ' ||
+               w[1 + floor(random() * n)::int]),
+       5 + floor(random() * 120)::int,
+       round((random() * 50)::numeric, 2),
+       '',
+       now()
+FROM generate_series(1, %(count)s),
+     (SELECT %(words)s::text[] AS w, %(size)s AS n) AS words
+'''
+
+
+class Command(BaseCommand):
+    '''django command to time recipe search on a large seeded account'''
+    help = 'Seed one account with many recipes and time searches on it'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=1000000)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--chunk', type=int, default=50000)
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='keep the seeded account instead of deleting it'
+        )
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.create_user(
+            f'bench-search-{time.time_ns()}@example.com', 'benchpass'
+        )
+        try:
+            self._seed(user, options['recipes'], options['chunk'])
+            terms = ('curry', 'chicken soup', 'chocolate cake', 'spicy tofu')
+            for term in terms:
+                self._time_search(user, term, options['repeat'])
+            self._explain(user, terms[0])
+        finally:
+            if not options['keep']:
+                # delete in sql, the orm would load every recipe first
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        'DELETE FROM core_recipe WHERE user_id = %s',
+                        [user.pk]
+                    )
+                user.delete()
+
+    def _seed(self, user, count, chunk):
+        '''insert the recipes and build their search vectors'''
+        start = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute(SEED_SQL, {
+                'user_id': user.pk, 'count': count,
+                'words': list(WORDS), 'size': len(WORDS),
+            })
+        ids = list(
+            Recipe.objects.filter(user=user).values_list('pk', flat=True)
+        )
+        for offset in range(0, len(ids), chunk):
+            update_search_vectors(ids[offset:offset + chunk])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE core_recipe')
+        self.stdout.write(
+            f'seeded {count} recipes in {time.perf_counter() - start:.1f}s'
+        )
+
+    def _time_search(self, user, term, repeat):
+        '''run one search repeatedly and print latency percentiles'''
+        queryset = Recipe.objects.filter(user=user)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            found = list(
+                search_recipes(queryset, term).order_by('-rank', '-id')[:20]
+            )
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        self.stdout.write(
+            f'{term!r:>18}: {len(found)} rows, '
+            f'p50 {statistics.median(timings):.1f}ms, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.1f}ms'
+        )
+
+    def _explain(self, user, term):
+        '''print the plan of a ranked search'''
+        queryset = search_recipes(
+            Recipe.objects.filter(user=user), term
+        ).order_by('-rank', '-id')[:20]
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN ANALYZE {sql}', params)
+            for (line,) in cursor.fetchall():
+                self.stdout.write(line)
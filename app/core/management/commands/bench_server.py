@@ -0,0 +1,142 @@
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe
+
+# command line of each compared server, run from the project directory
+SERVERS = (
+    ('runserver', [
+        sys.executable, 'manage.py', 'runserver', '--noreload',
+        '--nothreading', '127.0.0.1:{port}',
+    ]),
+    ('runserver threaded', [
+        sys.executable, 'manage.py', 'runserver', '--noreload',
+        '127.0.0.1:{port}',
+    ]),
+    ('gunicorn', [
+        sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py',
+        '--bind', '127.0.0.1:{port}', '--workers', '{workers}',
+        '--threads', '{threads}', '--log-level', 'warning',
+    ]),
+)
+
+
+def free_port():
+    '''return a local tcp port nothing is listening on'''
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+class Command(BaseCommand):
+    '''django command to compare the development and production servers'''
+    help = 'Benchmark startup time and throughput of runserver and gunicorn'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--startup-timeout', type=float, default=60)
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.create_user(
+            f'bench-server-{time.time_ns()}@example.com', 'benchpass'
+        )
+        try:
+            token = Token.objects.create(user=user)
+            recipe = Recipe.objects.create(
+                user=user, title='Bench', time_minutes=1, price=1
+            )
+            for name, command in SERVERS:
+                startup, rps, timings = self._bench(
+                    command, f'/api/recipe/recipes/{recipe.pk}/',
+                    token.key, options
+                )
+                self.stdout.write(
+                    f'{name:>18}: ready in {startup:6.2f}s, '
+                    f'{rps:8.1f} req/s, p50 {statistics.median(timings):.2f}'
+                    f'ms, p95 {timings[int(len(timings) * 0.95) - 1]:.2f}ms'
+                )
+        finally:
+            user.delete()
+
+    def _bench(self, command, path, key, options):
+        '''start one server, time its startup and load it with requests'''
+        port = free_port()
+        command = [
+            part.format(port=port, **options) for part in command
+        ]
+        started = time.perf_counter()
+        server = subprocess.Popen(
+            command, cwd=settings.BASE_DIR,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        try:
+            url = f'http://127.0.0.1:{port}{path}'
+            self._wait_ready(server, url, options['startup_timeout'])
+            startup = time.perf_counter() - started
+            timings, elapsed = self._load(
+                url, key, options['requests'], options['concurrency']
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        timings.sort()
+        return startup, len(timings) / elapsed, timings
+
+    def _wait_ready(self, server, url, timeout):
+        '''wait until the server answers its first request'''
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f'{server.args[0]} exited on startup')
+            try:
+                urllib.request.urlopen(url, timeout=1).close()
+                return
+            except urllib.error.HTTPError:
+                # any response, even 401, means the server is up
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise CommandError(f'server not ready after {timeout}s')
+
+    def _load(self, url, key, requests, concurrency):
+        '''return the milliseconds of each request and the total seconds'''
+        request = urllib.request.Request(
+            url, headers={'Authorization': f'Token {key}'}
+        )
+        timings = []
+        lock = threading.Lock()
+
+        def worker(count):
+            local = []
+            for _ in range(count):
+                start = time.perf_counter()
+                with urllib.request.urlopen(request, timeout=30) as response:
+                    response.read()
+                local.append((time.perf_counter() - start) * 1000)
+            with lock:
+                timings.extend(local)
+
+        workers = [
+            threading.Thread(target=worker, args=(requests // concurrency,))
+            for _ in range(concurrency)
+        ]
+        start = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return timings, time.perf_counter() - start
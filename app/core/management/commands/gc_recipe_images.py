@@ -0,0 +1,143 @@
+import os
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from core.storage import image_stems, is_content_name, \
+    recipe_image_storage
+
+# must match the expression of core_imageblob_name_stem_idx
+COUNTED_STEMS_SQL = '''
+SELECT regexp_replace(name, '\\.[^./]*$', '')
+FROM core_imageblob
+WHERE regexp_replace(name, '\\.[^./]*$', '') = ANY(%s) AND ref_count > 0
+'''
+
+# must match the expression of core_recipe_image_stem_idx
+REFERENCED_STEMS_SQL = '''
+SELECT DISTINCT regexp_replace(image, '\\.[^./]*$', '')
+FROM core_recipe
+WHERE regexp_replace(image, '\\.[^./]*$', '') = ANY(%s)
+'''
+
+
+def _scan(path):
+    '''yield every file below path without listing a directory at once'''
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from _scan(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+def _storage_name(path):
+    '''return the storage name of a file below the media root'''
+    return os.path.relpath(path, recipe_image_storage.location).replace(
+        os.sep, '/'
+    )
+
+
+class Command(BaseCommand):
+    '''django command to delete recipe image files nothing refers to'''
+    help = 'Delete recipe images and thumbnails no recipe refers to'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--min-age', type=int, default=3600,
+            help='seconds a file must be unmodified before it is deleted'
+        )
+        parser.add_argument(
+            '--max-rate', type=float, default=0,
+            help='most files deleted per second, 0 for no limit'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='only report the files that would be deleted'
+        )
+        parser.add_argument('--directory', default='upload/recipe')
+
+    def handle(self, *args, **options):
+        root = recipe_image_storage.path(options['directory'])
+        if not os.path.isdir(root):
+            self.stdout.write(f'{root} does not exist')
+            return
+
+        self.options = options
+        self.scanned = self.deleted = self.freed = 0
+        self.last_delete = 0.0
+        batch = []
+        # the walk is streamed and checked one batch at a time, so memory
+        # stays flat however many files the volume holds
+        for entry in _scan(root):
+            batch.append(entry)
+            if len(batch) >= options['batch_size']:
+                self._collect(batch)
+                batch = []
+        if batch:
+            self._collect(batch)
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {self.deleted} of {self.scanned} files, '
+            f'{self.freed} bytes'
+        ))
+
+    def _collect(self, entries):
+        '''delete the unreferenced and settled files of one batch'''
+        self.scanned += len(entries)
+        names = {
+            entry.path: _storage_name(entry.path)
+            for entry in entries
+        }
+        stems = set()
+        for name in names.values():
+            stems |= image_stems(name)
+        # content addressed files are shared, so they are kept while their
+        # reference count is; older files belong to a single recipe row
+        counted = {stem for stem in stems if is_content_name(stem)}
+        referenced = set()
+        with connection.cursor() as cursor:
+            for sql, batch in (
+                (COUNTED_STEMS_SQL, counted),
+                (REFERENCED_STEMS_SQL, stems - counted),
+            ):
+                if batch:
+                    cursor.execute(sql, [sorted(batch)])
+                    referenced |= {stem for (stem,) in cursor.fetchall()}
+
+        for entry in entries:
+            if image_stems(names[entry.path]) & referenced:
+                continue
+            self._delete(entry.path, names[entry.path])
+
+    def _delete(self, path, name):
+        '''remove one orphaned file unless it was touched recently'''
+        try:
+            # stat again right before deleting: the storage refreshes the
+            # mtime when an upload reuses a file with the same content
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return
+        if time.time() - stat.st_mtime < self.options['min_age']:
+            return
+
+        self.deleted += 1
+        self.freed += stat.st_size
+        if self.options['dry_run']:
+            self.stdout.write(f'would delete {name}')
+            return
+
+        if self.options['max_rate']:
+            wait = self.last_delete + 1 / self.options['max_rate'] - \
+                time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self.last_delete = time.monotonic()
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
@@ -0,0 +1,101 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from core.models import ImageBlob, Recipe
+from core.storage import CONTENT_NAME_RE, recipe_image_storage
+from recipe.thumbnails import variant_name
+
+
+class Command(BaseCommand):
+    '''django command to move recipe images into content addressed storage'''
+    help = 'Move existing recipe images into content addressed storage'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--keep-old', action='store_true',
+            help='leave the original files in place after moving them'
+        )
+
+    def handle(self, *args, **options):
+        # rows leave this queryset once moved, so an interrupted run picks
+        # up where it stopped when started again
+        pending = Recipe.objects.exclude(image__isnull=True).exclude(
+            image=''
+        ).exclude(image__regex=CONTENT_NAME_RE.pattern)
+
+        last_id = 0
+        moved = missing = 0
+        while True:
+            batch = list(
+                pending.filter(pk__gt=last_id).order_by('pk').values_list(
+                    'pk', 'image', 'image_variants'
+                )[:options['batch_size']]
+            )
+            if not batch:
+                break
+            for pk, old_name, variants in batch:
+                last_id = pk
+                if not recipe_image_storage.exists(old_name):
+                    missing += 1
+                    self.stderr.write(f'recipe {pk}: {old_name} is missing')
+                    continue
+                if self._move(pk, old_name, variants, options['keep_old']):
+                    moved += 1
+            self.stdout.write(f'moved {moved} images, up to recipe {last_id}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Moved {moved} images, {missing} missing'
+        ))
+
+    def _move(self, pk, old_name, variants, keep_old):
+        '''store one image by content and point its recipe at the copy'''
+        with recipe_image_storage.open(old_name) as old_file:
+            new_name = recipe_image_storage.save(old_name, old_file)
+        new_variants = self._copy_variants(new_name, variants)
+
+        with transaction.atomic():
+            # skip recipes whose image was replaced since the batch was read
+            updated = Recipe.objects.filter(pk=pk, image=old_name).update(
+                image=new_name, image_variants=new_variants,
+                updated_at=timezone.now()
+            )
+            if updated:
+                ImageBlob.objects.retain(new_name)
+                ImageBlob.objects.release(old_name)
+
+        if updated and not keep_old:
+            recipe_image_storage.delete(old_name)
+            for formats in (variants or {}).values():
+                for old_variant in formats.values():
+                    recipe_image_storage.delete(old_variant)
+        return bool(updated)
+
+    def _copy_variants(self, new_name, variants):
+        '''copy the thumbnails of an image to the names of its new copy
+
+        thumbnails are found by the stem of their image, so they have to
+        follow it. returns the variants of the new name, leaving out any
+        whose file is gone.
+        '''
+        copied = {}
+        for width, formats in (variants or {}).items():
+            for fmt, old_variant in formats.items():
+                new_variant = variant_name(new_name, int(width), fmt)
+                target = recipe_image_storage.path(new_variant)
+                # an image stored twice already has its thumbnails
+                if not os.path.exists(target):
+                    try:
+                        partial = f'{target}.{os.getpid()}.part'
+                        shutil.copyfile(
+                            recipe_image_storage.path(old_variant), partial
+                        )
+                    except FileNotFoundError:
+                        continue
+                    os.replace(partial, target)
+                copied.setdefault(width, {})[fmt] = new_variant
+        return copied
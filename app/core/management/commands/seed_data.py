@@ -0,0 +1,178 @@
+import random
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.authtoken.models import Token
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.search import update_search_vectors
+
+# seeded users share this domain and password, see bench_api
+SEED_DOMAIN = 'seed.example.com'
+SEED_PASSWORD = 'seedpass'
+
+TAG_WORDS = (
+    'Vegan', 'Vegetarian', 'Dessert', 'Breakfast', 'Lunch', 'Dinner',
+    'Quick', 'Spicy', 'Healthy', 'Comfort', 'Baking', 'Grill', 'Salad',
+    'Soup', 'Snack', 'Party', 'Budget', 'Italian', 'Mexican', 'Thai',
+)
+INGREDIENT_WORDS = (
+    'Salt', 'Pepper', 'Olive oil', 'Butter', 'Garlic', 'Onion', 'Tomato',
+    'Flour', 'Sugar', 'Egg', 'Milk', 'Rice', 'Chicken', 'Beef', 'Lemon',
+    'Basil', 'Parsley', 'Carrot', 'Potato', 'Cheese', 'Cream', 'Honey',
+    'Ginger', 'Chili', 'Cumin', 'Spinach', 'Mushroom', 'Pasta', 'Beans',
+    'Coconut milk', 'Soy sauce', 'Vinegar', 'Yoghurt', 'Oats', 'Apple',
+)
+DISH_WORDS = (
+    'stew', 'curry', 'salad', 'soup', 'pie', 'bake', 'stir fry', 'tart',
+    'risotto', 'tacos', 'pancakes', 'roast', 'skewers', 'bowl', 'cake',
+)
+
+
+def seed_names(words, count):
+    '''return `count` distinct names, numbering words once they run out'''
+    return [
+        words[index % len(words)] +
+        (f' {index // len(words) + 1}' if index >= len(words) else '')
+        for index in range(count)
+    ]
+
+
+def pick_linked(rng, ids, mean):
+    '''return ids to link to one recipe, favouring the first ones
+
+    the count varies around `mean` and earlier ids are picked more often,
+    so a few tags and ingredients end up on most recipes as they do in
+    real data.
+    '''
+    if not ids or mean <= 0:
+        return set()
+    count = min(len(ids), max(0, round(rng.gauss(mean, mean / 2))))
+    weights = [1 / (rank + 1) for rank in range(len(ids))]
+    picked = set()
+    while len(picked) < count:
+        picked.update(rng.choices(ids, weights, k=count - len(picked)))
+    return picked
+
+
+class Command(BaseCommand):
+    '''django command to fill the database with realistic sample data'''
+    help = 'Create users with tags, ingredients and linked recipes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--tags', type=int, default=20,
+                            help='tags per user')
+        parser.add_argument('--ingredients', type=int, default=60,
+                            help='ingredients per user')
+        parser.add_argument('--recipes', type=int, default=200,
+                            help='recipes per user')
+        parser.add_argument('--tags-per-recipe', type=float, default=3,
+                            help='average tags linked to each recipe')
+        parser.add_argument('--ingredients-per-recipe', type=float,
+                            default=8,
+                            help='average ingredients linked to each recipe')
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='users written per transaction')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='delete previously seeded users and their data first'
+        )
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        seeded = User.objects.filter(email__endswith=f'@{SEED_DOMAIN}')
+        if options['clear']:
+            deleted = seeded.count()
+            seeded.delete()
+            self.stdout.write(f'deleted {deleted} seeded users')
+
+        rng = random.Random(options['seed'])
+        # hashing is deliberately slow, so every seeded user shares one
+        password = make_password(SEED_PASSWORD)
+        first = seeded.count()
+        total = options['users']
+        for start in range(0, total, options['batch_size']):
+            count = min(options['batch_size'], total - start)
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(
+                        email=f'user{first + start + index}@{SEED_DOMAIN}',
+                        name=f'Seed user {first + start + index}',
+                        password=password,
+                    )
+                    for index in range(count)
+                ])
+                self._seed_users(rng, users, options)
+            self.stdout.write(f'seeded {start + count} of {total} users')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {total} users with {options["recipes"]} recipes each'
+        ))
+
+    def _seed_users(self, rng, users, options):
+        '''create the tokens, tags, ingredients and recipes of new users'''
+        tokens = [Token(user=user) for user in users]
+        for token in tokens:
+            # Token.save fills in the key, which bulk_create skips
+            token.key = token.generate_key()
+        Token.objects.bulk_create(tokens)
+        tags = self._create_named(Tag, users, TAG_WORDS, options['tags'])
+        ingredients = self._create_named(
+            Ingredient, users, INGREDIENT_WORDS, options['ingredients']
+        )
+
+        recipes = []
+        for user in users:
+            for index in range(options['recipes']):
+                recipes.append(Recipe(
+                    user=user,
+                    title=(
+                        f'{rng.choice(INGREDIENT_WORDS)} '
+                        f'{rng.choice(DISH_WORDS)} {index + 1}'
+                    ),
+                    time_minutes=rng.randint(5, 180),
+                    price=Decimal(rng.randint(100, 5000)) / 100,
+                ))
+        recipes = Recipe.objects.bulk_create(recipes, batch_size=1000)
+
+        tag_links = []
+        ingredient_links = []
+        for recipe in recipes:
+            tag_links.extend(
+                Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+                for tag_id in pick_linked(
+                    rng, tags[recipe.user_id], options['tags_per_recipe']
+                )
+            )
+            ingredient_links.extend(
+                Recipe.ingredients.through(
+                    recipe_id=recipe.pk, ingredient_id=ingredient_id
+                )
+                for ingredient_id in pick_linked(
+                    rng, ingredients[recipe.user_id],
+                    options['ingredients_per_recipe']
+                )
+            )
+        Recipe.tags.through.objects.bulk_create(tag_links, batch_size=5000)
+        Recipe.ingredients.through.objects.bulk_create(
+            ingredient_links, batch_size=5000
+        )
+        # bulk_create sends no signals, so index the recipes here
+        update_search_vectors(recipe.pk for recipe in recipes)
+
+    def _create_named(self, model, users, words, count):
+        '''create `count` named objects per user, return their ids by user'''
+        created = model.objects.bulk_create([
+            model(user=user, name=name)
+            for user in users
+            for name in seed_names(words, count)
+        ], batch_size=1000)
+        ids = {user.pk: [] for user in users}
+        for obj in created:
+            ids[obj.user_id].append(obj.pk)
+        return ids
@@ -1,22 +1,61 @@
 import time
-from django.db import connections
+from django.db import DEFAULT_DB_ALIAS, connections
 from django.db.utils import OperationalError
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+
+from core.warmup import warm_up_database
 
 # command class
 class Command(BaseCommand):
     '''django command to pause execution till db is available'''
 
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='seconds to keep trying before giving up'
+        )
+        parser.add_argument(
+            '--interval', type=float, default=0.5,
+            help='seconds before the first retry, doubled after each one'
+        )
+        parser.add_argument('--max-interval', type=float, default=5)
+        parser.add_argument(
+            '--warm-up', action='store_true',
+            help='load the hot tables and indexes into the database cache'
+        )
+
     def handle(self,  *args, **options):
         self.stdout.write('Waiting for database...')
-        db_conn = None
+        db_conn = connections[options['database']]
+        deadline = time.monotonic() + options['timeout']
+        interval = options['interval']
 
-        while not db_conn:
+        while True:
             try:
-                db_conn = connections['default']
+                # connections[] alone is lazy, so really connect and query
+                with db_conn.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    cursor.fetchone()
+                break
             except OperationalError:
-                self.stdout.write('Database unavailable, waiting 1 second...')
-                time.sleep(1)
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'Database unavailable after {options["timeout"]}s'
+                    )
+                wait = min(interval, remaining)
+                self.stdout.write(
+                    f'Database unavailable, waiting {wait:.1f} seconds...'
+                )
+                time.sleep(wait)
+                interval = min(interval * 2, options['max_interval'])
 
+        self.stdout.write(self.style.SUCCESS('Database available'))
 
-        self.stdout.write(self.style.SUCCESS('Database available'))
\ No newline at end of file
+        if options['warm_up']:
+            blocks = warm_up_database(options['database'])
+            if blocks is None:
+                self.stdout.write('Tables not created yet, skipped warm-up')
+            else:
+                self.stdout.write(f'Warmed up {blocks} blocks')
@@ -0,0 +1,282 @@
+import bisect
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+import weakref
+from collections import defaultdict
+
+from django.conf import settings
+
+# upper bounds in seconds of the request latency histogram buckets
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUESTS = 'recipe_api_requests_total'
+DURATION = 'recipe_api_request_duration_seconds'
+HELP = {
+    REQUESTS: ('counter', 'Requests served by api views.'),
+    DURATION: ('histogram', 'Time spent serving api requests.'),
+}
+
+_HEADER = struct.Struct('Q')
+_KEY_LENGTH = struct.Struct('I')
+_VALUE = struct.Struct('d')
+INITIAL_SIZE = 64 * 1024
+# values of exited workers, added up by the gunicorn master
+ARCHIVE_NAME = 'archive.db'
+
+
+def _entries(buffer, used):
+    '''yield (key, value offset) of every value stored in a file buffer'''
+    position = _HEADER.size
+    while position < used:
+        length = _KEY_LENGTH.unpack_from(buffer, position)[0]
+        key_start = position + _KEY_LENGTH.size
+        key = bytes(buffer[key_start:key_start + length]).decode()
+        # values are 8 byte aligned
+        offset = (key_start + length + 7) & ~7
+        yield key, offset
+        position = offset + _VALUE.size
+
+
+class _Slot:
+    '''the offsets of the values written by one thread'''
+
+    __slots__ = ('offsets', '__weakref__')
+
+    def __init__(self, offsets):
+        self.offsets = offsets
+
+
+class MetricsFile:
+    '''the values written by one process, in a memory mapped file
+
+    every thread writes to its own slot, a set of values no other thread
+    touches, so adding to a value takes no lock. a key may therefore be
+    stored once per thread, readers add them up. the slot of an exited
+    thread is handed to the next new one, which keeps the file small when
+    threads come and go. only appending a value takes the lock, and an
+    entry is written completely before the header counting the used bytes
+    moves past it, so other processes can read the file at any time.
+    '''
+
+    def __init__(self, path):
+        self.pid = os.getpid()
+        self.path = path
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._file = open(path, 'a+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < INITIAL_SIZE:
+            self._file.truncate(INITIAL_SIZE)
+            size = INITIAL_SIZE
+        self._map = mmap.mmap(self._file.fileno(), size)
+        # maps replaced while growing, other threads may still write to them
+        self._old_maps = []
+        self._used = _HEADER.unpack_from(self._map, 0)[0] or _HEADER.size
+        # list append and pop are atomic, the values already in the file
+        # go to the first thread
+        self._free_slots = [dict(_entries(self._map, self._used))]
+
+    def _slot(self):
+        slot = getattr(self._local, 'slot', None)
+        if slot is None:
+            try:
+                offsets = self._free_slots.pop()
+            except IndexError:
+                offsets = {}
+            slot = self._local.slot = _Slot(offsets)
+            # called once the thread has exited and its locals are gone
+            weakref.finalize(slot, self._free_slots.append, offsets)
+        return slot
+
+    def _append(self, key):
+        encoded = key.encode()
+        with self._lock:
+            key_start = self._used + _KEY_LENGTH.size
+            offset = (key_start + len(encoded) + 7) & ~7
+            end = offset + _VALUE.size
+            if end > len(self._map):
+                self._grow(end)
+            _KEY_LENGTH.pack_into(self._map, self._used, len(encoded))
+            self._map[key_start:key_start + len(encoded)] = encoded
+            _VALUE.pack_into(self._map, offset, 0.0)
+            _HEADER.pack_into(self._map, 0, end)
+            self._used = end
+        return offset
+
+    def _grow(self, needed):
+        size = len(self._map)
+        while size < needed:
+            size *= 2
+        self._file.truncate(size)
+        # both maps share the pages of the file, writes to either are kept
+        self._old_maps.append(self._map)
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def add(self, key, amount):
+        '''add to a value of this thread, creating it at zero first'''
+        offsets = self._slot().offsets
+        offset = offsets.get(key)
+        if offset is None:
+            offset = offsets[key] = self._append(key)
+        buffer = self._map
+        value = _VALUE.unpack_from(buffer, offset)[0]
+        _VALUE.pack_into(buffer, offset, value + amount)
+
+    def close(self):
+        for buffer in self._old_maps + [self._map]:
+            buffer.close()
+        self._file.close()
+
+
+_writer_lock = threading.Lock()
+_process_writer = None
+
+
+def _writer():
+    '''return the metrics file of the current process'''
+    global _process_writer
+    writer = _process_writer
+    # a forked worker must not share the file of its parent
+    if writer is None or writer.pid != os.getpid() or \
+            os.path.dirname(writer.path) != settings.METRICS_DIR:
+        with _writer_lock:
+            if _process_writer is writer:
+                os.makedirs(settings.METRICS_DIR, exist_ok=True)
+                _process_writer = MetricsFile(os.path.join(
+                    settings.METRICS_DIR, f'{os.getpid()}.db'
+                ))
+            writer = _process_writer
+    return writer
+
+
+def _key(name, labels, suffix=''):
+    return json.dumps([name + suffix, labels], sort_keys=True)
+
+
+# keys of each label set, built once instead of on every request
+_request_keys = {}
+
+
+def _keys(viewset, action, status):
+    keys = _request_keys.get((viewset, action, status))
+    if keys is None:
+        labels = {'viewset': viewset, 'action': action, 'status': str(status)}
+        keys = _request_keys[viewset, action, status] = (
+            _key(REQUESTS, labels),
+            _key(DURATION, labels, '_sum'),
+            [
+                _key(DURATION, dict(labels, le=str(bound)), '_bucket')
+                for bound in BUCKETS + ('+Inf',)
+            ],
+        )
+    return keys
+
+
+def observe_request(viewset, action, status, seconds):
+    '''count one api request and its latency'''
+    writer = _writer()
+    requests, duration_sum, buckets = _keys(viewset, action, status)
+    writer.add(requests, 1)
+    writer.add(duration_sum, seconds)
+    writer.add(buckets[bisect.bisect_left(BUCKETS, seconds)], 1)
+
+
+def collect():
+    '''return every value summed over the files of all processes'''
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        for key, value in _read(path).items():
+            totals[key] += value
+    return totals
+
+
+def _read(path):
+    '''return the values stored in a metrics file, summed by key'''
+    with open(path, 'rb') as metrics_file:
+        buffer = metrics_file.read()
+    if len(buffer) < _HEADER.size:
+        return {}
+    used = min(_HEADER.unpack_from(buffer, 0)[0], len(buffer))
+    values = defaultdict(float)
+    # each thread stores its own copy of a key
+    for key, offset in _entries(buffer, used):
+        values[key] += _VALUE.unpack_from(buffer, offset)[0]
+    return values
+
+
+def mark_process_dead(pid):
+    '''fold the file of an exited worker into the archive
+
+    called by the gunicorn master only, so the archive has one writer and
+    the number of files stays at one per live worker.
+    '''
+    path = os.path.join(settings.METRICS_DIR, f'{pid}.db')
+    if not os.path.exists(path):
+        return
+    archive = MetricsFile(os.path.join(settings.METRICS_DIR, ARCHIVE_NAME))
+    try:
+        for key, value in _read(path).items():
+            archive.add(key, value)
+    finally:
+        archive.close()
+    os.remove(path)
+
+
+def clear():
+    '''delete the files of earlier runs, before any worker starts'''
+    for path in glob.glob(os.path.join(settings.METRICS_DIR, '*.db')):
+        os.remove(path)
+
+
+def _labels(labels):
+    return ','.join(
+        '{}="{}"'.format(
+            name,
+            str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in labels.items()
+    )
+
+
+def _number(value):
+    return repr(int(value)) if value == int(value) else repr(value)
+
+
+def _declare(name):
+    kind, text = HELP[name]
+    return [f'# HELP {name} {text}', f'# TYPE {name} {kind}']
+
+
+def exposition():
+    '''return all metrics in the prometheus text format'''
+    counters = {}
+    histograms = defaultdict(lambda: {'buckets': {}, 'sum': 0.0})
+    for key, value in collect().items():
+        name, labels = json.loads(key)
+        if name == REQUESTS:
+            counters[_labels(labels)] = value
+        elif name == DURATION + '_bucket':
+            bucket = labels.pop('le')
+            histograms[_labels(labels)]['buckets'][bucket] = value
+        elif name == DURATION + '_sum':
+            histograms[_labels(labels)]['sum'] = value
+
+    lines = _declare(REQUESTS) + [
+        f'{REQUESTS}{{{labels}}} {_number(value)}'
+        for labels, value in sorted(counters.items())
+    ] + _declare(DURATION)
+    for labels, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound in [str(bound) for bound in BUCKETS] + ['+Inf']:
+            cumulative += histogram['buckets'].get(bound, 0)
+            lines.append(
+                f'{DURATION}_bucket{{{labels},le="{bound}"}} '
+                f'{_number(cumulative)}'
+            )
+        lines.append(f'{DURATION}_sum{{{labels}}} {histogram["sum"]!r}')
+        lines.append(f'{DURATION}_count{{{labels}}} {_number(cumulative)}')
+    return '\n'.join(lines) + '\n'
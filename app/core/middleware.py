@@ -0,0 +1,394 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import reprlib
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.http import JsonResponse
+from django.utils import timezone
+from rest_framework.exceptions import AuthenticationFailed
+
+from core import metrics
+from core.authentication import CachedTokenAuthentication, \
+    SignedTokenAuthentication
+from core.db.router import read_from_replicas
+
+logger = logging.getLogger(__name__)
+
+# statements kept per request for the slow request log, later ones are
+# only counted
+STATEMENT_LIMIT = 200
+SLOW_LOG_STATEMENTS = 20
+# functions listed in an inline profile
+PROFILE_STATS_LIMIT = 60
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+_LIST_RE = re.compile(r'\(\?(?:, \?)+\)')
+_SPACE_RE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    '''return sql with its values replaced, so alike statements group'''
+    sql = _SPACE_RE.sub(' ', sql).strip()
+    sql = _LITERAL_RE.sub('?', sql)
+    return _LIST_RE.sub('(...)', sql)
+
+
+class RequestTimings:
+    '''the queries and time spent serving one request
+
+    installed as an execute wrapper on every connection, so queries are
+    timed without DEBUG and without django keeping its query log.
+    '''
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements = []
+        self.view_start = None
+        self.view_end = None
+        self.render_end = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.queries += 1
+            self.db_time += elapsed
+            if len(self.statements) < STATEMENT_LIMIT:
+                self.statements.append((sql, elapsed))
+
+    def rendered(self, response):
+        '''post render callback marking the end of rendering'''
+        self.render_end = time.perf_counter()
+
+    @property
+    def view_time(self):
+        '''seconds in the view, rest framework serializers run in here'''
+        if self.view_start is None or self.view_end is None:
+            return 0.0
+        return self.view_end - self.view_start
+
+    @property
+    def render_time(self):
+        '''seconds the renderer took to encode the serialized data'''
+        if self.view_end is None or self.render_end is None:
+            return 0.0
+        return self.render_end - self.view_end
+
+    def server_timing(self, total):
+        '''return the Server-Timing header value, durations in ms'''
+        return (
+            f'db;dur={self.db_time * 1000:.2f};desc="{self.queries} queries", '
+            f'view;dur={self.view_time * 1000:.2f}, '
+            f'render;dur={self.render_time * 1000:.2f}, '
+            f'total;dur={total * 1000:.2f}'
+        )
+
+    def grouped_statements(self):
+        '''return (normalized sql, count, seconds), slowest first'''
+        groups = {}
+        for sql, elapsed in self.statements:
+            group = groups.setdefault(normalize_sql(sql), [0, 0.0])
+            group[0] += 1
+            group[1] += elapsed
+        return sorted(
+            ((sql, count, elapsed) for sql, (count, elapsed) in
+             groups.items()),
+            key=lambda group: group[2], reverse=True
+        )
+
+
+class RequestTimingMiddleware:
+    '''time the database, view and rendering work of every request
+
+    adds a Server-Timing header and logs the normalized sql of requests
+    over REQUEST_QUERY_BUDGET queries or REQUEST_TIME_BUDGET ms. the view
+    time runs from the view being called until it returns its response and
+    includes the serializers, the render time is only the renderer
+    encoding their data. keep it ahead of every middleware that queries
+    the database, right after MetricsMiddleware, so their queries and time
+    are counted too.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = request.timings = RequestTimings()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings))
+            response = self.get_response(request)
+        total = time.perf_counter() - timings.start
+
+        if settings.REQUEST_SERVER_TIMING:
+            response['Server-Timing'] = timings.server_timing(total)
+        if timings.queries > settings.REQUEST_QUERY_BUDGET or \
+                total * 1000 > settings.REQUEST_TIME_BUDGET:
+            self._log_slow(request, response, timings, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # the other middleware are done, the view is called next
+        request.timings.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # the view has returned and its response is about to be rendered
+        request.timings.view_end = time.perf_counter()
+        response.add_post_render_callback(request.timings.rendered)
+        return response
+
+    def _log_slow(self, request, response, timings, total):
+        lines = [
+            f'{count:4}x {elapsed * 1000:8.2f}ms  {sql}'
+            for sql, count, elapsed in
+            timings.grouped_statements()[:SLOW_LOG_STATEMENTS]
+        ]
+        logger.warning(
+            'slow request %s %s %s: %.1fms, %d queries in %.1fms, '
+            'view %.1fms, render %.1fms\n%s',
+            request.method, request.path, response.status_code,
+            total * 1000, timings.queries, timings.db_time * 1000,
+            timings.view_time * 1000, timings.render_time * 1000,
+            '\n'.join(lines)
+        )
+
+
+class MetricsMiddleware:
+    '''count api requests and their latency by view, action and status
+
+    only requests routed to rest framework views are counted. keep it
+    first in MIDDLEWARE, the latency then covers all the other middleware
+    including RequestTimingMiddleware.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        view = getattr(request, 'metrics_view', None)
+        if view is not None:
+            metrics.observe_request(
+                view[0], view[1], response.status_code,
+                time.perf_counter() - start
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'cls', None)
+        if view_class is not None:
+            method = request.method.lower()
+            # viewsets map each method to an action, other views use it as is
+            actions = getattr(view_func, 'actions', None) or {}
+            request.metrics_view = (
+                view_class.__name__, actions.get(method, method)
+            )
+
+
+class ProfileLimiter:
+    '''allow one profiled request per interval in this process'''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next = 0.0
+
+    def acquire(self, interval):
+        '''return whether a profile may start now'''
+        with self._lock:
+            now = time.monotonic()
+            if now < self._next:
+                return False
+            self._next = now + interval
+            return True
+
+    def reset(self):
+        with self._lock:
+            self._next = 0.0
+
+
+profile_limiter = ProfileLimiter()
+
+
+class SqlTrace:
+    '''execute wrapper recording every statement of a profiled request'''
+
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.statements.append({
+                'sql': sql,
+                'params': reprlib.repr(params),
+                'ms': round((time.perf_counter() - start) * 1000, 3),
+            })
+
+
+def _token_user(request):
+    '''return the user of the api token a request carries, or None
+
+    api views authenticate inside the view, so middleware that needs the
+    user before then checks the token schemes they use itself.
+    '''
+    for authenticator in (
+            CachedTokenAuthentication(), SignedTokenAuthentication()):
+        try:
+            result = authenticator.authenticate(request)
+        except AuthenticationFailed:
+            return None
+        if result is not None:
+            return result[0]
+    return None
+
+
+def is_staff_request(request):
+    '''return whether a request is made by an active staff user
+
+    only called for requests asking to be profiled.
+    '''
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated and user.is_staff:
+        return True
+    user = _token_user(request)
+    if user is None:
+        return False
+    # signed tokens carry only the id, so read the flag from the db
+    return get_user_model().objects.filter(
+        pk=user.pk, is_active=True, is_staff=True
+    ).exists()
+
+
+class ProfilingMiddleware:
+    '''profile single requests of staff users on demand
+
+    a request with an X-Profile header or a profile query parameter is run
+    under cProfile with every sql statement recorded. `inline` returns the
+    profile and sql as json instead of the response; other values save
+    them to PROFILE_DIR and name the files in the X-Profile response
+    header. at most one request per PROFILE_MIN_INTERVAL seconds is
+    profiled in each process, the others are served as usual.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.META.get('HTTP_X_PROFILE') or \
+            request.GET.get('profile')
+        if not mode or not is_staff_request(request):
+            return self.get_response(request)
+        if not profile_limiter.acquire(settings.PROFILE_MIN_INTERVAL):
+            response = self.get_response(request)
+            response['X-Profile'] = 'skipped'
+            return response
+
+        trace = SqlTrace()
+        profiler = cProfile.Profile()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(trace))
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+
+        if mode == 'inline' or not settings.PROFILE_DIR:
+            return self._inline(response, profiler, trace)
+        response['X-Profile'] = self._save(request, profiler, trace)
+        return response
+
+    def _inline(self, response, profiler, trace):
+        stats = io.StringIO()
+        pstats.Stats(profiler, stream=stats).sort_stats(
+            'cumulative'
+        ).print_stats(PROFILE_STATS_LIMIT)
+        return JsonResponse({
+            'status': response.status_code,
+            'profile': stats.getvalue(),
+            'sql': trace.statements,
+        })
+
+    def _save(self, request, profiler, trace):
+        '''write the profile and sql trace, return their base name'''
+        name = '{}-{}-{}'.format(
+            timezone.now().strftime('%Y%m%d-%H%M%S'),
+            request.method.lower(),
+            uuid.uuid4().hex[:8],
+        )
+        os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+        base = os.path.join(settings.PROFILE_DIR, name)
+        profiler.dump_stats(f'{base}.prof')
+        with open(f'{base}.sql.json', 'w') as sql_file:
+            json.dump({
+                'method': request.method,
+                'path': request.get_full_path(),
+                'sql': trace.statements,
+            }, sql_file, indent=2)
+        return name
+
+
+def _pin_key(user_id):
+    return f'db:pin:{user_id}'
+
+
+def _request_user_id(request):
+    '''return the id of the user a request is made by, or None'''
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        user = _token_user(request)
+    return user.pk if user is not None else None
+
+
+class ReplicaMiddleware:
+    '''read from the replicas for safe requests
+
+    a user who sent a write reads from the primary for the next
+    REPLICA_PIN_SECONDS, from every session and token, so they always see
+    their own changes even while the replicas lag behind. the pins are
+    kept in the default cache, which must be shared by all workers for
+    them to hold across processes.
+    '''
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        if request.method not in SAFE_METHODS:
+            response = self.get_response(request)
+            # set by the view once it has authenticated the request
+            user = getattr(request, 'user', None)
+            if user is not None and user.is_authenticated:
+                cache.set(
+                    _pin_key(user.pk), True, settings.REPLICA_PIN_SECONDS
+                )
+            return response
+        user_id = _request_user_id(request)
+        if user_id is not None and cache.get(_pin_key(user_id)):
+            return self.get_response(request)
+        with read_from_replicas():
+            return self.get_response(request)
@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.db.models.functions import Lower
+
+MODELS = (
+    ('Tag', 'tags', 'tag_id'),
+    ('Ingredient', 'ingredients', 'ingredient_id'),
+)
+
+
+def _duplicates(model):
+    '''map each duplicate id to the oldest id with the same user and name'''
+    survivors, duplicates = {}, {}
+    rows = model.objects.filter(user__isnull=False).annotate(
+        lower_name=Lower('name')
+    ).order_by('pk').values_list('pk', 'user_id', 'lower_name')
+    for pk, user_id, lower_name in rows.iterator():
+        survivor = survivors.setdefault((user_id, lower_name), pk)
+        if survivor != pk:
+            duplicates.setdefault(survivor, []).append(pk)
+    return duplicates
+
+
+def collapse_duplicates(apps, schema_editor):
+    '''merge same named tags and ingredients of a user into the oldest one'''
+    Recipe = apps.get_model('core', 'Recipe')
+    for model_name, field, column in MODELS:
+        model = apps.get_model('core', model_name)
+        through = getattr(Recipe, field).through
+        for survivor, duplicate_ids in _duplicates(model).items():
+            linked = set(through.objects.filter(
+                **{column: survivor}
+            ).values_list('recipe_id', flat=True))
+            moved, dropped = [], []
+            for pk, recipe_id in through.objects.filter(
+                **{f'{column}__in': duplicate_ids}
+            ).values_list('pk', 'recipe_id'):
+                # a recipe may already link the survivor or another copy
+                if recipe_id in linked:
+                    dropped.append(pk)
+                else:
+                    linked.add(recipe_id)
+                    moved.append(pk)
+            through.objects.filter(pk__in=dropped).delete()
+            through.objects.filter(pk__in=moved).update(**{column: survivor})
+            model.objects.filter(pk__in=duplicate_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_user_token_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(collapse_duplicates, migrations.RunPython.noop),
+    ]
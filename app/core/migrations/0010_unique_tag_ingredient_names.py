@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    '''kept apart from 0009 because postgres cannot build an index on a
+    table with pending constraint triggers in the same transaction'''
+
+    dependencies = [
+        ('core', '0009_collapse_duplicate_names'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_tag_user_id_lower_name_uniq '
+            'ON core_tag (user_id, lower(name));',
+            'DROP INDEX core_tag_user_id_lower_name_uniq;',
+        ),
+        migrations.RunSQL(
+            'CREATE UNIQUE INDEX core_ingredient_user_id_lower_name_uniq '
+            'ON core_ingredient (user_id, lower(name));',
+            'DROP INDEX core_ingredient_user_id_lower_name_uniq;',
+        ),
+    ]
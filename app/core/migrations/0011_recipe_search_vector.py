@@ -0,0 +1,62 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:34
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+BACKFILL_SEARCH_VECTORS_SQL = '''
+UPDATE core_recipe AS r SET search_vector =
+    setweight(to_tsvector('english', r.title), 'A') ||
+    setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(t.name, ' ')
+        FROM core_tag t
+        JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = r.id
+    ), '')), 'B') ||
+    setweight(to_tsvector('english', coalesce((
+        SELECT string_agg(i.name, ' ')
+        FROM core_ingredient i
+        JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = r.id
+    ), '')), 'B')
+'''
+
+
+def create_trigram_index(apps, schema_editor):
+    '''index titles for typo tolerant search when pg_trgm can be installed'''
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'"
+        )
+        if cursor.fetchone() is None:
+            return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX core_recipe_title_trgm '
+        'ON core_recipe USING gin (title gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    schema_editor.execute('DROP INDEX IF EXISTS core_recipe_title_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_unique_tag_ingredient_names'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='core_recipe_search__c01407_gin'),
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        migrations.RunSQL(BACKFILL_SEARCH_VECTORS_SQL, migrations.RunSQL.noop),
+    ]
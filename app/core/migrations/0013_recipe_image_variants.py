@@ -0,0 +1,19 @@
+# Generated by Django 2.1.15 on 2026-10-18 18:41
+
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_ownership_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants',
+            field=django.contrib.postgres.fields.jsonb.JSONField(default=dict, editable=False),
+        ),
+    ]
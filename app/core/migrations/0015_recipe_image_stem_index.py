@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_image_blob'),
+    ]
+
+    operations = [
+        # image names without their extension, probed by gc_recipe_images
+        # for each batch of files it finds on disk
+        migrations.RunSQL(
+            "CREATE INDEX core_recipe_image_stem_idx "
+            "ON core_recipe (regexp_replace(image, '\\.[^./]*$', ''));",
+            'DROP INDEX core_recipe_image_stem_idx;',
+        ),
+    ]
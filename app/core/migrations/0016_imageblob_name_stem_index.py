@@ -0,0 +1,18 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_recipe_image_stem_index'),
+    ]
+
+    operations = [
+        # stored names without their extension, probed by gc_recipe_images
+        # for the content addressed files of each batch
+        migrations.RunSQL(
+            "CREATE INDEX core_imageblob_name_stem_idx "
+            "ON core_imageblob (regexp_replace(name, '\\.[^./]*$', ''));",
+            'DROP INDEX core_imageblob_name_stem_idx;',
+        ),
+    ]
@@ -1,13 +1,21 @@
+from django.contrib.postgres.fields import JSONField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import F
 import uuid
 import os
+from django.contrib.auth.hashers import check_password
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, \
                                         PermissionsMixin
 from django.conf import settings
 
+from core.storage import recipe_image_storage
+
 def recipe_image_file_path(instance, filename):
     '''Generate file path for new recipe image'''
     ext = filename.split('.')[-1] #return extension of file name
+    # recipe_image_storage swaps the uuid for a hash of the content
     filename = f'{uuid.uuid4()}.{ext}'
 
     # join
@@ -42,12 +50,35 @@ class User(AbstractBaseUser, PermissionsMixin):
     name = models.CharField(max_length=255)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # signed refresh tokens carrying an older version are rejected
+    token_version = models.PositiveIntegerField(default=0)
 
     # assign user manager to objects attribute
     objects = UserManager()
 
     USERNAME_FIELD = 'email' #making the default email instead of username
 
+    def set_password(self, raw_password):
+        '''set the password and revoke outstanding signed refresh tokens'''
+        super().set_password(raw_password)
+        self.token_version += 1
+
+    def check_password(self, raw_password):
+        '''check a password, upgrading an outdated hash in place
+
+        the upgrade stores the same password again, so it keeps the token
+        version: tokens issued on this login must still refresh.
+        '''
+        def upgrade(raw_password):
+            super(User, self).set_password(raw_password)
+            self._password = None
+            self.save(update_fields=['password'])
+
+        return check_password(raw_password, self.password, upgrade)
+
+# tag and ingredient names are unique per user ignoring case, enforced by
+# (user_id, lower(name)) indexes created in migration 0010
+
 class Tag(models.Model):
     '''Tag to be used for a recipe'''
     name = models.CharField(max_length=255)
@@ -57,6 +88,14 @@ class Tag(models.Model):
         on_delete=models.CASCADE,
     )
 
+    class Meta:
+        # serves the per user list ordered by (-name, -id)
+        indexes = [
+            models.Index(
+                fields=['user', 'name', 'id'], name='core_tag_user_name_id_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -68,6 +107,15 @@ class Ingredient(models.Model):
         on_delete=models.CASCADE
     )
 
+    class Meta:
+        # serves the per user list ordered by (-name, -id)
+        indexes = [
+            models.Index(
+                fields=['user', 'name', 'id'],
+                name='core_ingr_user_name_id_idx'
+            ),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -85,10 +133,79 @@ class Recipe(models.Model):
     # add ingredient and tags
     ingredients = models.ManyToManyField('Ingredient')
     tags = models.ManyToManyField('Tag')
-    image = models.ImageField(null=True, upload_to=recipe_image_file_path)
+    # stored once per distinct content, see core.storage
+    image = models.ImageField(
+        null=True,
+        upload_to=recipe_image_file_path,
+        storage=recipe_image_storage
+    )
+    # width -> format -> storage name, filled in by recipe.thumbnails
+    image_variants = JSONField(default=dict, editable=False)
+    # validator for conditional GETs, also touched when links change
+    updated_at = models.DateTimeField(auto_now=True)
+    # title plus tag and ingredient names, kept current by recipe.signals
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            GinIndex(fields=['search_vector']),
+            # per user list ordered by -id, and its max(updated_at) etag
+            models.Index(fields=['user', 'id'], name='core_recipe_user_id_idx'),
+            models.Index(
+                fields=['user', 'updated_at'],
+                name='core_recipe_user_updated_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # remembered so a save can tell whether the image reference moved
+        if 'image' in instance.__dict__:
+            instance._stored_image = instance.__dict__['image'] or None
+        return instance
+
+
+class ImageBlobManager(models.Manager):
+
+    def retain(self, name):
+        '''count one more reference to a stored file'''
+        if not name:
+            return
+        blob, created = self.get_or_create(
+            name=name, defaults={'ref_count': 1}
+        )
+        if not created:
+            self.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+
+    def release(self, name):
+        '''count one reference less, forgetting files nothing uses
+
+        the file itself is left on disk: a concurrent upload of the same
+        content may be about to reuse it. `gc_recipe_images` removes files
+        once they are no longer counted.
+        '''
+        if not name:
+            return
+        # concurrent releases must not take the count below zero
+        self.filter(name=name, ref_count__gt=0).update(
+            ref_count=F('ref_count') - 1
+        )
+        self.filter(name=name, ref_count__lte=0).delete()
+
+
+class ImageBlob(models.Model):
+    '''a content addressed file and the number of rows referring to it'''
+    name = models.CharField(max_length=255, unique=True)
+    ref_count = models.PositiveIntegerField(default=0)
+
+    objects = ImageBlobManager()
+
+    def __str__(self):
+        return self.name
+
 
 
@@ -0,0 +1,47 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from core.authentication import token_cache
+from core.models import ImageBlob, Recipe
+
+
+@receiver(post_delete, sender=Token)
+def forget_deleted_token(sender, instance, **kwargs):
+    '''stop accepting a deleted token from the cache'''
+    token_cache.discard(instance.key)
+
+
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def forget_user_tokens(sender, instance, **kwargs):
+    '''drop cached tokens whenever a user changes
+
+    this covers deactivation and password changes, and keeps the cached
+    user from going stale after any other edit.
+    '''
+    token_cache.discard_user(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+def count_image_references(sender, instance, created, **kwargs):
+    '''move the stored file reference when a recipe image changes'''
+    if created:
+        stored = None
+    elif hasattr(instance, '_stored_image'):
+        stored = instance._stored_image
+    else:
+        # loaded without its image column, so the image was not edited
+        return
+    current = instance.image.name or None
+    if stored != current:
+        ImageBlob.objects.retain(current)
+        ImageBlob.objects.release(stored)
+    instance._stored_image = current
+
+
+@receiver(post_delete, sender=Recipe)
+def release_image_reference(sender, instance, **kwargs):
+    '''drop the stored file reference of a deleted recipe'''
+    ImageBlob.objects.release(getattr(instance, '_stored_image', None))
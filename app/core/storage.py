@@ -0,0 +1,82 @@
+import hashlib
+import os
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.db.models import CharField, Func, Value
+from django.utils.deconstruct import deconstructible
+
+# thumbnail variants are named <image stem>_<width>w.<ext>
+VARIANT_RE = re.compile(r'_[0-9]+w$')
+
+# a content addressed name: two fan-out levels, then the full digest
+CONTENT_NAME_RE = re.compile(
+    r'(^|/)[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[^/]*)?$'
+)
+
+
+def content_name(directory, digest, ext):
+    '''return the sharded name of a file with the given sha256 digest'''
+    return '/'.join((directory, digest[:2], digest[2:4], digest + ext))
+
+
+def is_content_name(name):
+    '''return whether a stored name is already content addressed'''
+    return bool(CONTENT_NAME_RE.search(name or ''))
+
+
+def image_stems(name):
+    '''return the stems of the recipe images a stored file could belong to
+
+    thumbnail variants are stored as <image stem>_<width>w.<ext>, so a
+    file belongs to the image with its own stem or, for a variant, the
+    stem without the width suffix.
+    '''
+    stem = os.path.splitext(name)[0]
+    return {stem, VARIANT_RE.sub('', stem)}
+
+
+class ImageStem(Func):
+    '''an image name without its extension, see core_recipe_image_stem_idx'''
+    function = 'regexp_replace'
+    output_field = CharField()
+
+    def __init__(self, expression, **extra):
+        super().__init__(
+            expression, Value('\\.[^./]*$'), Value(''), **extra
+        )
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    '''store each distinct file once under the sha256 of its content
+
+    the name asked for only supplies the directory and extension. files
+    are spread over two levels of 256 sub directories so no directory
+    grows past a few thousand entries, and saving content that is already
+    stored writes nothing and returns the existing name. references to
+    each name are counted by `core.models.ImageBlob`.
+    '''
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        directory, filename = os.path.split(name)
+        ext = os.path.splitext(filename)[1].lower()
+        name = content_name(directory, digest.hexdigest(), ext)
+        if self.exists(name):
+            # a fresh mtime tells gc_recipe_images the file is in use again
+            os.utime(self.path(name))
+            return name
+
+        # write under a unique name and rename it into place, so readers
+        # and concurrent uploads of the same content never see a partial
+        # file and never fall back to a suffixed name
+        partial = super()._save(f'{name}.{uuid.uuid4().hex}.part', content)
+        os.replace(self.path(partial), self.path(name))
+        return name
+
+
+recipe_image_storage = ContentAddressedStorage()
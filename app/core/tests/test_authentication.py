@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import TokenCache, token_cache
+
+ME_URL = reverse('user:me')
+
+
+class CachedTokenAuthenticationTests(TestCase):
+    '''test the cached token authentication'''
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_cached_token_skips_lookup(self):
+        '''test a repeated request does not look the token up again'''
+        self.client.get(ME_URL)
+
+        with self.assertNumQueries(0):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_deleted_token_rejected(self):
+        '''test a deleted token stops working immediately'''
+        self.client.get(ME_URL)
+
+        self.token.delete()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_rejected(self):
+        '''test deactivating a user revokes their cached token'''
+        self.client.get(ME_URL)
+
+        self.user.is_active = False
+        self.user.save()
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_password_change_refreshes_cached_user(self):
+        '''test a password change drops the cached user'''
+        self.client.get(ME_URL)
+
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        self.assertIsNone(token_cache.get(self.token.key))
+
+    def test_cache_evicts_least_recent(self):
+        '''test the cache keeps at most max_size entries'''
+        cache = TokenCache(max_size=2, ttl=60)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, (self.user, None))
+
+        self.assertIsNone(cache.get('a'))
+        self.assertIsNotNone(cache.get('c'))
+
+    def test_cache_entries_expire(self):
+        '''test entries older than the ttl are not returned'''
+        cache = TokenCache(max_size=2, ttl=-1)
+        cache.set('a', (self.user, None))
+
+        self.assertIsNone(cache.get('a'))
@@ -1,27 +1,133 @@
 # mock behavior of django get db
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
 from unittest.mock import patch
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.signals import request_finished, request_started
+from django.db import close_old_connections, connection
 from django.db.utils import OperationalError
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from rest_framework.authtoken.models import Token
 
-# command thrown when the db is not available
+from core.management.commands.bench_api import route_names
+from core.management.commands.seed_data import SEED_DOMAIN, SEED_PASSWORD
+from core.models import Recipe, Tag
+from core.warmup import warm_up_worker
+
+# raised by the connection while the db is not available
+CONNECT = 'django.db.backends.base.base.BaseDatabaseWrapper.ensure_connection'
 
 class CommandTests(TestCase):
 
     def test_wait_for_db_ready(self):
         '''test waiting for when the db is available'''
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
-            # mock behavior of a function
-            gi.return_value = True
-            call_command('wait_for_db')
-            self.assertEqual(gi.call_count, 1) #to check how many times func is called
+        with patch(CONNECT) as ec:
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(ec.call_count, 1) #to check how many times func is called
 
     @patch('time.sleep', return_value=True)
     def test_wait_for_db(self, ts):
         '''test waiting for db'''
-        with patch('django.db.utils.ConnectionHandler.__getitem__') as gi:
+        with patch(CONNECT) as ec:
             # create side effect to function we r mocking
-            gi.side_effect = [OperationalError] * 5 + [True] #5 times, it will raise operational error and the 6th time it returns
-            self.assertEqual(gi.call_count, 0)
-        
-        
+            ec.side_effect = [OperationalError] * 5 + [None] #5 times, it will raise operational error and the 6th time it returns
+            call_command('wait_for_db', stdout=StringIO())
+            self.assertEqual(ec.call_count, 6)
+
+        # the wait doubles after each attempt up to the maximum
+        waits = [call[0][0] for call in ts.call_args_list]
+        self.assertEqual(waits, [0.5, 1, 2, 4, 5])
+
+    @patch('time.sleep', return_value=True)
+    def test_wait_for_db_timeout(self, ts):
+        '''test giving up once the timeout has passed'''
+        with patch(CONNECT, side_effect=OperationalError):
+            with self.assertRaises(CommandError):
+                call_command('wait_for_db', timeout=0, stdout=StringIO())
+        ts.assert_not_called()
+
+    def test_warm_up_worker_keeps_connection(self):
+        '''test the warmed up connection is left to CONN_MAX_AGE'''
+        with patch.object(connection, 'close') as close, \
+                patch.object(
+                    connection, 'close_if_unusable_or_obsolete'
+                ) as close_obsolete:
+            warm_up_worker()
+
+        close.assert_not_called()
+        close_obsolete.assert_called_once_with()
+
+    def test_warm_up_worker_closes_connection(self):
+        '''test threaded workers close the warm up thread's connection'''
+        with patch.object(connection, 'close') as close:
+            warm_up_worker(keep_connection=False)
+
+        close.assert_called_once_with()
+
+    def test_wait_for_db_warm_up(self):
+        '''test warming up the hot tables once the db is available'''
+        out = StringIO()
+        call_command('wait_for_db', warm_up=True, stdout=out)
+
+        self.assertIn('Warmed up', out.getvalue())
+
+
+class SeedAndBenchmarkTests(TestCase):
+    '''test seeding sample data and load testing the api with it'''
+
+    def setUp(self):
+        call_command(
+            'seed_data', users=2, tags=25, ingredients=10, recipes=6,
+            stdout=StringIO()
+        )
+
+    def test_seed_data(self):
+        '''test seeded users get linked and indexed recipes'''
+        users = get_user_model().objects.filter(
+            email__endswith=f'@{SEED_DOMAIN}'
+        )
+        self.assertEqual(users.count(), 2)
+        user = users.first()
+        self.assertTrue(user.check_password(SEED_PASSWORD))
+        self.assertTrue(Token.objects.filter(user=user).exists())
+        self.assertEqual(Tag.objects.filter(user=user).count(), 25)
+        # names past the word list are numbered to stay unique
+        self.assertTrue(Tag.objects.filter(user=user, name='Vegan 2'))
+        recipes = Recipe.objects.filter(user=user)
+        self.assertEqual(recipes.count(), 6)
+        self.assertFalse(recipes.filter(search_vector__isnull=True))
+        self.assertTrue(recipes.filter(tags__isnull=False))
+        self.assertFalse(recipes.exclude(tags__user=user).filter(
+            tags__isnull=False
+        ))
+
+    def test_bench_api_covers_every_route(self):
+        '''test the load test sends a request to every api route'''
+        # the test transaction must keep its connection between requests
+        request_started.disconnect(close_old_connections)
+        request_finished.disconnect(close_old_connections)
+        self.addCleanup(request_started.connect, close_old_connections)
+        self.addCleanup(request_finished.connect, close_old_connections)
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        output = os.path.join(media_root, 'results.json')
+
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command(
+                'bench_api', requests=1, concurrency=1, output=output,
+                stdout=StringIO()
+            )
+
+        with open(output) as results_file:
+            results = json.load(results_file)['results']
+        self.assertEqual(
+            {result['route'] for result in results}, route_names()
+        )
+        for result in results:
+            self.assertEqual(result['errors'], 0, result['label'])
+            self.assertEqual(result['requests'], 1)
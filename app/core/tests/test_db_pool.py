@@ -0,0 +1,153 @@
+import threading
+from unittest.mock import patch
+
+from django.db import connection
+from django.test import SimpleTestCase
+
+from core.db.backends.postgresql_pool.base import DatabaseWrapper, _pools
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+class FakeConnection:
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    '''test sharing connections between threads'''
+
+    def setUp(self):
+        self.opened = []
+
+    def connect(self):
+        conn = FakeConnection()
+        self.opened.append(conn)
+        return conn
+
+    def test_reuse_idle_connection(self):
+        '''test a returned connection is handed out again'''
+        pool = ConnectionPool(self.connect)
+        conn = pool.checkout()
+        pool.checkin(conn)
+
+        self.assertIs(pool.checkout(), conn)
+        self.assertEqual(len(self.opened), 1)
+
+    def test_max_size(self):
+        '''test checkout waits for a free connection up to the timeout'''
+        pool = ConnectionPool(self.connect, max_size=2, timeout=0.05)
+        first = pool.checkout()
+        pool.checkout()
+
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+
+        threading.Timer(0.01, pool.checkin, [first]).start()
+        pool.timeout = 5
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(pool.size, 2)
+
+    @patch('core.db.pool.time.monotonic')
+    def test_recycle_old_connection(self, monotonic):
+        '''test connections past the maximum age are closed'''
+        monotonic.return_value = 100
+        pool = ConnectionPool(self.connect, max_age=60)
+        conn = pool.checkout()
+        pool.checkin(conn)
+
+        monotonic.return_value = 200
+        fresh = pool.checkout()
+
+        self.assertIsNot(fresh, conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.size, 1)
+
+    @patch('core.db.pool.time.monotonic')
+    def test_ping_idle_connection(self, monotonic):
+        '''test a long idle connection is checked and dropped if dead'''
+        monotonic.return_value = 100
+        pings = []
+
+        def is_alive(conn):
+            pings.append(conn)
+            return False
+
+        pool = ConnectionPool(
+            self.connect, ping_after=30, is_alive=is_alive
+        )
+        conn = pool.checkout()
+        pool.checkin(conn)
+
+        monotonic.return_value = 110
+        self.assertIs(pool.checkout(), conn)
+        self.assertEqual(pings, [])
+        pool.checkin(conn)
+
+        monotonic.return_value = 200
+        self.assertIsNot(pool.checkout(), conn)
+        self.assertEqual(pings, [conn])
+        self.assertEqual(pool.size, 1)
+
+    def test_dirty_connection_discarded(self):
+        '''test a connection left unusable is not reused'''
+        pool = ConnectionPool(self.connect, is_clean=lambda conn: False)
+        conn = pool.checkout()
+        pool.checkin(conn)
+
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.size, 0)
+
+    def test_failed_connect_frees_slot(self):
+        '''test a connection that fails to open leaves room for another'''
+        def connect():
+            raise OSError('refused')
+
+        pool = ConnectionPool(connect, max_size=1)
+        with self.assertRaises(OSError):
+            pool.checkout()
+
+        self.assertEqual(pool.size, 0)
+
+
+class PooledBackendTests(SimpleTestCase):
+    '''test the postgresql backend borrowing pooled connections'''
+
+    def setUp(self):
+        settings_dict = dict(
+            connection.settings_dict,
+            ENGINE='core.db.backends.postgresql_pool',
+            POOL={'MAX_SIZE': 2},
+        )
+        self.wrapper = DatabaseWrapper(settings_dict, alias=connection.alias)
+
+    def tearDown(self):
+        self.wrapper.close()
+        for key in [key for key in _pools if key[0] == connection.alias]:
+            _pools.pop(key).close_all()
+
+    def _backend_pid(self):
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('SELECT pg_backend_pid()')
+            return cursor.fetchone()[0]
+
+    def test_connection_returned_to_pool(self):
+        '''test closing the connection keeps it open for the next use'''
+        first = self._backend_pid()
+        self.wrapper.close()
+
+        self.assertEqual(self._backend_pid(), first)
+
+    def test_transaction_rolled_back_on_return(self):
+        '''test an open transaction is rolled back before reuse'''
+        self.wrapper.set_autocommit(False)
+        with self.wrapper.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY TABLE pool_probe (id int)')
+        self.wrapper.close()
+
+        with self.wrapper.cursor() as cursor:
+            cursor.execute("SELECT to_regclass('pool_probe')")
+            self.assertIsNone(cursor.fetchone()[0])
@@ -0,0 +1,214 @@
+import os
+import shutil
+import tempfile
+import threading
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core import metrics
+from core.models import Tag
+
+METRICS_URL = reverse('metrics')
+TAGS_URL = reverse('recipe:tag-list')
+ME_URL = reverse('user:me')
+
+
+class MetricsTests(TestCase):
+    '''test counting api requests across worker processes'''
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.metrics_dir)
+        setting = override_settings(
+            METRICS_DIR=self.metrics_dir, METRICS_TOKEN='metrics-secret',
+            METRICS_ALLOWED_IPS=[]
+        )
+        setting.enable()
+        self.addCleanup(setting.disable)
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    def test_requests_counted_by_view_action_and_status(self):
+        '''test requests are counted with their viewset action and status'''
+        self.client.get(TAGS_URL)
+        self.client.get(TAGS_URL)
+        self.client.post(TAGS_URL, {'name': ''})
+        self.client.get(ME_URL)
+
+        body = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer metrics-secret'
+        ).content.decode()
+
+        self.assertIn(
+            'recipe_api_requests_total{action="list",status="200",'
+            'viewset="TagViewSet"} 2', body
+        )
+        self.assertIn(
+            'recipe_api_requests_total{action="create",status="400",'
+            'viewset="TagViewSet"} 1', body
+        )
+        self.assertIn(
+            'recipe_api_requests_total{action="get",status="200",'
+            'viewset="ManageUserView"} 1', body
+        )
+        self.assertIn(
+            'recipe_api_request_duration_seconds_bucket{action="list",'
+            'status="200",viewset="TagViewSet",le="+Inf"} 2', body
+        )
+        self.assertIn(
+            'recipe_api_request_duration_seconds_count{action="list",'
+            'status="200",viewset="TagViewSet"} 2', body
+        )
+        self.assertNotIn('viewset="metrics"', body)
+
+    def test_histogram_buckets_cumulative(self):
+        '''test each bucket counts the requests at or under its bound'''
+        metrics.observe_request('TagViewSet', 'list', 200, 0.003)
+        metrics.observe_request('TagViewSet', 'list', 200, 0.2)
+        metrics.observe_request('TagViewSet', 'list', 200, 30)
+
+        body = metrics.exposition()
+
+        prefix = 'recipe_api_request_duration_seconds_bucket{action="list",' \
+            'status="200",viewset="TagViewSet",'
+        self.assertIn(prefix + 'le="0.005"} 1', body)
+        self.assertIn(prefix + 'le="0.1"} 1', body)
+        self.assertIn(prefix + 'le="0.25"} 2', body)
+        self.assertIn(prefix + 'le="10"} 2', body)
+        self.assertIn(prefix + 'le="+Inf"} 3', body)
+        self.assertIn(
+            'recipe_api_request_duration_seconds_sum{action="list",'
+            'status="200",viewset="TagViewSet"} 30.203', body
+        )
+
+    def test_values_summed_across_processes(self):
+        '''test the files written by forked workers are added together'''
+        metrics.observe_request('TagViewSet', 'list', 200, 0.01)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                metrics.observe_request('TagViewSet', 'list', 200, 0.01)
+                metrics.observe_request('TagViewSet', 'list', 200, 0.01)
+            finally:
+                os._exit(0)
+        os.waitpid(pid, 0)
+
+        self.assertEqual(len(os.listdir(self.metrics_dir)), 2)
+        self.assertIn(
+            'recipe_api_requests_total{action="list",status="200",'
+            'viewset="TagViewSet"} 3', metrics.exposition()
+        )
+
+    def test_threads_share_process_file(self):
+        '''test the threads of a process write to a single file'''
+        threads = [
+            threading.Thread(
+                target=metrics.observe_request,
+                args=('TagViewSet', 'list', 200, 0.01)
+            )
+            for _ in range(50)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(os.listdir(self.metrics_dir), [f'{os.getpid()}.db'])
+        self.assertIn(
+            'recipe_api_requests_total{action="list",status="200",'
+            'viewset="TagViewSet"} 50', metrics.exposition()
+        )
+
+    def test_thread_slots_reused(self):
+        '''test threads write their own values, kept for later threads'''
+        barrier = threading.Barrier(2)
+
+        def observe(wait):
+            metrics.observe_request('TagViewSet', 'list', 200, 0.01)
+            if wait:
+                barrier.wait()
+
+        # alive at the same time, so each writes to a slot of its own
+        threads = [
+            threading.Thread(target=observe, args=(True,)) for _ in range(2)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for _ in range(5):
+            thread = threading.Thread(target=observe, args=(False,))
+            thread.start()
+            thread.join()
+
+        path = os.path.join(self.metrics_dir, f'{os.getpid()}.db')
+        with open(path, 'rb') as metrics_file:
+            buffer = metrics_file.read()
+        used = metrics._HEADER.unpack_from(buffer, 0)[0]
+        keys = [key for key, _ in metrics._entries(buffer, used)]
+        self.assertEqual(len(keys), 2 * len(set(keys)))
+        self.assertIn(
+            'recipe_api_requests_total{action="list",status="200",'
+            'viewset="TagViewSet"} 7', metrics.exposition()
+        )
+
+    def test_dead_workers_archived(self):
+        '''test the files of exited workers are folded into one archive'''
+        metrics.observe_request('TagViewSet', 'list', 200, 0.01)
+        for _ in range(3):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    metrics.observe_request('TagViewSet', 'list', 200, 0.01)
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+            metrics.mark_process_dead(pid)
+
+        self.assertEqual(
+            sorted(os.listdir(self.metrics_dir)),
+            sorted([f'{os.getpid()}.db', metrics.ARCHIVE_NAME])
+        )
+        self.assertIn(
+            'recipe_api_requests_total{action="list",status="200",'
+            'viewset="TagViewSet"} 4', metrics.exposition()
+        )
+
+    def test_file_grows(self):
+        '''test a file is extended once its values no longer fit'''
+        for index in range(2000):
+            metrics.observe_request('TagViewSet', f'action{index}', 200, 1)
+
+        self.assertIn(
+            'recipe_api_requests_total{action="action1999",status="200",'
+            'viewset="TagViewSet"} 1', metrics.exposition()
+        )
+
+    def test_metrics_need_token(self):
+        '''test the metrics are hidden without the metrics token'''
+        res = self.client.get(METRICS_URL)
+        wrong = self.client.get(
+            METRICS_URL, HTTP_AUTHORIZATION='Bearer other-secret'
+        )
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(wrong.status_code, 404)
+
+    @override_settings(METRICS_TOKEN='', METRICS_ALLOWED_IPS=['10.0.0.1'])
+    def test_metrics_allowed_address(self):
+        '''test listed addresses read the metrics without a token'''
+        res = self.client.get(METRICS_URL, REMOTE_ADDR='10.0.0.1')
+        other = self.client.get(METRICS_URL)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(other.status_code, 404)
@@ -0,0 +1,157 @@
+import json
+import os
+import pstats
+import re
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import make_signed_tokens
+from core.middleware import normalize_sql, profile_limiter
+from core.models import Tag
+
+TAGS_URL = reverse('recipe:tag-list')
+
+SERVER_TIMING_RE = re.compile(
+    r'^db;dur=[0-9.]+;desc="(\d+) queries", view;dur=([0-9.]+), '
+    r'render;dur=([0-9.]+), total;dur=[0-9.]+$'
+)
+
+
+class RequestTimingMiddlewareTests(TestCase):
+    '''test timing the queries and rendering of each request'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        Tag.objects.create(user=self.user, name='Vegan')
+
+    def test_server_timing_header(self):
+        '''test responses report their query count and timings'''
+        res = self.client.get(TAGS_URL)
+
+        match = SERVER_TIMING_RE.match(res['Server-Timing'])
+        self.assertIsNotNone(match, res['Server-Timing'])
+        self.assertGreater(int(match.group(1)), 0)
+        self.assertGreater(float(match.group(2)), 0)
+        self.assertGreater(float(match.group(3)), 0)
+
+    @override_settings(REQUEST_SERVER_TIMING=False)
+    def test_server_timing_disabled(self):
+        '''test the header can be turned off'''
+        res = self.client.get(TAGS_URL)
+
+        self.assertNotIn('Server-Timing', res)
+
+    @override_settings(REQUEST_QUERY_BUDGET=0)
+    def test_over_budget_logged(self):
+        '''test a request over its query budget is logged with its sql'''
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(TAGS_URL)
+
+        self.assertEqual(len(logs.output), 1)
+        self.assertIn(f'slow request GET {TAGS_URL} 200', logs.output[0])
+        self.assertIn('FROM "core_tag"', logs.output[0])
+
+    def test_within_budget_not_logged(self):
+        '''test requests within their budgets are not logged'''
+        with self.assertRaises(AssertionError):
+            with self.assertLogs('core.middleware', 'WARNING'):
+                self.client.get(TAGS_URL)
+
+    def test_normalize_sql(self):
+        '''test values are replaced so alike statements group together'''
+        self.assertEqual(
+            normalize_sql(
+                'SELECT "t"."id" FROM "core_tag2" t\n  WHERE "t"."name" = '
+                "'it''s' AND id IN (%s, %s, %s) LIMIT 21"
+            ),
+            'SELECT "t"."id" FROM "core_tag2" t WHERE "t"."name" = ? '
+            'AND id IN (...) LIMIT ?'
+        )
+
+
+@override_settings(PROFILE_MIN_INTERVAL=60, PROFILE_DIR='')
+class ProfilingMiddlewareTests(TestCase):
+    '''test profiling single requests of staff users'''
+
+    def setUp(self):
+        profile_limiter.reset()
+        self.addCleanup(profile_limiter.reset)
+        self.client = APIClient()
+        self.staff = get_user_model().objects.create_user(
+            'staff@test.com', 'testpass', is_staff=True
+        )
+        self.user = get_user_model().objects.create_user(
+            'user@test.com', 'testpass'
+        )
+        Tag.objects.create(user=self.staff, name='Vegan')
+
+    def _get(self, user, **extra):
+        token = Token.objects.get_or_create(user=user)[0]
+        return self.client.get(
+            TAGS_URL, HTTP_AUTHORIZATION=f'Token {token.key}', **extra
+        )
+
+    def test_inline_profile(self):
+        '''test staff get the profile and sql trace instead of the body'''
+        res = self._get(self.staff, HTTP_X_PROFILE='inline')
+
+        self.assertEqual(res.status_code, 200)
+        data = res.json()
+        self.assertEqual(data['status'], 200)
+        self.assertIn('cumulative', data['profile'])
+        self.assertTrue(
+            any('"core_tag"' in query['sql'] for query in data['sql'])
+        )
+
+    def test_signed_token_staff_profiled(self):
+        '''test staff using signed tokens can profile too'''
+        access = make_signed_tokens(self.staff)['access']
+        res = self.client.get(
+            TAGS_URL, {'profile': 'inline'},
+            HTTP_AUTHORIZATION=f'Bearer {access}'
+        )
+
+        self.assertIn('profile', res.json())
+
+    def test_non_staff_not_profiled(self):
+        '''test the flag is ignored for other users'''
+        res = self._get(self.user, HTTP_X_PROFILE='inline')
+
+        self.assertNotIn('profile', res.json())
+        self.assertNotIn('X-Profile', res)
+
+    def test_rate_limited(self):
+        '''test only one request per interval is profiled'''
+        self._get(self.staff, HTTP_X_PROFILE='inline')
+        res = self._get(self.staff, HTTP_X_PROFILE='inline')
+
+        self.assertEqual(res['X-Profile'], 'skipped')
+        self.assertNotIn('profile', res.json())
+
+    def test_profile_saved(self):
+        '''test profiles are written to PROFILE_DIR'''
+        profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, profile_dir)
+
+        with override_settings(PROFILE_DIR=profile_dir):
+            res = self._get(self.staff, HTTP_X_PROFILE='1')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json()['results'][0]['name'], 'Vegan')
+        base = os.path.join(profile_dir, res['X-Profile'])
+        stats = pstats.Stats(f'{base}.prof')
+        self.assertTrue(stats.total_calls)
+        with open(f'{base}.sql.json') as sql_file:
+            self.assertTrue(json.load(sql_file)['sql'])
@@ -0,0 +1,159 @@
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import OperationalError, connections
+from django.test import SimpleTestCase, TransactionTestCase, \
+    override_settings
+from django.urls import reverse
+
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from core.authentication import make_signed_tokens
+from core.db.router import WeightedRoundRobin, replica_health
+from core.models import Tag
+
+TAGS_URL = reverse('recipe:tag-list')
+REPLICA = next(iter(settings.DATABASE_REPLICAS), None)
+
+
+class WeightedRoundRobinTests(SimpleTestCase):
+    '''test spreading reads over replicas by weight'''
+
+    def test_picks_follow_weights(self):
+        '''test aliases are picked in proportion and interleaved'''
+        balancer = WeightedRoundRobin({'a': 2, 'b': 1})
+
+        picks = [balancer.pick() for _ in range(6)]
+
+        self.assertEqual(picks, ['a', 'b', 'a', 'a', 'b', 'a'])
+
+    def test_excluded_aliases_skipped(self):
+        '''test excluded aliases are never picked'''
+        balancer = WeightedRoundRobin({'a': 5, 'b': 1})
+
+        self.assertEqual(balancer.pick(exclude={'a'}), 'b')
+        self.assertIsNone(balancer.pick(exclude={'a', 'b'}))
+
+
+@skipUnless(REPLICA, 'needs a replica database, see DB_REPLICAS')
+class ReplicaRoutingTests(TransactionTestCase):
+    '''test routing safe requests to a second local database'''
+    multi_db = True
+
+    def setUp(self):
+        cache.clear()
+        replica_health.reset()
+        self.addCleanup(replica_health.reset)
+        # the replica is not really replicating, so each database gets
+        # the same user and a tag of its own
+        self.user = get_user_model().objects.create_user(
+            'user@test.com', 'testpass'
+        )
+        get_user_model().objects.db_manager(REPLICA).create_user(
+            'user@test.com', 'testpass', pk=self.user.pk
+        )
+        Tag.objects.create(user=self.user, name='Primary')
+        Tag.objects.using(REPLICA).create(
+            user_id=self.user.pk, name='Replica'
+        )
+
+        token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+
+    def _tag_names(self):
+        res = self.client.get(TAGS_URL)
+        return [tag['name'] for tag in res.data['results']]
+
+    def test_reads_from_replica(self):
+        '''test safe requests read from the replica'''
+        self.assertEqual(self._tag_names(), ['Replica'])
+
+    def test_reads_own_writes(self):
+        '''test a client reads from the primary right after writing'''
+        res = self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(self._tag_names(), ['Vegan', 'Primary'])
+
+    @override_settings(REPLICA_PIN_SECONDS=0)
+    def test_pin_expires(self):
+        '''test reads return to the replica once the pin expires'''
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+
+        self.assertEqual(self._tag_names(), ['Replica'])
+
+    def test_other_tokens_of_user_pinned(self):
+        '''test a write pins every session and token of the user'''
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+        access = make_signed_tokens(self.user)['access']
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        res = other.get(TAGS_URL)
+
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']],
+            ['Vegan', 'Primary']
+        )
+
+    def test_other_users_not_pinned(self):
+        '''test a write pins only the user that sent it'''
+        other_user = get_user_model().objects.create_user(
+            'other@test.com', 'testpass'
+        )
+        get_user_model().objects.db_manager(REPLICA).create_user(
+            'other@test.com', 'testpass', pk=other_user.pk
+        )
+        Tag.objects.using(REPLICA).create(
+            user_id=other_user.pk, name='Replica'
+        )
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+        access = make_signed_tokens(other_user)['access']
+        other = APIClient()
+        other.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        res = other.get(TAGS_URL)
+
+        self.assertEqual(
+            [tag['name'] for tag in res.data['results']], ['Replica']
+        )
+
+    def test_replica_reads_not_cached(self):
+        '''test lists read from a replica are never cached'''
+        self._tag_names()
+        Tag.objects.using(REPLICA).filter(name='Replica').update(
+            name='Renamed'
+        )
+
+        self.assertEqual(self._tag_names(), ['Renamed'])
+
+    def test_primary_reads_cached(self):
+        '''test lists read from the primary while pinned are cached'''
+        self.client.post(TAGS_URL, {'name': 'Vegan'})
+        self._tag_names()
+        Tag.objects.filter(name='Vegan').update(name='Vegetarian')
+
+        self.assertEqual(self._tag_names(), ['Vegan', 'Primary'])
+
+    def test_unreachable_replica_falls_back(self):
+        '''test the primary serves reads while the replica is down'''
+        connect = 'django.db.backends.base.base.BaseDatabaseWrapper.connect'
+        # left open by setUp, as the test client keeps connections
+        connections[REPLICA].close()
+        with patch(connect, side_effect=OperationalError) as failing:
+            with self.assertLogs('core.db.router', 'WARNING'):
+                self.assertEqual(self._tag_names(), ['Primary'])
+            self.assertEqual(self._tag_names(), ['Primary'])
+
+        # tried once, then left alone until REPLICA_RETRY_AFTER
+        self.assertEqual(failing.call_count, 1)
+
+    @override_settings(DATABASE_REPLICAS={})
+    def test_no_replicas_configured(self):
+        '''test everything reads from the primary without replicas'''
+        self.assertEqual(self._tag_names(), ['Primary'])
@@ -0,0 +1,277 @@
+import os
+import time
+from io import StringIO
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import ImageBlob, Recipe
+from core.storage import is_content_name
+from recipe.tests.utils import TempMediaRootMixin
+from recipe.thumbnails import variant_name
+
+
+class ContentAddressedStorageTests(TempMediaRootMixin, TestCase):
+    '''test storing recipe images by content'''
+
+    def setUp(self):
+        super().setUp()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+
+    def sample_recipe(self, title='Toast'):
+        return Recipe.objects.create(
+            user=self.user, title=title, time_minutes=5, price=1.00
+        )
+
+    def test_image_stored_by_content(self):
+        '''test images are named after their content in shard dirs'''
+        recipe = self.sample_recipe()
+        recipe.image.save('Photo.JPG', ContentFile(b'toast'))
+
+        name = recipe.image.name
+        self.assertTrue(is_content_name(name))
+        self.assertTrue(name.startswith('upload/recipe/'))
+        self.assertTrue(name.endswith('.jpg'))
+        digest = os.path.basename(name)[:64]
+        self.assertEqual(name.split('/')[2:4], [digest[:2], digest[2:4]])
+
+    def test_duplicate_images_stored_once(self):
+        '''test the same content uploaded twice shares one file'''
+        first = self.sample_recipe()
+        second = self.sample_recipe('More toast')
+        first.image.save('a.jpg', ContentFile(b'toast'))
+        second.image.save('b.jpg', ContentFile(b'toast'))
+
+        self.assertEqual(first.image.name, second.image.name)
+        shard = os.path.dirname(first.image.path)
+        self.assertEqual(
+            os.listdir(shard), [os.path.basename(first.image.name)]
+        )
+        self.assertEqual(
+            ImageBlob.objects.get(name=first.image.name).ref_count, 2
+        )
+
+    def test_references_released(self):
+        '''test replacing and deleting images releases their references'''
+        first = self.sample_recipe()
+        second = self.sample_recipe('More toast')
+        first.image.save('a.jpg', ContentFile(b'toast'))
+        second.image.save('b.jpg', ContentFile(b'toast'))
+        shared = first.image.name
+
+        first.image.save('c.jpg', ContentFile(b'jam'))
+        self.assertEqual(ImageBlob.objects.get(name=shared).ref_count, 1)
+
+        Recipe.objects.get(pk=second.pk).delete()
+        self.assertFalse(ImageBlob.objects.filter(name=shared).exists())
+        self.assertEqual(
+            ImageBlob.objects.get(name=first.image.name).ref_count, 1
+        )
+
+    def test_saving_other_fields_keeps_count(self):
+        '''test saving a recipe without changing its image counts nothing'''
+        recipe = self.sample_recipe()
+        recipe.image.save('a.jpg', ContentFile(b'toast'))
+
+        loaded = Recipe.objects.get(pk=recipe.pk)
+        loaded.title = 'Buttered toast'
+        loaded.save()
+        Recipe.objects.only('id', 'title').get(pk=recipe.pk).save()
+
+        self.assertEqual(
+            ImageBlob.objects.get(name=recipe.image.name).ref_count, 1
+        )
+
+    def test_release_stops_at_zero(self):
+        '''test a release racing another one never goes below zero'''
+        ImageBlob.objects.create(name='upload/recipe/a.jpg', ref_count=0)
+
+        ImageBlob.objects.release('upload/recipe/a.jpg')
+
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_migrate_recipe_images(self):
+        '''test the command moves flat files into content storage'''
+        recipes = [
+            self.sample_recipe(f'Recipe {index}') for index in range(3)
+        ]
+        legacy_dir = os.path.join(self.media_root, 'upload', 'recipe')
+        os.makedirs(legacy_dir)
+        for index, recipe in enumerate(recipes):
+            name = f'upload/recipe/legacy-{index}.jpg'
+            with open(os.path.join(self.media_root, name), 'wb') as legacy:
+                legacy.write(b'same' if index < 2 else b'other')
+            Recipe.objects.filter(pk=recipe.pk).update(image=name)
+        missing = self.sample_recipe('Missing')
+        Recipe.objects.filter(pk=missing.pk).update(
+            image='upload/recipe/gone.jpg'
+        )
+
+        out = StringIO()
+        call_command(
+            'migrate_recipe_images', batch_size=2, stdout=out, stderr=out
+        )
+
+        names = [
+            Recipe.objects.get(pk=recipe.pk).image.name for recipe in recipes
+        ]
+        self.assertTrue(all(is_content_name(name) for name in names))
+        self.assertEqual(names[0], names[1])
+        self.assertNotEqual(names[0], names[2])
+        self.assertEqual(ImageBlob.objects.get(name=names[0]).ref_count, 2)
+        for index in range(3):
+            self.assertFalse(os.path.exists(
+                os.path.join(legacy_dir, f'legacy-{index}.jpg')
+            ))
+        self.assertIn('1 missing', out.getvalue())
+
+        # running again finds nothing left to move
+        out = StringIO()
+        call_command('migrate_recipe_images', stdout=out, stderr=out)
+        self.assertIn('Moved 0 images', out.getvalue())
+
+    def test_migrated_recipe_keeps_thumbnails(self):
+        '''test thumbnails move with their image and are still served'''
+        recipe = self.sample_recipe()
+        os.makedirs(os.path.join(self.media_root, 'upload', 'recipe'))
+        files = {
+            'upload/recipe/legacy.jpg': b'toast',
+            'upload/recipe/legacy_160w.webp': b'small',
+            'upload/recipe/legacy_160w.jpg': b'small jpeg',
+        }
+        for name, content in files.items():
+            with open(os.path.join(self.media_root, name), 'wb') as legacy:
+                legacy.write(content)
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image='upload/recipe/legacy.jpg',
+            image_variants={'160': {
+                'webp': 'upload/recipe/legacy_160w.webp',
+                'jpeg': 'upload/recipe/legacy_160w.jpg',
+            }}
+        )
+
+        call_command('migrate_recipe_images', stdout=StringIO())
+
+        recipe.refresh_from_db()
+        variant = recipe.image_variants['160']['webp']
+        self.assertEqual(
+            variant, variant_name(recipe.image.name, 160, 'webp')
+        )
+        client = APIClient()
+        client.force_authenticate(self.user)
+        res = client.get(reverse('media', args=[variant]))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(b''.join(res.streaming_content), b'small')
+        for name in files:
+            self.assertFalse(
+                os.path.exists(os.path.join(self.media_root, name))
+            )
+
+
+class GcRecipeImagesTests(TempMediaRootMixin, TestCase):
+    '''test deleting recipe image files nothing refers to'''
+
+    def setUp(self):
+        super().setUp()
+        user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.recipe = Recipe.objects.create(
+            user=user, title='Toast', time_minutes=5, price=1.00
+        )
+        self.recipe.image.save('a.jpg', ContentFile(b'toast'))
+        kept = os.path.splitext(self.recipe.image.name)[0]
+        self.kept = [
+            self.recipe.image.name,
+            f'{kept}_160w.webp',
+            'upload/recipe/legacy.jpg',
+        ]
+        Recipe.objects.create(
+            user=user, title='Jam', time_minutes=5, price=1.00,
+            image='upload/recipe/legacy.jpg'
+        )
+        self.orphans = [
+            'upload/recipe/00/11/' + '0' * 64 + '.jpg',
+            'upload/recipe/00/11/' + '0' * 64 + '_160w.webp',
+            'upload/recipe/replaced.png',
+        ]
+        for name in self.kept[1:] + self.orphans:
+            self._write(name)
+        for name in self.kept + self.orphans:
+            self._age(name, 7200)
+
+    def _path(self, name):
+        return os.path.join(self.media_root, name)
+
+    def _write(self, name):
+        os.makedirs(os.path.dirname(self._path(name)), exist_ok=True)
+        with open(self._path(name), 'wb') as stored:
+            stored.write(b'image')
+
+    def _age(self, name, seconds):
+        then = time.time() - seconds
+        os.utime(self._path(name), (then, then))
+
+    def _gc(self, **options):
+        out = StringIO()
+        call_command('gc_recipe_images', stdout=out, **options)
+        return out.getvalue()
+
+    def test_orphans_deleted(self):
+        '''test unreferenced files and their variants are deleted'''
+        self._gc(batch_size=2)
+
+        for name in self.kept:
+            self.assertTrue(os.path.exists(self._path(name)), name)
+        for name in self.orphans:
+            self.assertFalse(os.path.exists(self._path(name)), name)
+
+    def test_counted_files_kept(self):
+        '''test content addressed files are kept while they are counted'''
+        ImageBlob.objects.create(name=self.orphans[0], ref_count=1)
+        # a count gone to zero no longer keeps the file
+        self.recipe.image.save('b.jpg', ContentFile(b'jam'))
+        self._age(self.kept[0], 7200)
+
+        self._gc()
+
+        for name in self.orphans[:2]:
+            self.assertTrue(os.path.exists(self._path(name)), name)
+        self.assertFalse(os.path.exists(self._path(self.kept[0])))
+        self.assertFalse(os.path.exists(self._path(self.kept[1])))
+
+    def test_recent_files_kept(self):
+        '''test files newer than the minimum age are left alone'''
+        self._age(self.orphans[0], 60)
+
+        self._gc()
+
+        self.assertTrue(os.path.exists(self._path(self.orphans[0])))
+        self.assertFalse(os.path.exists(self._path(self.orphans[1])))
+
+    def test_dry_run(self):
+        '''test a dry run reports orphans without deleting them'''
+        out = self._gc(dry_run=True)
+
+        for name in self.orphans:
+            self.assertTrue(os.path.exists(self._path(name)))
+            self.assertIn(f'would delete {name}', out)
+        self.assertIn('Would delete 3 of 6 files', out)
+
+    @patch('core.management.commands.gc_recipe_images.time.sleep')
+    def test_rate_limited(self, sleep):
+        '''test deletions are spaced out to the maximum rate'''
+        self._gc(max_rate=0.5)
+
+        self.assertEqual(sleep.call_count, 2)
+        self.assertGreater(sleep.call_args[0][0], 1)
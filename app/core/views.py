@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.crypto import constant_time_compare
+
+from core.metrics import exposition
+
+
+def _metrics_allowed(request):
+    '''return whether a request may read the metrics'''
+    if settings.METRICS_TOKEN:
+        scheme, _, token = request.META.get(
+            'HTTP_AUTHORIZATION', ''
+        ).partition(' ')
+        if scheme.lower() == 'bearer' and \
+                constant_time_compare(token, settings.METRICS_TOKEN):
+            return True
+    return request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS
+
+
+def metrics(request):
+    '''serve the request metrics of all workers to prometheus'''
+    if not _metrics_allowed(request):
+        raise Http404
+    return HttpResponse(
+        exposition(), content_type='text/plain; version=0.0.4; charset=utf-8'
+    )
@@ -0,0 +1,84 @@
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, ProgrammingError, connections
+from django.urls import get_resolver
+from rest_framework.authtoken.models import Token
+
+from core.models import Recipe, Tag, Ingredient
+
+# load every block of the hot tables and their indexes into shared buffers
+PREWARM_SQL = '''
+SELECT coalesce(sum(pg_prewarm(rel)), 0) FROM (
+    SELECT unnest(%(tables)s::regclass[]) AS rel
+    UNION ALL
+    SELECT indexrelid::regclass FROM pg_index
+    WHERE indrelid = ANY(%(tables)s::regclass[])
+) AS hot
+'''
+
+
+def hot_tables():
+    '''return the tables read by nearly every api request'''
+    models = (
+        Recipe, Recipe.tags.through, Recipe.ingredients.through,
+        Tag, Ingredient, Token, get_user_model(),
+    )
+    return [model._meta.db_table for model in models]
+
+
+def warm_up_database(alias=DEFAULT_DB_ALIAS):
+    '''open a connection and pull the hot tables into the database cache
+
+    uses pg_prewarm when the extension is installed and otherwise reads
+    each table once, which at least fills the os page cache. returns the
+    number of blocks loaded, or None when the tables do not exist yet.
+    '''
+    connection = connections[alias]
+    tables = hot_tables()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_prewarm'"
+        )
+        prewarm = cursor.fetchone() is not None
+        try:
+            if prewarm:
+                cursor.execute(PREWARM_SQL, {'tables': tables})
+                return cursor.fetchone()[0]
+            blocks = 0
+            for table in tables:
+                cursor.execute(
+                    'SELECT count(*), pg_relation_size(%s) / '
+                    'current_setting(%s)::int FROM {}'.format(
+                        connection.ops.quote_name(table)
+                    ),
+                    [table, 'block_size']
+                )
+                blocks += cursor.fetchone()[1]
+            return blocks
+        except ProgrammingError:
+            # called before migrate has created the tables
+            return None
+
+
+def warm_up_worker(alias=DEFAULT_DB_ALIAS, keep_connection=True):
+    '''prepare a freshly forked server worker for its first request
+
+    imports every view through the url resolver and sends one query per
+    hot table, so the database session has its catalog caches in place.
+    connections are per thread: with `keep_connection` the session stays
+    open for requests served by this thread, until CONN_MAX_AGE runs out
+    (at once when it is 0, or back to the pool with the pool backend).
+    threaded workers serve requests on other threads, so they pass False
+    and the connection is closed.
+    '''
+    get_resolver().url_patterns
+    models = (Recipe, Tag, Ingredient, Token, get_user_model())
+    for model in models:
+        try:
+            model.objects.using(alias).filter(pk=0).exists()
+        except ProgrammingError:
+            # called before migrate has created the tables
+            break
+    if keep_connection:
+        connections[alias].close_if_unusable_or_obsolete()
+    else:
+        connections[alias].close()
@@ -0,0 +1,84 @@
+'''gunicorn settings for serving the api in production
+
+run `gunicorn` from this directory. the app is imported once by the
+master and shared copy-on-write with the forked workers. with more than
+one worker set CACHE_BACKEND to a cache they share, such as memcached,
+or the list cache and replica reads are turned off. SIGHUP restarts
+the workers with the same code; to deploy new code send USR2 to start a
+new master, then WINCH and QUIT to the old one once the new one is up.
+'''
+import gc
+import multiprocessing
+import os
+
+wsgi_app = 'app.wsgi:application'
+bind = os.environ.get('SERVER_BIND', '0.0.0.0:8000')
+
+workers = int(
+    os.environ.get('SERVER_WORKERS', multiprocessing.cpu_count() * 2 + 1)
+)
+threads = int(os.environ.get('SERVER_THREADS', 4))
+# gthread workers serve `threads` requests at once each
+worker_class = 'gthread' if threads > 1 else 'sync'
+preload_app = True
+
+timeout = int(os.environ.get('SERVER_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('SERVER_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('SERVER_KEEPALIVE', 5))
+# restart workers now and then so slow leaks never pile up, with jitter
+# so they do not all restart together
+max_requests = int(os.environ.get('SERVER_MAX_REQUESTS', 10000))
+max_requests_jitter = int(os.environ.get('SERVER_MAX_REQUESTS_JITTER', 1000))
+
+
+def _require_shared_cache(server):
+    '''turn off what a cache private to each worker would serve stale
+
+    a write bumps the list cache generation and pins its client to the
+    primary only in the worker that handled it, so with several workers
+    both need CACHE_BACKEND to name a cache they all share.
+    '''
+    from django.conf import settings
+
+    backend = settings.CACHES['default']['BACKEND']
+    if server.num_workers < 2 or not backend.endswith('.LocMemCache'):
+        return
+    server.log.warning(
+        'CACHE_BACKEND is local to each of the %d workers, serving lists '
+        'uncached and reads from the primary', server.num_workers
+    )
+    settings.RECIPE_LIST_CACHE_TIMEOUT = 0
+    settings.DATABASE_REPLICAS = {}
+
+
+def when_ready(server):
+    '''finish loading the master before the first fork'''
+    from django.db import connections
+    from core import metrics
+    from core.warmup import warm_up_database
+
+    # counters start again with the new master
+    metrics.clear()
+    _require_shared_cache(server)
+    # load the hot tables once for every worker, then drop the connection
+    # so no worker inherits its socket
+    warm_up_database()
+    connections.close_all()
+    # objects loaded so far are never collected, so the cycle collector
+    # in the workers does not write to, and copy, the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    '''warm up each worker before it accepts requests'''
+    from core.warmup import warm_up_worker
+
+    # sync workers serve requests on the thread warmed up here
+    warm_up_worker(keep_connection=threads == 1)
+
+
+def child_exit(server, worker):
+    '''keep the counts of an exited worker without keeping its file'''
+    from core import metrics
+
+    metrics.mark_process_dead(worker.pid)
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class RecipeConfig(AppConfig):
     name = 'recipe'
+
+    def ready(self):
+        # connect the cache invalidation receivers
+        from recipe import signals  # noqa: F401
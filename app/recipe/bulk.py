@@ -0,0 +1,204 @@
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Lower
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.cache import bump_generation
+from recipe.search import update_search_vectors
+from recipe.serializers import RecipeBulkItemSerializer
+
+BATCH_SIZE = 1000
+RELATIONS = (
+    ('tags', Recipe.tags.through, 'tag_id'),
+    ('ingredients', Recipe.ingredients.through, 'ingredient_id'),
+)
+
+
+def _referenced_ids(items, field):
+    '''collect the integer ids an input batch refers to in a field'''
+    ids = set()
+    for item in items:
+        values = item.get(field) if isinstance(item, dict) else None
+        if field == 'id':
+            values = [values]
+        if not isinstance(values, list):
+            continue
+        for value in values:
+            try:
+                ids.add(int(value))
+            except (TypeError, ValueError):
+                pass
+    return ids
+
+
+def _owned_ids(user, items):
+    '''load which referenced ids belong to the user, one query per model'''
+    owned = {}
+    for field, model in (
+        ('recipes', Recipe), ('tags', Tag), ('ingredients', Ingredient)
+    ):
+        ids = _referenced_ids(items, 'id' if field == 'recipes' else field)
+        owned[field] = set(
+            model.objects.filter(user=user, pk__in=ids).values_list(
+                'pk', flat=True
+            )
+        ) if ids else set()
+    return owned
+
+
+def validate_recipes(user, items, context):
+    '''return the validated items and a list of per item errors'''
+    if not isinstance(items, list):
+        raise ValidationError('Expected a list of recipes.')
+    if len(items) > settings.RECIPE_BULK_MAX_ITEMS:
+        raise ValidationError(
+            f'At most {settings.RECIPE_BULK_MAX_ITEMS} recipes per request.'
+        )
+
+    context = {**context, 'owned': _owned_ids(user, items)}
+    validated, errors = [], []
+    updated = set()
+    for index, item in enumerate(items):
+        serializer = RecipeBulkItemSerializer(
+            data=item,
+            context=context,
+            # updates only change the fields they send
+            partial=isinstance(item, dict) and 'id' in item
+        )
+        if not serializer.is_valid():
+            errors.append({'index': index, 'errors': serializer.errors})
+            continue
+        recipe_id = serializer.validated_data.get('id')
+        if recipe_id is not None:
+            # links are replaced in one pass for the batch, so a repeated
+            # id would insert its links twice
+            if recipe_id in updated:
+                errors.append({'index': index, 'errors': {'id': [
+                    f'Recipe "{recipe_id}" is updated more than once.'
+                ]}})
+                continue
+            updated.add(recipe_id)
+        validated.append(serializer.validated_data)
+    return validated, errors
+
+
+def _update_fields(user, updates, now):
+    '''write the scalar fields of updated recipes with CASE statements'''
+    for start in range(0, len(updates), BATCH_SIZE):
+        batch = updates[start:start + BATCH_SIZE]
+        values = {}
+        for field in ('title', 'time_minutes', 'price', 'link'):
+            whens = [
+                When(pk=data['id'], then=Value(data[field]))
+                for data in batch if field in data
+            ]
+            if whens:
+                values[field] = Case(
+                    *whens,
+                    default=F(field),
+                    output_field=Recipe._meta.get_field(field)
+                )
+        Recipe.objects.filter(
+            user=user, pk__in=[data['id'] for data in batch]
+        ).update(updated_at=now, **values)
+
+
+def _write_links(recipes, validated):
+    '''replace the tag and ingredient links sent for each recipe'''
+    for field, through, column in RELATIONS:
+        replaced, rows = [], []
+        for recipe_id, data in zip(recipes, validated):
+            if field not in data:
+                continue
+            replaced.append(recipe_id)
+            rows += [
+                through(recipe_id=recipe_id, **{column: related_id})
+                for related_id in set(data[field])
+            ]
+        if replaced:
+            through.objects.filter(recipe_id__in=replaced).delete()
+        through.objects.bulk_create(rows, batch_size=BATCH_SIZE)
+
+
+def save_recipes(user, validated):
+    '''create and update validated recipes in one transaction
+
+    signals are not sent for bulk writes, so the search vectors and the list
+    cache of the user are refreshed here. returns the recipe ids in input order.
+    '''
+    now = timezone.now()
+    creates = [data for data in validated if 'id' not in data]
+    updates = [data for data in validated if 'id' in data]
+
+    with transaction.atomic():
+        created = Recipe.objects.bulk_create([
+            Recipe(
+                user=user,
+                **{k: v for k, v in data.items()
+                   if k not in ('tags', 'ingredients')}
+            )
+            for data in creates
+        ], batch_size=BATCH_SIZE)
+        _update_fields(user, updates, now)
+
+        created_ids = iter(recipe.pk for recipe in created)
+        ids = [
+            data['id'] if 'id' in data else next(created_ids)
+            for data in validated
+        ]
+        _write_links(ids, validated)
+        update_search_vectors(ids)
+
+    bump_generation(user.pk)
+    return ids
+
+
+def _existing_by_name(model, user, lower_names):
+    '''return the user's objects keyed by lowercased name'''
+    queryset = model.objects.filter(user=user).annotate(
+        lower_name=Lower('name')
+    ).filter(lower_name__in=lower_names)
+    return {obj.lower_name: obj for obj in queryset}
+
+
+def get_or_create_by_name(model, user, names):
+    '''return (object, created) for each distinct name, ignoring case
+
+    the first spelling of a name wins. missing objects are inserted with
+    one bulk_create; if a concurrent request inserts one of them first the
+    unique (user, lower(name)) index rejects the batch and it is retried.
+    '''
+    if len(names) > settings.RECIPE_BULK_MAX_ITEMS:
+        raise ValidationError(
+            f'At most {settings.RECIPE_BULK_MAX_ITEMS} names per request.'
+        )
+    wanted = OrderedDict()
+    for name in names:
+        wanted.setdefault(name.lower(), name)
+
+    for attempt in range(2):
+        existing = _existing_by_name(model, user, list(wanted))
+        missing = [
+            model(user=user, name=name)
+            for key, name in wanted.items() if key not in existing
+        ]
+        try:
+            with transaction.atomic():
+                created = model.objects.bulk_create(missing)
+            break
+        except IntegrityError:
+            if attempt:
+                raise
+
+    if created:
+        bump_generation(user.pk)
+    created = {obj.name.lower(): obj for obj in created}
+    return [
+        (created[key], True) if key in created else (existing[key], False)
+        for key in wanted
+    ]
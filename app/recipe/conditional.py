@@ -0,0 +1,42 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.http import http_date
+
+from recipe.cache import normalize_params
+
+
+def _weak_etag(*parts):
+    '''return a weak etag built from the given values'''
+    raw = ':'.join(str(part) for part in parts)
+    return 'W/"%s"' % hashlib.md5(raw.encode()).hexdigest()
+
+
+def recipe_validators(recipe):
+    '''return the etag and last modified timestamp of a recipe'''
+    last_modified = int(recipe.updated_at.timestamp())
+    return _weak_etag(recipe.pk, recipe.updated_at.isoformat()), last_modified
+
+
+def list_etag(queryset, request):
+    '''return the etag of a filtered list from one aggregate query
+
+    the row count is part of the validator because deleting an older
+    row does not move the latest updated_at.
+    '''
+    stats = queryset.order_by().aggregate(
+        last=Max('updated_at'), count=Count('id')
+    )
+    last = stats['last'].isoformat() if stats['last'] else ''
+    return _weak_etag(
+        request.user.pk, last, stats['count'],
+        normalize_params(request.query_params)
+    )
+
+
+def set_validators(response, etag, last_modified=None):
+    '''add the validator headers to a response'''
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,82 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from rest_framework.exceptions import ValidationError
+
+from core.models import Recipe
+
+MATCH_ANY = 'any'
+MATCH_ALL = 'all'
+MATCH_MODES = (MATCH_ANY, MATCH_ALL)
+
+
+def parse_match(value):
+    '''return a valid match mode, defaulting to any'''
+    if not value:
+        return MATCH_ANY
+    if value not in MATCH_MODES:
+        raise ValidationError(
+            {'match': f'must be one of: {", ".join(MATCH_MODES)}'}
+        )
+    return value
+
+
+def parse_min_count(value):
+    '''return a valid minimum recipe count, defaulting to zero'''
+    if not value:
+        return 0
+    try:
+        count = int(value)
+    except ValueError:
+        count = -1
+    if count < 0:
+        raise ValidationError({'min_count': 'must be a non negative integer'})
+    return count
+
+
+def annotate_usage(queryset, min_count=0):
+    '''annotate tags or ingredients with the number of recipes using them
+
+    each count is a grouped lookup on the through table index, so rows
+    come back once however many recipes use them, and pages still follow
+    the name index instead of aggregating every row before sorting.
+    '''
+    column = queryset.model._meta.model_name
+    links = queryset.model.recipe_set.through.objects.filter(
+        **{column: OuterRef('pk')}
+    ).values(column).annotate(linked=Count('recipe_id')).values('linked')
+    queryset = queryset.annotate(recipe_count=Coalesce(
+        Subquery(links, output_field=IntegerField()), 0
+    ))
+    if min_count:
+        queryset = queryset.filter(recipe_count__gte=min_count)
+    return queryset
+
+
+def _linked_recipe_ids(through, column, ids, match):
+    '''return a subquery of recipe ids linked to the given related ids'''
+    rows = through.objects.filter(**{f'{column}__in': ids})
+    if match == MATCH_ALL:
+        # one grouped pass keeps the recipes linked to every requested id
+        rows = rows.values('recipe_id').annotate(
+            linked=Count(column, distinct=True)
+        ).filter(linked=len(ids))
+    return rows.values('recipe_id')
+
+
+def filter_recipes(queryset, tag_ids=None, ingredient_ids=None,
+                   match=MATCH_ANY):
+    '''filter recipes by tags and ingredients without joining through rows
+
+    each filter is a semi-join against its through table, so a recipe is
+    returned at most once no matter how many of the ids it matches.
+    '''
+    if tag_ids:
+        queryset = queryset.filter(pk__in=_linked_recipe_ids(
+            Recipe.tags.through, 'tag_id', set(tag_ids), match
+        ))
+    if ingredient_ids:
+        queryset = queryset.filter(pk__in=_linked_recipe_ids(
+            Recipe.ingredients.through, 'ingredient_id',
+            set(ingredient_ids), match
+        ))
+    return queryset
@@ -0,0 +1,124 @@
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from core.storage import CONTENT_NAME_RE, is_content_name, \
+    recipe_image_storage
+
+# a single byte range, the only kind image clients ask for
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+
+def parse_range(header, size):
+    '''return the (start, end) byte range requested, end inclusive
+
+    returns None when the whole file should be sent and raises ValueError
+    when the range lies outside the file.
+    '''
+    match = RANGE_RE.match(header or '')
+    if not match or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if not first:
+        # a suffix range, the final `last` bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def _read_range(path, start, length):
+    '''yield `length` bytes of a file from `start` in fixed blocks'''
+    with open(path, 'rb') as media_file:
+        media_file.seek(start)
+        while length > 0:
+            block = media_file.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+
+
+def _validators(name, stat):
+    '''return the etag and cache control of a stored file'''
+    if is_content_name(name):
+        # the name is the hash of the content, so it can never change
+        digest = CONTENT_NAME_RE.search(name).group(0).rsplit('/', 1)[-1]
+        etag = quote_etag(os.path.splitext(digest)[0])
+        cache_control = f'private, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+        cache_control = f'private, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+    return etag, cache_control
+
+
+def media_response(request, name):
+    '''return a response sending a stored recipe image
+
+    with a front proxy configured the transfer is handed to it, so the
+    worker is free as soon as the headers are written. otherwise the file
+    is streamed in blocks, honouring a single byte range.
+    '''
+    path = recipe_image_storage.path(name)
+    stat = os.stat(path)
+    etag, cache_control = _validators(name, stat)
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime)
+    )
+    if response is None:
+        response = _send(request, name, path, stat.st_size)
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = cache_control
+    return response
+
+
+def _send(request, name, path, size):
+    '''return the response carrying the file content'''
+    content_type = mimetypes.guess_type(name)[0] or \
+        'application/octet-stream'
+
+    if settings.MEDIA_ACCEL == 'x-accel-redirect':
+        # nginx serves the file from an internal location
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = \
+            settings.MEDIA_ACCEL_PREFIX + quote(name)
+        return response
+    if settings.MEDIA_ACCEL == 'x-sendfile':
+        # apache mod_xsendfile and lighttpd read the absolute path
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+
+    try:
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    if byte_range is None:
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+        response.block_size = BLOCK_SIZE
+    else:
+        start, end = byte_range
+        response = StreamingHttpResponse(
+            _read_range(path, start, end - start + 1),
+            status=206,
+            content_type=content_type
+        )
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = end - start + 1
+    response['Accept-Ranges'] = 'bytes'
+    return response
@@ -0,0 +1,113 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    '''paginate on the view ordering using an opaque keyset cursor
+
+    the view's `get_ordering()`, or `ordering` attribute, must end with a
+    unique field (normally `id`) so the cursor always names exactly one
+    row. each page is fetched with a range condition on the ordering
+    columns, so page N costs the same as page 1 and rows inserted behind
+    the cursor never shift later pages.
+    '''
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 100
+    max_page_size = 1000
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        '''return one page of rows following the requested cursor'''
+        self.request = request
+        if hasattr(view, 'get_ordering'):
+            self.ordering = tuple(view.get_ordering())
+        else:
+            self.ordering = tuple(view.ordering)
+        page_size = self.get_page_size(request)
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(position))
+            except (ValueError, TypeError, ValidationError):
+                # cursor values that do not fit their ordering fields
+                raise NotFound(self.invalid_cursor_message)
+
+        # fetch one extra row to find out whether another page exists
+        rows = list(queryset.order_by(*self.ordering)[:page_size + 1])
+        self.has_next = len(rows) > page_size
+        self.page = rows[:page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        '''wrap the page of serialized rows with the next link'''
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_page_size(self, request):
+        '''return the page size requested by the client within limits'''
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_next_link(self):
+        '''return the url of the next page or None on the last page'''
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        position = [
+            getattr(last, field.lstrip('-')) for field in self.ordering
+        ]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(position)
+        )
+
+    def encode_cursor(self, position):
+        '''turn the ordering values of a row into an opaque token'''
+        # decimals are kept as strings, so they come back unrounded
+        raw = json.dumps(
+            position, separators=(',', ':'), default=str
+        ).encode()
+        return base64.urlsafe_b64encode(raw).decode()
+
+    def decode_cursor(self, request):
+        '''return the ordering values held by the cursor, if any'''
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+        except (binascii.Error, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or \
+                len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def _after(self, position):
+        '''build the condition for rows sorting after the cursor row'''
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        return condition
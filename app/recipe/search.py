@@ -0,0 +1,76 @@
+from django.contrib.postgres.search import SearchQuery, SearchRank, \
+    TrigramSimilarity
+from django.db import connection
+from django.db.models import DecimalField, F
+from django.db.models.functions import Cast
+
+SEARCH_CONFIG = 'english'
+
+# ranks are real, which postgres may print with fewer digits than it
+# compares, so the keyset cursor pages on a rounded exact copy instead
+RANK_FIELD = DecimalField(max_digits=12, decimal_places=6)
+
+# title weighs more than the names of attached tags and ingredients
+UPDATE_SEARCH_VECTORS_SQL = '''
+UPDATE core_recipe AS r SET search_vector =
+    setweight(to_tsvector(%(config)s, r.title), 'A') ||
+    setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(t.name, ' ')
+        FROM core_tag t
+        JOIN core_recipe_tags rt ON rt.tag_id = t.id
+        WHERE rt.recipe_id = r.id
+    ), '')), 'B') ||
+    setweight(to_tsvector(%(config)s, coalesce((
+        SELECT string_agg(i.name, ' ')
+        FROM core_ingredient i
+        JOIN core_recipe_ingredients ri ON ri.ingredient_id = i.id
+        WHERE ri.recipe_id = r.id
+    ), '')), 'B')
+WHERE r.id = ANY(%(ids)s)
+'''
+
+_trigram_installed = None
+
+
+def update_search_vectors(recipe_ids):
+    '''recompute the stored search vector of recipes in one statement'''
+    recipe_ids = list(recipe_ids)
+    if not recipe_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            UPDATE_SEARCH_VECTORS_SQL,
+            {'config': SEARCH_CONFIG, 'ids': recipe_ids}
+        )
+
+
+def trigram_installed():
+    '''return whether the pg_trgm extension is available, checked once'''
+    global _trigram_installed
+    if _trigram_installed is None:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'"
+            )
+            _trigram_installed = cursor.fetchone() is not None
+    return _trigram_installed
+
+
+def search_recipes(queryset, terms):
+    '''return the recipes matching terms annotated with a `rank`
+
+    full text matches use the GIN indexed search vector. when nothing
+    matches, likely a typo, titles similar to the terms are returned
+    instead, ranked by trigram similarity. pass a queryset already limited
+    to one user, so the fallback depends on their recipes only.
+    '''
+    query = SearchQuery(terms, config=SEARCH_CONFIG)
+    matches = queryset.filter(search_vector=query).annotate(
+        rank=Cast(SearchRank(F('search_vector'), query), RANK_FIELD)
+    )
+    if not trigram_installed() or matches.exists():
+        return matches
+
+    return queryset.filter(title__trigram_similar=terms).annotate(
+        rank=Cast(TrigramSimilarity('title', terms), RANK_FIELD)
+    )
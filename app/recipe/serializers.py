@@ -1,9 +1,32 @@
+from django.conf import settings
+from django.db.models import Value
+from django.db.models.functions import Lower
 from django.db.models.query import QuerySet
+from PIL import Image
 from rest_framework import serializers
 
 from core.models import Recipe, Tag, Ingredient
+from core.storage import recipe_image_storage
 
-class TagSerializer(serializers.ModelSerializer):
+class UniqueNameSerializer(serializers.ModelSerializer):
+    '''reject a name the user already has, ignoring case'''
+
+    def validate_name(self, value):
+        request = self.context.get('request')
+        if request is not None:
+            exists = self.Meta.model.objects.filter(
+                user=request.user
+            ).annotate(
+                lower_name=Lower('name')
+            ).filter(lower_name=Lower(Value(value))).exists()
+            if exists:
+                raise serializers.ValidationError(
+                    f'A {self.Meta.model._meta.verbose_name} with this name '
+                    'already exists.'
+                )
+        return value
+
+class TagSerializer(UniqueNameSerializer):
     '''Serializer for tag objects'''
 
     class Meta:
@@ -11,7 +34,7 @@ class TagSerializer(serializers.ModelSerializer):
         fields = ('id', 'name')
         read_only_fields = ('id',)
 
-class IngredientSerializer(serializers.ModelSerializer):
+class IngredientSerializer(UniqueNameSerializer):
     '''Serializer for ingredient serializer'''
 
     class Meta:
@@ -19,6 +42,47 @@ class IngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name')
         read_only_fields = ('id',)
 
+class TagCountSerializer(TagSerializer):
+    '''serialize a tag with the number of recipes using it'''
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(TagSerializer.Meta):
+        fields = TagSerializer.Meta.fields + ('recipe_count',)
+
+class IngredientCountSerializer(IngredientSerializer):
+    '''serialize an ingredient with the number of recipes using it'''
+    recipe_count = serializers.IntegerField(read_only=True)
+
+    class Meta(IngredientSerializer.Meta):
+        fields = IngredientSerializer.Meta.fields + ('recipe_count',)
+
+class NameListSerializer(serializers.Serializer):
+    '''serializer for a list of tag or ingredient names'''
+    names = serializers.ListField(
+        child=serializers.CharField(max_length=255),
+        allow_empty=False
+    )
+
+class ImageVariantsField(serializers.Field):
+    '''serialize rendered image variants as urls by width and format'''
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'image_variants'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, variants):
+        request = self.context.get('request')
+        urls = {}
+        for width, names in variants.items():
+            urls[width] = {}
+            for fmt, name in names.items():
+                url = recipe_image_storage.url(name)
+                if request is not None:
+                    url = request.build_absolute_uri(url)
+                urls[width][fmt] = url
+        return urls
+
 # create serializer recipe serializer
 class RecipeSerializer(serializers.ModelSerializer):
     '''serialize a recipe'''
@@ -42,11 +106,85 @@ class RecipeDetailSerializer(RecipeSerializer):
     # override the ingredients field
     ingredients = IngredientSerializer(many=True, read_only=True )
     tags = TagSerializer(many=True, read_only=True)
+    thumbnails = ImageVariantsField()
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('thumbnails',)
+
+class RecipeBulkItemSerializer(serializers.ModelSerializer):
+    '''validate one recipe of a bulk write without per id lookups'''
+    id = serializers.IntegerField(required=False)
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+    tags = serializers.ListField(
+        child=serializers.IntegerField(),
+        required=False
+    )
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'title', 'ingredients', 'tags', 'time_minutes', 'price', 'link')
+
+    def validate(self, attrs):
+        '''check referenced ids against the ids owned by the user'''
+        owned = self.context['owned']
+        if 'id' in attrs and attrs['id'] not in owned['recipes']:
+            raise serializers.ValidationError(
+                {'id': f'Invalid pk "{attrs["id"]}" - object does not exist.'}
+            )
+        for field in ('tags', 'ingredients'):
+            unknown = set(attrs.get(field, ())) - owned[field]
+            if unknown:
+                raise serializers.ValidationError({field: [
+                    f'Invalid pk "{pk}" - object does not exist.'
+                    for pk in sorted(unknown)
+                ]})
+        return attrs
+
+class HeaderCheckedImageField(serializers.ImageField):
+    '''validate an image upload from its header without decoding it
+
+    pillow only parses the header when opening a file, which is enough to
+    know the format and pixel size. rejecting oversized images there keeps
+    a decompression bomb from ever being decoded by a worker.
+    '''
+    default_error_messages = {
+        'format': 'Unsupported image format {format}.',
+        'bytes': 'Image files may be at most {max_bytes} bytes.',
+        'pixels': 'Images may be at most {max_pixels} pixels.',
+    }
+
+    def to_internal_value(self, data):
+        # FileField checks the upload without reading it, unlike the
+        # parent ImageField which fully loads and verifies the image
+        upload = serializers.FileField.to_internal_value(self, data)
+        if upload.size > settings.RECIPE_IMAGE_MAX_BYTES:
+            self.fail('bytes', max_bytes=settings.RECIPE_IMAGE_MAX_BYTES)
+        try:
+            with Image.open(upload) as image:
+                image_format = image.format
+                width, height = image.size
+        except (OSError, SyntaxError, ValueError,
+                Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            upload.seek(0)
+
+        if image_format not in settings.RECIPE_IMAGE_FORMATS:
+            self.fail('format', format=image_format)
+        if width * height > settings.RECIPE_IMAGE_MAX_PIXELS:
+            self.fail('pixels', max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        return upload
 
 class RecipeImageSerializer(serializers.ModelSerializer):
     '''serializer for uploading images to recipes'''
-    
+    image = HeaderCheckedImageField()
+    # empty until the thumbnail workers have rendered the new image
+    thumbnails = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'image')
+        fields = ('id', 'image', 'thumbnails')
         read_only_fields = ('id',)
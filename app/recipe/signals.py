@@ -0,0 +1,105 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, \
+    pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core.models import Ingredient, Recipe, Tag
+from recipe.cache import bump_generation
+from recipe.search import update_search_vectors
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_owner_lists(sender, instance, **kwargs):
+    '''drop the cached lists of the owner of a written object'''
+    if instance.user_id:
+        bump_generation(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def invalidate_linked_lists(sender, instance, action, model, pk_set,
+                            **kwargs):
+    '''drop the cached lists of everyone owning a linked object'''
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    owners = {instance.user_id}
+    if pk_set:
+        owners.update(
+            model.objects.filter(pk__in=pk_set).values_list(
+                'user_id', flat=True
+            )
+        )
+    for user_id in owners:
+        if user_id:
+            bump_generation(user_id)
+
+
+def _recipe_ids_using(instance):
+    '''return the ids of the recipes linked to a tag or ingredient'''
+    return list(Recipe.objects.filter(**{
+        f'{instance._meta.model_name}s': instance
+    }).values_list('pk', flat=True))
+
+
+def _recipes_changed(recipe_ids):
+    '''touch and reindex recipes whose tags or ingredients changed
+
+    updated_at moves forward so conditional GETs see the change, and the
+    search vector picks up the new tag and ingredient names.
+    '''
+    recipe_ids = list(recipe_ids)
+    if recipe_ids:
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            updated_at=timezone.now()
+        )
+        update_search_vectors(recipe_ids)
+
+
+@receiver(post_save, sender=Recipe)
+def reindex_saved_recipe(sender, instance, **kwargs):
+    '''refresh the search vector of a saved recipe'''
+    update_search_vectors([instance.pk])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def relinked_recipes_changed(sender, instance, action, reverse, pk_set,
+                             **kwargs):
+    '''update the recipes whose tags or ingredients were changed'''
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            _recipes_changed([instance.pk])
+    elif action == 'pre_clear':
+        # the links are gone by post_clear, so remember them now
+        instance._unlinked_recipe_ids = _recipe_ids_using(instance)
+    elif action == 'post_clear':
+        _recipes_changed(getattr(instance, '_unlinked_recipe_ids', ()))
+    elif action in ('post_add', 'post_remove'):
+        _recipes_changed(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Ingredient)
+def renamed_recipes_changed(sender, instance, created, **kwargs):
+    '''update the recipes showing a renamed tag or ingredient'''
+    if not created:
+        _recipes_changed(_recipe_ids_using(instance))
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def remember_unlinked_recipes(sender, instance, **kwargs):
+    '''remember the recipes of a tag or ingredient about to be deleted'''
+    instance._unlinked_recipe_ids = _recipe_ids_using(instance)
+
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Ingredient)
+def deleted_recipes_changed(sender, instance, **kwargs):
+    '''update the recipes that showed a deleted tag or ingredient'''
+    _recipes_changed(getattr(instance, '_unlinked_recipe_ids', ()))
@@ -0,0 +1,166 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+BULK_URL = reverse('recipe:recipe-bulk')
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def recipe_payload(**params):
+    '''return a bulk item for a recipe'''
+    payload = {'title': 'Sample recipe', 'time_minutes': 10, 'price': '5.00'}
+    payload.update(params)
+    return payload
+
+
+class BulkRecipeApiTests(TestCase):
+    '''test the bulk recipe endpoint'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.ingredient = Ingredient.objects.create(
+            user=self.user, name='Salt'
+        )
+
+    def _post(self, items):
+        return self.client.post(BULK_URL, items, format='json')
+
+    def test_bulk_create_recipes(self):
+        '''test creating recipes with tags and ingredients in bulk'''
+        items = [
+            recipe_payload(
+                title=f'Recipe {index}',
+                tags=[self.tag.id],
+                ingredients=[self.ingredient.id]
+            )
+            for index in range(3)
+        ]
+
+        res = self._post(items)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['ids']), 3)
+        recipes = Recipe.objects.filter(pk__in=res.data['ids'])
+        self.assertEqual(
+            sorted(recipe.title for recipe in recipes),
+            ['Recipe 0', 'Recipe 1', 'Recipe 2']
+        )
+        for recipe in recipes:
+            self.assertEqual(list(recipe.tags.all()), [self.tag])
+            self.assertEqual(list(recipe.ingredients.all()), [self.ingredient])
+
+    def test_bulk_create_query_count_constant(self):
+        '''test the statements issued do not grow with the batch size'''
+        item = recipe_payload(
+            tags=[self.tag.id], ingredients=[self.ingredient.id]
+        )
+
+        with CaptureQueriesContext(connection) as few:
+            self._post([item] * 2)
+        with CaptureQueriesContext(connection) as many:
+            self._post([item] * 50)
+
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(Recipe.objects.filter(user=self.user).count(), 52)
+
+    def test_bulk_update_recipes(self):
+        '''test items with an id update that recipe'''
+        recipe = Recipe.objects.create(
+            user=self.user, title='Old', time_minutes=5, price=1
+        )
+        recipe.tags.add(self.tag)
+        new_tag = Tag.objects.create(user=self.user, name='Curry')
+
+        res = self._post([
+            {'id': recipe.id, 'title': 'New', 'tags': [new_tag.id]},
+            recipe_payload(title='Created'),
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['ids'][0], recipe.id)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'New')
+        self.assertEqual(recipe.time_minutes, 5)
+        self.assertEqual(list(recipe.tags.all()), [new_tag])
+
+    def test_bulk_invalid_item_writes_nothing(self):
+        '''test one invalid item rejects the whole batch'''
+        res = self._post([
+            recipe_payload(title='Fine'),
+            recipe_payload(title=''),
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(res.data['errors'][0]['index'], 1)
+        self.assertIn('title', res.data['errors'][0]['errors'])
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_bulk_rejects_other_users_objects(self):
+        '''test tags and recipes of another user cannot be referenced'''
+        user2 = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        tag = Tag.objects.create(user=user2, name='Fruity')
+        recipe = Recipe.objects.create(
+            user=user2, title='Theirs', time_minutes=5, price=1
+        )
+
+        res = self._post([
+            recipe_payload(tags=[tag.id]),
+            {'id': recipe.id, 'title': 'Mine now'},
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [error['index'] for error in res.data['errors']], [0, 1]
+        )
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.title, 'Theirs')
+
+    def test_bulk_rejects_repeated_ids(self):
+        '''test a recipe cannot be updated twice in one batch'''
+        recipe = Recipe.objects.create(
+            user=self.user, title='Old', time_minutes=5, price=1
+        )
+
+        res = self._post([
+            {'id': recipe.id, 'tags': [self.tag.id]},
+            recipe_payload(),
+            {'id': recipe.id, 'tags': [self.tag.id]},
+        ])
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(
+            [error['index'] for error in res.data['errors']], [2]
+        )
+        self.assertIn('id', res.data['errors'][0]['errors'])
+        self.assertFalse(recipe.tags.exists())
+
+    def test_bulk_invalidates_list_cache(self):
+        '''test recipes created in bulk show up in the list'''
+        self.client.get(RECIPES_URL)
+
+        self._post([recipe_payload()])
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_bulk_requires_list(self):
+        '''test the payload must be a list'''
+        res = self._post(recipe_payload())
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,110 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def detail_url(recipe_id):
+    '''return recipe detail URL'''
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def sample_recipe(user, **params):
+    '''Create and return a sample recipe'''
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ConditionalGetTests(TestCase):
+    '''test etag and last modified handling of the recipe API'''
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = sample_recipe(user=self.user)
+
+    def test_detail_not_modified(self):
+        '''test a matching etag on the detail returns 304'''
+        res = self.client.get(detail_url(self.recipe.id))
+        etag = res['ETag']
+
+        # only the recipe row is read, tags and ingredients are skipped
+        with self.assertNumQueries(1):
+            res = self.client.get(
+                detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_not_modified_since(self):
+        '''test a current If-Modified-Since on the detail returns 304'''
+        res = self.client.get(detail_url(self.recipe.id))
+
+        res = self.client.get(
+            detail_url(self.recipe.id),
+            HTTP_IF_MODIFIED_SINCE=res['Last-Modified']
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_detail_etag_changes_on_tag_link(self):
+        '''test linking a tag makes the old etag stale'''
+        res = self.client.get(detail_url(self.recipe.id))
+        etag = res['ETag']
+
+        self.recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        res = self.client.get(
+            detail_url(self.recipe.id), HTTP_IF_NONE_MATCH=etag
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['tags']), 1)
+
+    def test_list_not_modified(self):
+        '''test a matching etag on the list returns 304'''
+        res = self.client.get(RECIPES_URL)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=res['ETag'])
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_list_etag_changes_on_delete(self):
+        '''test deleting an older recipe makes the list etag stale'''
+        sample_recipe(user=self.user)
+        res = self.client.get(RECIPES_URL)
+        etag = res['ETag']
+
+        self.recipe.delete()
+        res = self.client.get(RECIPES_URL, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_list_etag_depends_on_filters(self):
+        '''test the list etag differs between filter params'''
+        res = self.client.get(RECIPES_URL)
+
+        res = self.client.get(
+            RECIPES_URL, {'tags': '1'}, HTTP_IF_NONE_MATCH=res['ETag']
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
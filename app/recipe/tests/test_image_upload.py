@@ -0,0 +1,164 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe.tests.utils import TempMediaRootMixin, image_upload_url
+from recipe.thumbnails import render_variants
+
+# a decoded rgb copy of the large test image would take about 108mb
+LARGE_SIZE = (6000, 6000)
+PEAK_RSS_LIMIT = 40 * 1024 * 1024
+
+
+def reset_peak_rss():
+    '''restart the peak resident set size count of this process'''
+    with open('/proc/self/clear_refs', 'w') as clear_refs:
+        clear_refs.write('5')
+
+
+def peak_rss():
+    '''return the peak resident set size of this process in bytes'''
+    with open('/proc/self/status') as status_file:
+        for line in status_file:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+
+
+class RecipeImageValidationTests(TempMediaRootMixin, TestCase):
+    '''test checking uploaded images from their header'''
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Toast', time_minutes=5, price=1.00
+        )
+
+    def _upload(self, size=(10, 10), image_format='JPEG', suffix='.jpg'):
+        with tempfile.NamedTemporaryFile(suffix=suffix) as ntf:
+            Image.new('RGB', size).save(ntf, format=image_format)
+            ntf.seek(0)
+            return self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+
+    def test_upload_png(self):
+        '''test an allowed format other than jpeg is accepted'''
+        res = self._upload(image_format='PNG', suffix='.png')
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_upload_disallowed_format(self):
+        '''test formats outside the allowed list are rejected'''
+        res = self._upload(image_format='BMP', suffix='.bmp')
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', res.data)
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100)
+    def test_upload_too_many_pixels(self):
+        '''test images above the pixel limit are rejected'''
+        res = self._upload(size=(20, 20))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+        self.recipe.refresh_from_db()
+        self.assertFalse(self.recipe.image)
+
+    @override_settings(RECIPE_IMAGE_MAX_BYTES=100)
+    def test_upload_too_many_bytes(self):
+        '''test files above the size limit are rejected'''
+        res = self._upload(size=(50, 50))
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_upload_truncated_image(self):
+        '''test a file with a broken header is rejected'''
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(b'\xff\xd8\xff\xe0 not really a jpeg')
+            ntf.seek(0)
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+@unittest.skipUnless(sys.platform.startswith('linux'), 'needs /proc')
+class RecipeImageMemoryTests(TestCase):
+    '''test large images are handled without being decoded in full'''
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.work_dir = tempfile.mkdtemp()
+        cls.large_path = os.path.join(cls.work_dir, 'large.jpg')
+        Image.new('L', LARGE_SIZE, 128).save(cls.large_path, format='JPEG')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.work_dir)
+        super().tearDownClass()
+
+    def setUp(self):
+        media = override_settings(MEDIA_ROOT=self.work_dir)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Toast', time_minutes=5, price=1.00
+        )
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=64 * 1024)
+    def test_upload_large_image_peak_rss(self):
+        '''test uploading a large image keeps the peak rss bounded'''
+        with open(self.large_path, 'rb') as image_file:
+            reset_peak_rss()
+            baseline = peak_rss()
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': image_file},
+                format='multipart'
+            )
+            growth = peak_rss() - baseline
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertLess(growth, PEAK_RSS_LIMIT)
+
+    def test_render_large_image_peak_rss(self):
+        '''test thumbnails of a large jpeg are decoded at reduced scale'''
+        target = os.path.join(self.work_dir, 'small.jpg')
+        reset_peak_rss()
+        baseline = peak_rss()
+
+        render_variants(self.large_path, {(320, 'jpeg'): target}, 80)
+        growth = peak_rss() - baseline
+
+        with Image.open(target) as small:
+            self.assertEqual(small.size, (320, 320))
+        self.assertLess(growth, PEAK_RSS_LIMIT)
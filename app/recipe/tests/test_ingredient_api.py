@@ -10,6 +10,7 @@ from core.models import Ingredient, Recipe
 from recipe.serializers import IngredientSerializer
 
 INGREDIENTS_URL = reverse('recipe:ingredient-list')
+INGREDIENTS_BULK_URL = reverse('recipe:ingredient-bulk')
 
 class PublicIngredientsApiTests(TestCase):
     '''test the publicly available ingredient API'''
@@ -47,7 +48,7 @@ class PrivateIngredientsApi(TestCase):
         ingredients = Ingredient.objects.all().order_by('-name')
         serializer = IngredientSerializer(ingredients, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_ingredients_limited_to_user(self):
         '''test tht ingredients for the authenticated user are retrieved'''
@@ -62,8 +63,8 @@ class PrivateIngredientsApi(TestCase):
 
         res = self.client.get(INGREDIENTS_URL)
 
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data[0]['name'], ingredient.name)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['name'], ingredient.name)
 
     def test_create_ingredient_successful(self):
         '''test create a new ingredient'''
@@ -83,6 +84,41 @@ class PrivateIngredientsApi(TestCase):
 
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_ingredient_duplicate_name(self):
+        '''test creating an ingredient whose name exists fails'''
+        Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.post(INGREDIENTS_URL, {'name': 'salt'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_get_or_create_ingredients(self):
+        '''test bulk ingredients are matched ignoring case'''
+        salt = Ingredient.objects.create(user=self.user, name='Salt')
+
+        res = self.client.post(
+            INGREDIENTS_BULK_URL,
+            {'names': ['SALT', 'Pepper']},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            [(item['id'], item['created']) for item in res.data][0],
+            (salt.id, False)
+        )
+        self.assertEqual(
+            Ingredient.objects.filter(user=self.user).count(), 2
+        )
+
+    def test_bulk_ingredients_requires_names(self):
+        '''test an empty name list is rejected'''
+        res = self.client.post(
+            INGREDIENTS_BULK_URL, {'names': []}, format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
     def test_retrieve_ingredients_assigned_to_recipes(self):
         '''test filtering ingredients by those assigned to recipes'''
         ingredient1 = Ingredient.objects.create(
@@ -106,6 +142,25 @@ class PrivateIngredientsApi(TestCase):
         serializer1 = IngredientSerializer(ingredient1)
         serializer2 = IngredientSerializer(ingredient2)
 
-        self.assertIn(serializer1.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
 
-        self.assertNotIn(serializer2.data, res.data)
\ No newline at end of file
+        self.assertNotIn(serializer2.data, res.data['results'])
+
+    def test_retrieve_ingredients_with_counts(self):
+        '''test ingredients are listed once with their recipe counts'''
+        eggs = Ingredient.objects.create(user=self.user, name='Eggs')
+        Ingredient.objects.create(user=self.user, name='Cheese')
+        for title in ('Eggs benedict', 'Omelette'):
+            recipe = Recipe.objects.create(
+                title=title, time_minutes=5, price=3.00, user=self.user
+            )
+            recipe.ingredients.add(eggs)
+
+        res = self.client.get(
+            INGREDIENTS_URL, {'assigned_only': 1, 'with_counts': 1}
+        )
+
+        self.assertEqual(
+            res.data['results'],
+            [{'id': eggs.id, 'name': 'Eggs', 'recipe_count': 2}]
+        )
@@ -0,0 +1,114 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag
+
+from recipe.cache import normalize_params
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+
+
+def sample_recipe(user, **params):
+    '''Create and return a sample recipe'''
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class ListCacheTests(TestCase):
+    '''test the cached list responses'''
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_list_served_from_cache(self):
+        '''test a repeated recipe list skips the list queries'''
+        sample_recipe(user=self.user)
+        first = self.client.get(RECIPES_URL)
+
+        # only the etag aggregate runs, nothing is serialized again
+        with self.assertNumQueries(1):
+            second = self.client.get(RECIPES_URL)
+
+        self.assertEqual(first.data, second.data)
+
+    def test_repeated_tag_list_served_from_cache(self):
+        '''test a repeated tag list request does not touch the database'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAG_URL)
+
+        with self.assertNumQueries(0):
+            self.client.get(TAG_URL)
+
+    @override_settings(RECIPE_LIST_CACHE_TIMEOUT=0)
+    def test_cache_turned_off(self):
+        '''test lists are not cached when the timeout is 0'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAG_URL)
+        # update sends no signal, so a cached list would stay as it was
+        Tag.objects.filter(user=self.user).update(name='Vegetarian')
+
+        res = self.client.get(TAG_URL)
+
+        self.assertEqual(res.data['results'][0]['name'], 'Vegetarian')
+
+    def test_write_invalidates_cached_list(self):
+        '''test creating a recipe is visible on the next list request'''
+        self.client.get(RECIPES_URL)
+        self.client.post(RECIPES_URL, {
+            'title': 'Chocolate',
+            'time_minutes': 30,
+            'price': 5.5
+        })
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 1)
+
+    def test_m2m_change_invalidates_cached_list(self):
+        '''test attaching a tag is visible on the next list request'''
+        recipe = sample_recipe(user=self.user)
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        self.client.get(TAG_URL, {'assigned_only': 1})
+
+        recipe.tags.add(tag)
+        res = self.client.get(TAG_URL, {'assigned_only': 1})
+
+        self.assertEqual(res.data['results'][0]['id'], tag.id)
+
+    def test_cache_is_per_user(self):
+        '''test another user never receives a cached list'''
+        sample_recipe(user=self.user)
+        self.client.get(RECIPES_URL)
+        user2 = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(user2)
+
+        res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(res.data['results'], [])
+
+    def test_normalize_params(self):
+        '''test equivalent query strings share a cache key'''
+        self.assertEqual(
+            normalize_params({'tags': '3, 1,3', 'assigned_only': 'yes'}),
+            normalize_params({'assigned_only': '1', 'tags': '1,3'})
+        )
@@ -0,0 +1,145 @@
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe.tests.utils import TempMediaRootMixin
+from recipe.thumbnails import variant_name
+
+CONTENT = bytes(range(256)) * 4
+
+
+def media_url(name):
+    '''return the url of a stored media file'''
+    return reverse('media', args=[name])
+
+
+def body(res):
+    return b''.join(res.streaming_content)
+
+
+class PublicMediaApiTests(TestCase):
+    '''test unauthenticated media requests'''
+
+    def test_login_required(self):
+        '''test media is only sent to authenticated users'''
+        res = APIClient().get(media_url('upload/recipe/image.jpg'))
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class PrivateMediaApiTests(TempMediaRootMixin, TestCase):
+    '''test sending recipe images to their owners'''
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Toast', time_minutes=5, price=1.00
+        )
+        self.recipe.image.save('toast.jpg', ContentFile(CONTENT))
+        self.name = self.recipe.image.name
+
+    def test_send_image(self):
+        '''test the owner gets the image with immutable cache headers'''
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(body(res), CONTENT)
+        self.assertEqual(res['Content-Type'], 'image/jpeg')
+        self.assertEqual(res['Accept-Ranges'], 'bytes')
+        self.assertIn('immutable', res['Cache-Control'])
+        self.assertIn('private', res['Cache-Control'])
+
+    def test_send_variant(self):
+        '''test thumbnail variants of an owned image are sent'''
+        variant = variant_name(self.name, 160, 'webp')
+        # variants are written in place by the thumbnail workers
+        with open(self.recipe.image.storage.path(variant), 'wb') as small:
+            small.write(b'small')
+
+        res = self.client.get(media_url(variant))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+    def test_image_of_other_user(self):
+        '''test images of other users' recipes are not found'''
+        other = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(other)
+
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_path_traversal(self):
+        '''test names escaping the media root are refused'''
+        res = self.client.get(media_url(f'upload/recipe/../../{self.name}'))
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_byte_range(self):
+        '''test a byte range is sent as partial content'''
+        res = self.client.get(media_url(self.name), HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(body(res), CONTENT[10:20])
+        self.assertEqual(res['Content-Range'], f'bytes 10-19/{len(CONTENT)}')
+        self.assertEqual(res['Content-Length'], '10')
+
+    def test_suffix_byte_range(self):
+        '''test a range of the final bytes is sent'''
+        res = self.client.get(media_url(self.name), HTTP_RANGE='bytes=-5')
+
+        self.assertEqual(res.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(body(res), CONTENT[-5:])
+
+    def test_unsatisfiable_range(self):
+        '''test a range past the end of the file is refused'''
+        res = self.client.get(
+            media_url(self.name), HTTP_RANGE=f'bytes={len(CONTENT)}-'
+        )
+
+        self.assertEqual(
+            res.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+        self.assertEqual(res['Content-Range'], f'bytes */{len(CONTENT)}')
+
+    def test_not_modified(self):
+        '''test a cached copy is revalidated by its etag'''
+        etag = self.client.get(media_url(self.name))['ETag']
+
+        res = self.client.get(media_url(self.name), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(res.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(MEDIA_ACCEL='x-accel-redirect')
+    def test_x_accel_redirect(self):
+        '''test the transfer is handed to nginx'''
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            res['X-Accel-Redirect'], f'/protected-media/{self.name}'
+        )
+        self.assertEqual(res.content, b'')
+
+    @override_settings(MEDIA_ACCEL='x-sendfile')
+    def test_x_sendfile(self):
+        '''test the transfer is handed to apache or lighttpd'''
+        res = self.client.get(media_url(self.name))
+
+        self.assertEqual(res['X-Sendfile'], self.recipe.image.path)
+        self.assertEqual(res.content, b'')
@@ -0,0 +1,147 @@
+import json
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+RECIPES_URL = reverse('recipe:recipe-list')
+TAG_URL = reverse('recipe:tag-list')
+INGREDIENTS_URL = reverse('recipe:ingredient-list')
+
+# plan nodes showing a missing index for a filter or an ordering
+FORBIDDEN_NODES = ('Seq Scan', 'Sort', 'Incremental Sort')
+
+
+def _plan_nodes(plan):
+    '''yield every node of a json explain plan'''
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from _plan_nodes(child)
+
+
+class QueryPlanTests(TestCase):
+    '''test every endpoint query is answered from an index
+
+    the tables of a test database are tiny, so the planner would scan
+    them whatever indexes exist. sequential scans and sorts are disabled
+    instead: if one still shows up, no index can serve that query.
+    '''
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            get_user_model().objects.create_user(f'user{index}@test.com')
+            for index in range(3)
+        ]
+        cls.user = users[0]
+        for user in users:
+            tags = Tag.objects.bulk_create(
+                Tag(user=user, name=f'Tag {index}') for index in range(20)
+            )
+            ingredients = Ingredient.objects.bulk_create(
+                Ingredient(user=user, name=f'Ingredient {index}')
+                for index in range(20)
+            )
+            for index in range(30):
+                recipe = Recipe.objects.create(
+                    user=user, title=f'Recipe {index}',
+                    time_minutes=10, price=5
+                )
+                recipe.tags.add(*tags[index % 5:index % 5 + 3])
+                recipe.ingredients.add(*ingredients[index % 7:index % 7 + 4])
+        cls.tag_ids = list(
+            Tag.objects.filter(user=cls.user).order_by('id').values_list(
+                'id', flat=True
+            )[:2]
+        )
+        cls.recipe_id = Recipe.objects.filter(user=cls.user).first().id
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+            cursor.execute('SET LOCAL enable_sort = off')
+            if connection.pg_version >= 130000:
+                cursor.execute('SET LOCAL enable_incremental_sort = off')
+
+    def assertIndexedPlans(self, url, params=None):
+        '''request url and check the plan of every select it runs'''
+        with CaptureQueriesContext(connection) as queries:
+            res = self.client.get(url, params or {})
+        self.assertEqual(res.status_code, 200)
+
+        selects = [
+            query['sql'] for query in queries
+            if query['sql'].startswith('SELECT')
+        ]
+        self.assertTrue(selects)
+        for sql in selects:
+            with connection.cursor() as cursor:
+                cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+                plan = cursor.fetchone()[0]
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            for node in _plan_nodes(plan[0]['Plan']):
+                self.assertNotIn(
+                    node['Node Type'], FORBIDDEN_NODES,
+                    f'{node["Node Type"]} on {node.get("Relation Name")} '
+                    f'in: {sql}'
+                )
+        return res
+
+    def test_tag_list_plan(self):
+        '''test the tag list is read from an index'''
+        self.assertIndexedPlans(TAG_URL)
+
+    def test_tag_list_next_page_plan(self):
+        '''test a later page of tags is read from an index'''
+        res = self.assertIndexedPlans(TAG_URL, {'page_size': 5})
+        self.assertIndexedPlans(res.data['next'])
+
+    def test_tag_usage_counts_plan(self):
+        '''test tags with usage counts are read from indexes'''
+        self.assertIndexedPlans(TAG_URL, {'with_counts': 1, 'min_count': 2})
+
+    def test_ingredient_list_plan(self):
+        '''test the ingredient list is read from an index'''
+        self.assertIndexedPlans(INGREDIENTS_URL)
+
+    def test_recipe_list_plan(self):
+        '''test the recipe list is read from an index'''
+        self.assertIndexedPlans(RECIPES_URL)
+
+    def test_recipe_list_next_page_plan(self):
+        '''test a later page of recipes is read from an index'''
+        res = self.assertIndexedPlans(RECIPES_URL, {'page_size': 5})
+        self.assertIndexedPlans(res.data['next'])
+
+    def test_recipe_filter_any_plan(self):
+        '''test recipes with any of the tags are found from indexes'''
+        tags = ','.join(str(tag_id) for tag_id in self.tag_ids)
+        res = self.assertIndexedPlans(RECIPES_URL, {'tags': tags})
+        self.assertTrue(res.data['results'])
+
+    def test_recipe_filter_all_plan(self):
+        '''test recipes with all of the tags are found from indexes'''
+        tags = ','.join(str(tag_id) for tag_id in self.tag_ids)
+        res = self.assertIndexedPlans(
+            RECIPES_URL, {'tags': tags, 'match': 'all'}
+        )
+        self.assertTrue(res.data['results'])
+
+    def test_recipe_detail_plan(self):
+        '''test a single recipe is read from an index'''
+        self.assertIndexedPlans(
+            reverse('recipe:recipe-detail', args=[self.recipe_id])
+        )
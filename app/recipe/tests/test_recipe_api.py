@@ -2,7 +2,9 @@ import tempfile
 import os
 from PIL import Image
 from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase, client
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
 from rest_framework import serializers, status
@@ -10,14 +12,12 @@ from rest_framework.test import APIClient
 
 from core.models import Recipe, Tag, Ingredient
 
+from recipe.pagination import KeysetPagination
 from recipe.serializers import RecipeSerializer, RecipeDetailSerializer
+from recipe.tests.utils import image_upload_url
 
 RECIPES_URL = reverse('recipe:recipe-list')
 
-def image_upload_url(recipe_id):
-    '''return Url for recipe image'''
-    return reverse('recipe:recipe-upload-image', args=[recipe_id])
-
 def detail_url(recipe_id):
     '''return recipe detail URL'''
     return reverse('recipe:recipe-detail', args=[recipe_id])
@@ -76,7 +76,7 @@ class PrivateRecipeApiTests(TestCase):
 
         recipes = Recipe.objects.all().order_by('-id')
         serializer = RecipeSerializer(recipes, many=True)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_recipes_limited_to_user(self):
         '''Test retrieving recipes for user'''
@@ -94,8 +94,8 @@ class PrivateRecipeApiTests(TestCase):
     
         # check tht len of data returned is equal 1
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(res.data), 1)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'], serializer.data)
 
     def test_view_recipe_detail(self):
         '''test viewing a recipe detail'''
@@ -109,6 +109,120 @@ class PrivateRecipeApiTests(TestCase):
         serializer = RecipeDetailSerializer(recipe)
         self.assertEqual(res.data, serializer.data)
 
+    def test_list_recipes_query_count_constant(self):
+        '''test listing recipes runs the same queries however many rows'''
+        def add_recipes(count):
+            tag = sample_tag(user=self.user, name=f'Tag {count}')
+            ingredient = sample_ingredient(user=self.user, name=f'Salt {count}')
+            for _ in range(count):
+                recipe = sample_recipe(user=self.user)
+                recipe.tags.add(tag)
+                recipe.ingredients.add(ingredient)
+
+        add_recipes(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(RECIPES_URL)
+
+        add_recipes(10)
+        with CaptureQueriesContext(connection) as many:
+            res = self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(res.data['results']), 12)
+        self.assertEqual(len(few), len(many))
+
+    def test_view_recipe_detail_query_count(self):
+        '''test recipe detail loads tags and ingredients in fixed queries'''
+        recipe = sample_recipe(user=self.user)
+        for name in ('Vegan', 'Dessert', 'Curry'):
+            recipe.tags.add(sample_tag(user=self.user, name=name))
+            recipe.ingredients.add(sample_ingredient(user=self.user, name=name))
+
+        # the recipe row, then one query each for tags and ingredients
+        with self.assertNumQueries(3):
+            res = self.client.get(detail_url(recipe.id))
+
+        self.assertEqual(len(res.data['tags']), 3)
+        self.assertEqual(len(res.data['ingredients']), 3)
+
+    def test_filter_recipes_without_duplicates(self):
+        '''test a recipe matching several filter ids is returned once'''
+        recipe = sample_recipe(user=self.user)
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        ingredient1 = sample_ingredient(user=self.user, name='Salt')
+        ingredient2 = sample_ingredient(user=self.user, name='Flour')
+        recipe.tags.add(tag1, tag2)
+        recipe.ingredients.add(ingredient1, ingredient2)
+
+        res = self.client.get(RECIPES_URL, {
+            'tags': f'{tag1.id},{tag2.id}',
+            'ingredients': f'{ingredient1.id},{ingredient2.id}',
+        })
+
+        self.assertEqual(len(res.data['results']), 1)
+        self.assertEqual(res.data['results'][0]['id'], recipe.id)
+
+    def test_filter_recipes_match_all(self):
+        '''test match=all only returns recipes having every tag'''
+        tag1 = sample_tag(user=self.user, name='Vegan')
+        tag2 = sample_tag(user=self.user, name='Dessert')
+        both = sample_recipe(user=self.user, title='Vegan cake')
+        both.tags.add(tag1, tag2)
+        one = sample_recipe(user=self.user, title='Vegan curry')
+        one.tags.add(tag1)
+
+        params = {'tags': f'{tag1.id},{tag2.id}'}
+        res_any = self.client.get(RECIPES_URL, params)
+        res_all = self.client.get(RECIPES_URL, {**params, 'match': 'all'})
+
+        self.assertEqual(
+            sorted(recipe['id'] for recipe in res_any.data['results']),
+            sorted([both.id, one.id])
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in res_all.data['results']], [both.id]
+        )
+
+    def test_filter_recipes_invalid_match(self):
+        '''test an unknown match mode is rejected'''
+        res = self.client.get(RECIPES_URL, {'tags': '1', 'match': 'some'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_paginate_recipes_with_cursor(self):
+        '''test walking the recipe list page by page with the cursor'''
+        recipes = [sample_recipe(user=self.user) for _ in range(5)]
+
+        res = self.client.get(RECIPES_URL, {'page_size': 2})
+        first = [recipe['id'] for recipe in res.data['results']]
+        # a recipe created mid-walk sorts before the cursor
+        sample_recipe(user=self.user)
+        res = self.client.get(res.data['next'])
+        second = [recipe['id'] for recipe in res.data['results']]
+        res = self.client.get(res.data['next'])
+        third = [recipe['id'] for recipe in res.data['results']]
+
+        expected = [recipe.id for recipe in reversed(recipes)]
+        self.assertEqual(first + second + third, expected)
+        self.assertIsNone(res.data['next'])
+
+    def test_paginate_recipes_invalid_cursor(self):
+        '''test a malformed cursor is rejected'''
+        res = self.client.get(RECIPES_URL, {'cursor': 'not-a-cursor'})
+
+        self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_paginate_recipes_cursor_wrong_types(self):
+        '''test a cursor with values of the wrong type is rejected'''
+        sample_recipe(user=self.user)
+        paginator = KeysetPagination()
+
+        for position in (['x'], [None], [{}], [[1]]):
+            cursor = paginator.encode_cursor(position)
+            res = self.client.get(RECIPES_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
+
     def test_create_basic_recipe(self):
         '''test creating recipe'''
         payload = {
@@ -260,9 +374,9 @@ class RecipeImageUploadTest(TestCase):
         serializer1 = RecipeSerializer(recipe1)
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
     def test_filter_recipe_by_ingredients(self):
         '''test returning recipes with a specific ingredient'''
@@ -283,9 +397,9 @@ class RecipeImageUploadTest(TestCase):
         serializer2 = RecipeSerializer(recipe2)
         serializer3 = RecipeSerializer(recipe3)
 
-        self.assertIn(serializer1.data, res.data)
-        self.assertIn(serializer2.data, res.data)
-        self.assertNotIn(serializer3.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertIn(serializer2.data, res.data['results'])
+        self.assertNotIn(serializer3.data, res.data['results'])
 
 
     
@@ -0,0 +1,127 @@
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.urls import reverse
+
+from rest_framework.test import APIClient
+
+from core.models import Recipe, Tag, Ingredient
+
+from recipe.search import trigram_installed
+
+RECIPES_URL = reverse('recipe:recipe-list')
+
+
+def sample_recipe(user, **params):
+    '''Create and return a sample recipe'''
+    defaults = {
+        'title': 'Sample recipe',
+        'time_minutes': 10,
+        'price': 5.00
+    }
+    defaults.update(params)
+
+    return Recipe.objects.create(user=user, **defaults)
+
+
+class RecipeSearchApiTests(TestCase):
+    '''test searching recipes'''
+
+    def setUp(self):
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'test@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+
+    def _search(self, terms):
+        res = self.client.get(RECIPES_URL, {'search': terms})
+        return [recipe['id'] for recipe in res.data['results']]
+
+    def test_search_by_title(self):
+        '''test recipes are found by words of their title'''
+        curry = sample_recipe(user=self.user, title='Thai prawn red curry')
+        sample_recipe(user=self.user, title='Fish and chips')
+
+        self.assertEqual(self._search('curries'), [curry.id])
+
+    def test_search_by_tag_and_ingredient(self):
+        '''test recipes are found by their tag and ingredient names'''
+        recipe = sample_recipe(user=self.user, title='Weekday dinner')
+        recipe.tags.add(Tag.objects.create(user=self.user, name='Vegan'))
+        recipe.ingredients.add(
+            Ingredient.objects.create(user=self.user, name='Chickpeas')
+        )
+
+        self.assertEqual(self._search('vegan chickpeas'), [recipe.id])
+
+    def test_search_ranks_title_first(self):
+        '''test a title match ranks above a tag match'''
+        tagged = sample_recipe(user=self.user, title='Weekday dinner')
+        tagged.tags.add(Tag.objects.create(user=self.user, name='Curry'))
+        titled = sample_recipe(user=self.user, title='Green curry')
+
+        self.assertEqual(self._search('curry'), [titled.id, tagged.id])
+
+    def test_search_follows_tag_rename(self):
+        '''test renaming a tag updates the recipes it is attached to'''
+        recipe = sample_recipe(user=self.user, title='Weekday dinner')
+        tag = Tag.objects.create(user=self.user, name='Vegan')
+        recipe.tags.add(tag)
+
+        tag.name = 'Vegetarian'
+        tag.save()
+
+        self.assertEqual(self._search('vegan'), [])
+        self.assertEqual(self._search('vegetarian'), [recipe.id])
+
+    def test_search_limited_to_user(self):
+        '''test other users' recipes are never returned'''
+        user2 = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        sample_recipe(user=user2, title='Green curry')
+
+        self.assertEqual(self._search('curry'), [])
+
+    def test_typo_fallback_ignores_other_users(self):
+        '''test another user's full text match does not hide the fallback'''
+        if not trigram_installed():
+            self.skipTest('pg_trgm is not installed')
+        user2 = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        sample_recipe(user=user2, title='choclate browny')
+        recipe = sample_recipe(user=self.user, title='Chocolate brownies')
+
+        self.assertEqual(self._search('choclate browny'), [recipe.id])
+
+    def test_search_paginates_by_rank(self):
+        '''test paging through ranked results repeats and skips nothing'''
+        for index in range(5):
+            sample_recipe(user=self.user, title='curry ' * (index + 1))
+        # as postgres 10 and older print floats by default
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL extra_float_digits = 0')
+
+        seen = []
+        res = self.client.get(RECIPES_URL, {'search': 'curry', 'page_size': 2})
+        while True:
+            seen += [recipe['id'] for recipe in res.data['results']]
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        self.assertEqual(len(seen), 5)
+        self.assertEqual(len(set(seen)), 5)
+
+    def test_search_tolerates_typos(self):
+        '''test a misspelled search falls back to similar titles'''
+        if not trigram_installed():
+            self.skipTest('pg_trgm is not installed')
+        recipe = sample_recipe(user=self.user, title='Chocolate brownies')
+
+        self.assertEqual(self._search('choclate browny'), [recipe.id])
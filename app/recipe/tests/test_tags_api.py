@@ -7,9 +7,11 @@ from rest_framework.test import APIClient
 
 from core.models import Tag, Recipe
 
+from recipe.pagination import KeysetPagination
 from recipe.serializers import TagSerializer
 
 TAG_URL = reverse('recipe:tag-list')
+TAG_BULK_URL = reverse('recipe:tag-bulk')
 
 class PublicTagApiTests(TestCase):
     '''test the public available tag api'''
@@ -46,7 +48,7 @@ class PrivateTagsApiTests(TestCase):
         tags = Tag.objects.all().order_by('-name')
         serializer = TagSerializer(tags, many=True)
         self.assertEqual(res.status_code, status.HTTP_200_OK)
-        self.assertEqual(res.data, serializer.data)
+        self.assertEqual(res.data['results'], serializer.data)
 
 
     # tags assigned to authenticated user
@@ -65,9 +67,39 @@ class PrivateTagsApiTests(TestCase):
         self.assertEqual(res.status_code, status.HTTP_200_OK)
 
         # check the length of returned results
-        self.assertEqual(len(res.data), 1)
+        self.assertEqual(len(res.data['results']), 1)
         # check tht the name of the tag returned is the one we created and assigned to user
-        self.assertEqual(res.data[0]['name'], tag.name)
+        self.assertEqual(res.data['results'][0]['name'], tag.name)
+
+    def test_paginate_tags(self):
+        '''test walking the tags page by page skips and repeats nothing'''
+        tags = [
+            Tag.objects.create(user=self.user, name=name)
+            for name in ('Vegan', 'Lunch', 'lunch box', 'Brunch', 'Dessert')
+        ]
+
+        seen = []
+        res = self.client.get(TAG_URL, {'page_size': 2})
+        while True:
+            seen += [tag['id'] for tag in res.data['results']]
+            if not res.data['next']:
+                break
+            res = self.client.get(res.data['next'])
+
+        expected = Tag.objects.filter(user=self.user).order_by('-name', '-id')
+        self.assertEqual(seen, [tag.id for tag in expected])
+        self.assertEqual(len(seen), len(tags))
+
+    def test_paginate_tags_cursor_wrong_types(self):
+        '''test a cursor with values of the wrong type is rejected'''
+        Tag.objects.create(user=self.user, name='Vegan')
+        paginator = KeysetPagination()
+
+        for position in (['x', 'y'], [None, 1], ['Vegan', {}]):
+            cursor = paginator.encode_cursor(position)
+            res = self.client.get(TAG_URL, {'cursor': cursor})
+
+            self.assertEqual(res.status_code, status.HTTP_404_NOT_FOUND)
 
     def test_create_tag_successful(self):
         '''test creating a new tag'''
@@ -86,6 +118,38 @@ class PrivateTagsApiTests(TestCase):
         res = self.client.post(TAG_URL, payload)
         self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_create_tag_duplicate_name(self):
+        '''test creating a tag whose name exists in another case fails'''
+        Tag.objects.create(user=self.user, name='Vegan')
+
+        res = self.client.post(TAG_URL, {'name': 'vEGAN'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_get_or_create_tags(self):
+        '''test bulk returns existing tags and creates the missing ones'''
+        existing = Tag.objects.create(user=self.user, name='Vegan')
+        user2 = get_user_model().objects.create_user(
+            'other@test.com',
+            'testpass'
+        )
+        Tag.objects.create(user=user2, name='Dessert')
+
+        res = self.client.post(
+            TAG_BULK_URL,
+            {'names': ['vegan', 'Dessert', 'dessert']},
+            format='json'
+        )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(res.data), 2)
+        self.assertEqual(res.data[0]['id'], existing.id)
+        self.assertFalse(res.data[0]['created'])
+        self.assertTrue(res.data[1]['created'])
+        dessert = Tag.objects.get(pk=res.data[1]['id'])
+        self.assertEqual(dessert.user, self.user)
+        self.assertEqual(dessert.name, 'Dessert')
+
     def test_retrieve_tags_assigned_to_recipes(self):
         '''test filtering tags by those assigned to recipes'''
         tag1 = Tag.objects.create(user=self.user, name='Breakfast')
@@ -104,7 +168,63 @@ class PrivateTagsApiTests(TestCase):
         
         serializer1 = TagSerializer(tag1)
         serializer2 = TagSerializer(tag2)
-        self.assertIn(serializer1.data, res.data)
-        self.assertNotIn(serializer2.data, res.data)
+        self.assertIn(serializer1.data, res.data['results'])
+        self.assertNotIn(serializer2.data, res.data['results'])
+
+    def test_retrieve_tags_assigned_unique(self):
+        '''test filtering tags by assigned returns unique items'''
+        tag = Tag.objects.create(user=self.user, name='Breakfast')
+        Tag.objects.create(user=self.user, name='Lunch')
+        for title in ('Pancakes', 'Porridge'):
+            recipe = Recipe.objects.create(
+                title=title, time_minutes=5, price=3.00, user=self.user
+            )
+            recipe.tags.add(tag)
 
+        res = self.client.get(TAG_URL, {'assigned_only': 1})
+
+        self.assertEqual(res.data['results'], [TagSerializer(tag).data])
+
+    def test_retrieve_tags_with_counts(self):
+        '''test tags can be listed with the number of recipes using them'''
+        breakfast = Tag.objects.create(user=self.user, name='Breakfast')
+        lunch = Tag.objects.create(user=self.user, name='Lunch')
+        Tag.objects.create(user=self.user, name='Dinner')
+        for title in ('Pancakes', 'Porridge'):
+            recipe = Recipe.objects.create(
+                title=title, time_minutes=5, price=3.00, user=self.user
+            )
+            recipe.tags.add(breakfast)
+        recipe.tags.add(lunch)
+
+        with self.assertNumQueries(1):
+            res = self.client.get(TAG_URL, {'with_counts': 1})
+
+        counts = {
+            tag['name']: tag['recipe_count'] for tag in res.data['results']
+        }
+        self.assertEqual(counts, {'Breakfast': 2, 'Lunch': 1, 'Dinner': 0})
+
+    def test_retrieve_tags_min_count(self):
+        '''test filtering tags by a minimum number of recipes'''
+        breakfast = Tag.objects.create(user=self.user, name='Breakfast')
+        lunch = Tag.objects.create(user=self.user, name='Lunch')
+        for title in ('Pancakes', 'Porridge'):
+            recipe = Recipe.objects.create(
+                title=title, time_minutes=5, price=3.00, user=self.user
+            )
+            recipe.tags.add(breakfast)
+        recipe.tags.add(lunch)
+
+        res = self.client.get(TAG_URL, {'min_count': 2, 'with_counts': 1})
+
+        self.assertEqual(
+            res.data['results'],
+            [{'id': breakfast.id, 'name': 'Breakfast', 'recipe_count': 2}]
+        )
 
+    def test_retrieve_tags_invalid_min_count(self):
+        '''test a min count that is not a non negative integer fails'''
+        res = self.client.get(TAG_URL, {'min_count': 'many'})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
@@ -0,0 +1,139 @@
+import os
+import tempfile
+from unittest.mock import patch
+
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from core.models import Recipe
+
+from recipe.tests.utils import TempMediaRootMixin, image_upload_url
+from recipe.thumbnails import render_variants, save_variants, \
+    submit_thumbnails, variant_name
+
+
+def detail_url(recipe_id):
+    '''return recipe detail URL'''
+    return reverse('recipe:recipe-detail', args=[recipe_id])
+
+
+def jpeg_bytes(size):
+    '''return the bytes of a jpeg image of the given size'''
+    with tempfile.TemporaryFile() as image_file:
+        Image.new('RGB', size, 'orange').save(image_file, format='JPEG')
+        image_file.seek(0)
+        return image_file.read()
+
+
+@override_settings(
+    RECIPE_THUMBNAIL_WIDTHS=[40, 80, 400],
+    RECIPE_THUMBNAIL_FORMATS=['jpeg'],
+    RECIPE_THUMBNAIL_WORKERS=1,
+)
+class RecipeThumbnailTests(TempMediaRootMixin, TestCase):
+    '''test rendering resized variants of recipe images'''
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.user = get_user_model().objects.create_user(
+            'user@test.com',
+            'testpass'
+        )
+        self.client.force_authenticate(self.user)
+        self.recipe = Recipe.objects.create(
+            user=self.user, title='Toast', time_minutes=5, price=1.00
+        )
+        self.recipe.image.save('toast.jpg', ContentFile(jpeg_bytes((200, 100))))
+
+    def test_render_variants(self):
+        '''test variants are resized without upscaling'''
+        targets = {
+            (width, 'jpeg'): os.path.join(self.media_root, f'{width}.jpg')
+            for width in (40, 400)
+        }
+
+        rendered = render_variants(self.recipe.image.path, targets, 80)
+
+        self.assertEqual(rendered, [(40, 'jpeg'), (400, 'jpeg')])
+        with Image.open(targets[(40, 'jpeg')]) as small:
+            self.assertEqual(small.size, (40, 20))
+        with Image.open(targets[(400, 'jpeg')]) as large:
+            self.assertEqual(large.size, (200, 100))
+
+    def test_submit_renders_in_worker_pool(self):
+        '''test variants are rendered by the worker processes'''
+        name = self.recipe.image.name
+
+        future = submit_thumbnails(self.recipe.pk, name)
+
+        self.assertEqual(
+            future.result(timeout=30),
+            [(40, 'jpeg'), (80, 'jpeg'), (400, 'jpeg')]
+        )
+        for width in (40, 80, 400):
+            path = os.path.join(
+                self.media_root, variant_name(name, width, 'jpeg')
+            )
+            self.assertTrue(os.path.exists(path))
+
+    def test_save_variants(self):
+        '''test rendered variants are recorded on the recipe'''
+        name = self.recipe.image.name
+
+        save_variants(self.recipe.pk, name, [(40, 'jpeg')])
+
+        self.recipe.refresh_from_db()
+        self.assertEqual(
+            self.recipe.image_variants,
+            {'40': {'jpeg': variant_name(name, 40, 'jpeg')}}
+        )
+
+    def test_save_variants_of_replaced_image(self):
+        '''test variants of an image replaced meanwhile are dropped'''
+        old_name = self.recipe.image.name
+        self.recipe.image.save('new.jpg', ContentFile(jpeg_bytes((10, 10))))
+
+        updated = save_variants(self.recipe.pk, old_name, [(40, 'jpeg')])
+
+        self.assertEqual(updated, 0)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.image_variants, {})
+
+    @patch('recipe.views.queue_thumbnails')
+    def test_upload_queues_thumbnails(self, queue_thumbnails):
+        '''test uploading returns at once and queues the thumbnails'''
+        self.recipe.image_variants = {'40': {'jpeg': 'old_40w.jpg'}}
+        self.recipe.save()
+        with tempfile.NamedTemporaryFile(suffix='.jpg') as ntf:
+            ntf.write(jpeg_bytes((20, 20)))
+            ntf.seek(0)
+            res = self.client.post(
+                image_upload_url(self.recipe.id),
+                {'image': ntf},
+                format='multipart'
+            )
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['thumbnails'], {})
+        queue_thumbnails.assert_called_once()
+        self.assertEqual(queue_thumbnails.call_args[0][0].pk, self.recipe.pk)
+
+    def test_detail_exposes_thumbnail_urls(self):
+        '''test the recipe detail lists the urls of ready variants'''
+        name = variant_name(self.recipe.image.name, 40, 'jpeg')
+        self.recipe.image_variants = {'40': {'jpeg': name}}
+        self.recipe.save()
+
+        res = self.client.get(detail_url(self.recipe.id))
+
+        self.assertEqual(
+            res.data['thumbnails'],
+            {'40': {'jpeg': f'http://testserver/media/{name}'}}
+        )
@@ -0,0 +1,22 @@
+import shutil
+import tempfile
+
+from django.test import override_settings
+from django.urls import reverse
+
+
+def image_upload_url(recipe_id):
+    '''return Url for recipe image'''
+    return reverse('recipe:recipe-upload-image', args=[recipe_id])
+
+
+class TempMediaRootMixin:
+    '''store the files of each test in an empty MEDIA_ROOT of its own'''
+
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        media = override_settings(MEDIA_ROOT=self.media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.addCleanup(shutil.rmtree, self.media_root)
@@ -0,0 +1,145 @@
+import logging
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, features
+
+from core.models import Recipe
+from core.storage import recipe_image_storage
+
+logger = logging.getLogger(__name__)
+
+# pillow format name and file extension of each variant encoding
+FORMATS = {
+    'webp': ('WEBP', 'webp'),
+    'jpeg': ('JPEG', 'jpg'),
+}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+def variant_name(image_name, width, fmt):
+    '''return the storage name of one resized variant of an image'''
+    stem = os.path.splitext(image_name)[0]
+    return f'{stem}_{width}w.{FORMATS[fmt][1]}'
+
+
+def available_formats():
+    '''return the configured variant formats pillow can encode'''
+    return [
+        fmt for fmt in settings.RECIPE_THUMBNAIL_FORMATS
+        if fmt in FORMATS and (fmt != 'webp' or features.check('webp'))
+    ]
+
+
+def render_variants(source, targets, quality):
+    '''resize and encode an image file into each target path
+
+    runs in a worker process, so it works on file paths only and never
+    touches django. `targets` maps (width, fmt) to a destination path.
+    '''
+    if not targets:
+        return []
+    with Image.open(source) as image:
+        # jpeg can decode straight to a reduced scale, so a large photo
+        # is never held in memory at full resolution
+        largest = max(width for width, fmt in targets)
+        if largest < image.width:
+            image.draft('RGB', (
+                largest, max(1, image.height * largest // image.width)
+            ))
+        image = image.convert('RGB')
+        for (width, fmt), target in sorted(targets.items()):
+            # variants are named after the content, so a duplicate upload
+            # finds them already rendered
+            if os.path.exists(target):
+                continue
+            # never upscale, a small original is stored at its own size
+            height = max(1, round(image.height * width / image.width))
+            resized = image
+            if width < image.width:
+                resized = image.resize((width, height), Image.LANCZOS)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # unique per process, as duplicate uploads may render the
+            # same variant at the same time
+            partial = f'{target}.{os.getpid()}.part'
+            resized.save(
+                partial, FORMATS[fmt][0], quality=quality, optimize=True
+            )
+            # readers never see a half written variant
+            os.replace(partial, target)
+    return sorted(targets)
+
+
+def save_variants(recipe_id, image_name, variants):
+    '''record the rendered variants if the recipe still has that image'''
+    names = {}
+    for width, fmt in variants:
+        names.setdefault(str(width), {})[fmt] = variant_name(
+            image_name, width, fmt
+        )
+    # the image may have been replaced while the variants were rendered
+    return Recipe.objects.filter(pk=recipe_id, image=image_name).update(
+        image_variants=names, updated_at=timezone.now()
+    )
+
+
+def _get_executor():
+    '''return the process pool, starting a new one after a fork'''
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.RECIPE_THUMBNAIL_WORKERS
+            )
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _variants_done(recipe_id, image_name, submitter, future):
+    '''store the variants of a finished render job'''
+    try:
+        save_variants(recipe_id, image_name, future.result())
+    except Exception:
+        logger.exception('thumbnails failed for recipe %s', recipe_id)
+    finally:
+        # the pool's callback thread is not a request thread, so nothing
+        # else would ever close the connection it opened
+        if threading.get_ident() != submitter:
+            connection.close()
+
+
+def submit_thumbnails(recipe_id, image_name):
+    '''render the variants of an image in the worker pool'''
+    targets = {
+        (width, fmt): recipe_image_storage.path(
+            variant_name(image_name, width, fmt)
+        )
+        for width in settings.RECIPE_THUMBNAIL_WIDTHS
+        for fmt in available_formats()
+    }
+    future = _get_executor().submit(
+        render_variants,
+        recipe_image_storage.path(image_name),
+        targets,
+        settings.RECIPE_THUMBNAIL_QUALITY
+    )
+    submitter = threading.get_ident()
+    future.add_done_callback(
+        lambda done: _variants_done(recipe_id, image_name, submitter, done)
+    )
+    return future
+
+
+def queue_thumbnails(recipe):
+    '''render thumbnails of the recipe image once the upload commits'''
+    image_name = recipe.image.name
+    transaction.on_commit(
+        lambda: submit_thumbnails(recipe.pk, image_name)
+    )
@@ -42,55 +42,119 @@
 #     def perform_create(self, serializer):
 #         '''create a new ingredient'''
 #         serializer.save(user=self.request.user)
+import os
+
+from django.db.models import Prefetch, prefetch_related_objects
 from django.db.models.query import QuerySet
+from django.utils.cache import get_conditional_response
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import viewsets, mixins, status
-from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import NotFound
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
 
+from core.authentication import CachedTokenAuthentication, \
+    SignedTokenAuthentication
 from core.models import Tag,Ingredient, Recipe
+from core.storage import ImageStem, image_stems
 from recipe import serializers
+from recipe.bulk import get_or_create_by_name, save_recipes, \
+    validate_recipes
+from recipe.cache import CachedListMixin
+from recipe.conditional import list_etag, recipe_validators, \
+    set_validators
+from recipe.filters import annotate_usage, filter_recipes, parse_match, \
+    parse_min_count
+from recipe.media import media_response
+from recipe.pagination import KeysetPagination
+from recipe.search import search_recipes
+from recipe.thumbnails import queue_thumbnails
 
 # refactoring code
-class BaseRecipeAttrViewSet(viewsets.GenericViewSet,
+class BaseRecipeAttrViewSet(CachedListMixin,
+                            viewsets.GenericViewSet,
                             mixins.ListModelMixin,
                             mixins.CreateModelMixin):
     '''base viewset for user owned recipe attr'''
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    )
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    # id breaks ties between equal names so the page cursor stays unique
+    ordering = ('-name', '-id')
 
     def get_queryset(self):
         '''return objects for the authenticated user only'''
-        assigned_only = bool(self.request.query_params.get('assigned_only'))
+        params = self.request.query_params
+        min_count = parse_min_count(params.get('min_count'))
+        if params.get('assigned_only'):
+            min_count = max(min_count, 1)
         queryset = self.queryset
-        if assigned_only:
-            # isnull to filter all the is null values from the db
-            queryset = queryset.filter(recipe__isnull=False)
-        return queryset.filter(user=self.request.user).order_by('-name')
+        if min_count or self._with_counts():
+            queryset = annotate_usage(queryset, min_count)
+        return queryset.filter(user=self.request.user).order_by(*self.ordering)
+
+    def _with_counts(self):
+        '''return whether the client asked for recipe counts'''
+        return bool(self.request.query_params.get('with_counts'))
 
     def perform_create(self, serializer):
         '''create a new object'''
         serializer.save(user=self.request.user)
 
+    def get_serializer_class(self):
+        '''return appropriate serializer class'''
+        if self.action == 'bulk':
+            return serializers.NameListSerializer
+        elif self.action == 'list' and self._with_counts():
+            return self.count_serializer_class
+
+        return self.serializer_class
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        '''return the ids for a list of names, creating the missing ones'''
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        results = get_or_create_by_name(
+            self.queryset.model,
+            request.user,
+            serializer.validated_data['names']
+        )
+        return Response([
+            {'id': obj.id, 'name': obj.name, 'created': created}
+            for obj, created in results
+        ], status=status.HTTP_200_OK)
+
 class TagViewSet(BaseRecipeAttrViewSet):
     '''Manage tags in the database'''
     # queryset to return
     queryset = Tag.objects.all()
     serializer_class = serializers.TagSerializer
+    count_serializer_class = serializers.TagCountSerializer
 
 class IngredientViewSet(BaseRecipeAttrViewSet):
     '''manage ingredients in the database'''
     queryset = Ingredient.objects.all()
     serializer_class = serializers.IngredientSerializer
+    count_serializer_class = serializers.IngredientCountSerializer
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(CachedListMixin, viewsets.ModelViewSet):
     '''Manage recipes in the database'''
     serializer_class = serializers.RecipeSerializer
     queryset = Recipe.objects.all()
-    authentication_classes = (TokenAuthentication,)
+    authentication_classes = (
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    )
     permission_classes = (IsAuthenticated,)
+    pagination_class = KeysetPagination
+    ordering = ('-id',)
 
     def _params_to_ints(self, qs):
         '''convert a list of strings to a list of integers'''
@@ -101,17 +165,65 @@ class RecipeViewSet(viewsets.ModelViewSet):
         '''retrieve the recipes for the authenticated user'''
         tags = self.request.query_params.get('tags')
         ingredients = self.request.query_params.get('ingredients')
-        queryset = self.queryset
+        match = parse_match(self.request.query_params.get('match'))
+        queryset = filter_recipes(
+            self.queryset.filter(user=self.request.user),
+            tag_ids=self._params_to_ints(tags) if tags else None,
+            ingredient_ids=(
+                self._params_to_ints(ingredients) if ingredients else None
+            ),
+            match=match,
+        )
+        search = self.request.query_params.get('search')
+        if search:
+            queryset = search_recipes(queryset, search)
+
+        queryset = self._prefetch_for_action(queryset)
+        return queryset.order_by(*self.get_ordering())
+
+    def get_ordering(self):
+        '''order search results by rank, everything else newest first'''
+        if self.request.query_params.get('search'):
+            return ('-rank',) + self.ordering
+        return self.ordering
+
+    def _prefetch_for_action(self, queryset):
+        '''prefetch the related objects the action's serializer reads'''
+        if self.action == 'list':
+            # list only renders primary keys, so skip loading the full rows
+            return queryset.prefetch_related(
+                Prefetch('tags', queryset=Tag.objects.only('id')),
+                Prefetch('ingredients', queryset=Ingredient.objects.only('id')),
+            )
+        return queryset
 
-        if tags:
-            tag_ids = self._params_to_ints(tags)
-            # __ django for filtering on foreign key
-            queryset= queryset.filter(tags__id__in=tag_ids)
-        if ingredients:
-            ingredients_ids = self._params_to_ints(ingredients)
-            queryset = queryset.filter(ingredients__id__in=ingredients_ids)
+    def list(self, request, *args, **kwargs):
+        '''list recipes, answering 304 when the client copy is current'''
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = list_etag(queryset, request)
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
 
-        return queryset.filter(user=self.request.user)
+        response = super().list(request, *args, **kwargs)
+        return set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        '''retrieve a recipe, answering 304 when the client copy is current'''
+        recipe = self.get_object()
+        etag, last_modified = recipe_validators(recipe)
+        not_modified = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if not_modified is not None:
+            return not_modified
+
+        # only load the nested rows once we know they will be serialized
+        prefetch_related_objects([recipe], 'tags', 'ingredients')
+        serializer = self.get_serializer(recipe)
+        return set_validators(
+            Response(serializer.data), etag, last_modified
+        )
 
     def get_serializer_class(self):
         '''return appropriate serializer class'''
@@ -119,6 +231,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return serializers.RecipeDetailSerializer
         elif self.action == 'upload_image':
             return serializers.RecipeImageSerializer
+        elif self.action == 'bulk':
+            return serializers.RecipeBulkItemSerializer
 
         return self.serializer_class
 
@@ -137,7 +251,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
         if serializer.is_valid():
-            serializer.save()
+            # variants of the previous image no longer apply
+            serializer.save(image_variants={})
+            # resizing runs in worker processes, the response only waits
+            # for the original to be stored
+            queue_thumbnails(recipe)
             return Response(
                 serializer.data,
                 status=status.HTTP_200_OK
@@ -146,6 +264,48 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return Response(
             serializer.errors,
             status=status.HTTP_400_BAD_REQUEST
-        ) 
+        )
+
+    @action(methods=['POST'], detail=False, url_path='bulk')
+    def bulk(self, request):
+        '''create or update many recipes in one transaction
+
+        items with an id update that recipe, the others are created. when
+        any item is invalid nothing is written and the errors are returned
+        with the index of each failing item.
+        '''
+        validated, errors = validate_recipes(
+            request.user, request.data, self.get_serializer_context()
+        )
+        if errors:
+            return Response(
+                {'errors': errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ids = save_recipes(request.user, validated)
+        return Response({'ids': ids}, status=status.HTTP_200_OK)
+
+
+class RecipeMediaView(APIView):
+    '''send a recipe image or thumbnail to the owner of the recipe'''
+    authentication_classes = (
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    )
+    permission_classes = (IsAuthenticated,)
 
-    
\ No newline at end of file
+    def get(self, request, name):
+        '''return the file if one of the user's recipes refers to it'''
+        if os.path.normpath(name) != name or name.startswith(('/', '.')):
+            raise NotFound()
+        # the stems cover the image itself and its thumbnail variants
+        owned = Recipe.objects.filter(user=request.user).annotate(
+            image_stem=ImageStem('image')
+        ).filter(image_stem__in=image_stems(name)).exists()
+        if not owned:
+            raise NotFound()
+        try:
+            return media_response(request, name)
+        except FileNotFoundError:
+            raise NotFound()
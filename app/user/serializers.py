@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model, authenticate
 from django.utils.translation import ugettext_lazy as _
-from rest_framework import serializers
+from django.conf import settings
+from rest_framework import exceptions, serializers
+
+from core.authentication import REFRESH_TOKEN_SALT, read_signed_token
 
 class UserSerializer(serializers.ModelSerializer):
     '''serializer for the user object'''
@@ -55,3 +58,30 @@ class AuthTokenSerializer(serializers.Serializer):
         # set user in attrs
         attrs['user'] = user
         return attrs
+
+
+class RefreshTokenSerializer(serializers.Serializer):
+    '''serializer for exchanging a signed refresh token'''
+    refresh = serializers.CharField(trim_whitespace=False)
+
+    def validate(self, attrs):
+        '''check the refresh token and tht the user may still log in'''
+        msg = _('Unable to refresh with provided token')
+        try:
+            payload = read_signed_token(
+                attrs.get('refresh'),
+                REFRESH_TOKEN_SALT,
+                settings.SIGNED_TOKEN_REFRESH_TTL
+            )
+        except exceptions.AuthenticationFailed:
+            raise serializers.ValidationError(msg, code='authentication')
+
+        # the only database check of the signed token scheme
+        user = get_user_model().objects.filter(
+            pk=payload['uid'], is_active=True
+        ).first()
+        if user is None or user.token_version != payload['ver']:
+            raise serializers.ValidationError(msg, code='authentication')
+
+        attrs['user'] = user
+        return attrs
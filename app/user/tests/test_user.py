@@ -1,5 +1,6 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
 from django.urls import reverse
 
 # test client to make request to API
@@ -9,6 +10,8 @@ from rest_framework import status
 TOKEN_USER_URL = reverse('user:token') #reverse to generate token
 CREATE_USER_URL = reverse('user:create') #reverse user:create url variable
 ME_URL = reverse('user:me')
+SIGNED_TOKEN_URL = reverse('user:signed-token')
+REFRESH_TOKEN_URL = reverse('user:refresh-token')
 
 # helper function to perform generic tasks
 def create_user(**params):
@@ -139,4 +142,101 @@ class PrivateUserApiTest(TestCase):
         # verify each value from db is updated
         self.assertEqual(self.user.name, payload['name'])
         self.assertTrue(self.user.check_password(payload['password']))
-        self.assertEqual(res.status_code, status.HTTP_200_OK)
\ No newline at end of file
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+
+
+class SignedTokenApiTests(TestCase):
+    '''test the signed access and refresh tokens'''
+
+    def setUp(self):
+        self.payload = {'email': 'test@test.com', 'password': 'test123'}
+        self.user = create_user(**self.payload, name='name')
+        self.client = APIClient()
+
+    def test_signed_token_authenticates_without_lookup(self):
+        '''test a signed access token is verified without the database'''
+        res = self.client.post(SIGNED_TOKEN_URL, self.payload)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {res.data['access']}")
+
+        # only the profile itself is loaded
+        with self.assertNumQueries(1):
+            res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertEqual(res.data['email'], self.user.email)
+
+    def test_signed_token_invalid_credentials(self):
+        '''test no signed token is issued for a wrong password'''
+        res = self.client.post(
+            SIGNED_TOKEN_URL,
+            {'email': self.payload['email'], 'password': 'wrong'}
+        )
+
+        self.assertNotIn('access', res.data)
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tampered_signed_token_rejected(self):
+        '''test a modified access token is rejected'''
+        res = self.client.post(SIGNED_TOKEN_URL, self.payload)
+        token = res.data['access'] + 'x'
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    @override_settings(SIGNED_TOKEN_ACCESS_TTL=-1)
+    def test_expired_signed_token_rejected(self):
+        '''test an access token past its lifetime is rejected'''
+        res = self.client.post(SIGNED_TOKEN_URL, self.payload)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {res.data['access']}")
+
+        res = self.client.get(ME_URL)
+
+        self.assertEqual(res.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_refresh_token(self):
+        '''test a refresh token returns a new token pair'''
+        tokens = self.client.post(SIGNED_TOKEN_URL, self.payload).data
+
+        res = self.client.post(REFRESH_TOKEN_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.assertIn('access', res.data)
+
+    def test_refresh_token_inactive_user(self):
+        '''test a deactivated user cannot refresh'''
+        tokens = self.client.post(SIGNED_TOKEN_URL, self.payload).data
+        self.user.is_active = False
+        self.user.save()
+
+        res = self.client.post(REFRESH_TOKEN_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_refresh_token_revoked_by_password_change(self):
+        '''test changing the password revokes older refresh tokens'''
+        tokens = self.client.post(SIGNED_TOKEN_URL, self.payload).data
+        self.user.set_password('newpass123')
+        self.user.save()
+
+        res = self.client.post(REFRESH_TOKEN_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(PASSWORD_HASHERS=[
+        'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        'django.contrib.auth.hashers.SHA1PasswordHasher',
+    ])
+    def test_refresh_token_after_hash_upgrade(self):
+        '''test tokens issued while upgrading an old hash still refresh'''
+        get_user_model().objects.filter(pk=self.user.pk).update(
+            password=make_password(self.payload['password'], hasher='sha1')
+        )
+        tokens = self.client.post(SIGNED_TOKEN_URL, self.payload).data
+
+        res = self.client.post(REFRESH_TOKEN_URL, {'refresh': tokens['refresh']})
+
+        self.assertEqual(res.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.password.startswith('pbkdf2_sha256$'))
@@ -6,5 +6,15 @@ app_name = 'user'
 urlpatterns = [
     path('create/', views.CreateUserView.as_view(), name='create'),
     path('token/', views.CreateTokenView.as_view(), name='token'),
+    path(
+        'token/signed/',
+        views.CreateSignedTokenView.as_view(),
+        name='signed-token'
+    ),
+    path(
+        'token/refresh/',
+        views.RefreshSignedTokenView.as_view(),
+        name='refresh-token'
+    ),
     path('me/', views.ManageUserView.as_view(), name='me')
 ]
\ No newline at end of file
@@ -1,7 +1,12 @@
-from rest_framework import generics, authentication, permissions
+from django.contrib.auth import get_user_model
+from rest_framework import generics, permissions
 from rest_framework.authtoken.views import ObtainAuthToken
+from rest_framework.response import Response
 from rest_framework.settings import api_settings
-from user.serializers import UserSerializer, AuthTokenSerializer
+from core.authentication import CachedTokenAuthentication, \
+    SignedTokenAuthentication, make_signed_tokens
+from user.serializers import UserSerializer, AuthTokenSerializer, \
+    RefreshTokenSerializer
 
 class CreateUserView(generics.CreateAPIView):
     '''create a new user in the system'''
@@ -12,19 +17,40 @@ class CreateTokenView(ObtainAuthToken):
     serializer_class = AuthTokenSerializer
     renderer_classes = api_settings.DEFAULT_RENDERER_CLASSES
 
+class CreateSignedTokenView(CreateTokenView):
+    '''Create a short lived signed access token and a refresh token'''
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(
+            data=request.data,
+            context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        return Response(make_signed_tokens(serializer.validated_data['user']))
+
+class RefreshSignedTokenView(CreateSignedTokenView):
+    '''Exchange a refresh token for a new signed token pair'''
+    serializer_class = RefreshTokenSerializer
+
 class ManageUserView(generics.RetrieveUpdateAPIView):
     '''manage the authenticated user'''
     serializer_class = UserSerializer
     # authentication and permission using token authentication and level of permissions
 
-    authentication_classes = (authentication.TokenAuthentication,)
+    authentication_classes = (
+        CachedTokenAuthentication,
+        SignedTokenAuthentication,
+    )
     permission_classes = (permissions.IsAuthenticated,)
 
     # get object function to our API view
 
     def get_object(self):
         '''retrieve and returns authenticated user'''
-        return self.request.user
-
-
-
+        user = self.request.user
+        if user._state.adding:
+            # signed tokens only carry the id, load the stored user
+            return generics.get_object_or_404(
+                get_user_model(), pk=user.pk, is_active=True
+            )
+        return user